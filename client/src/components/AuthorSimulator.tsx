@@ -26,7 +26,11 @@ const AuthorSimulator: React.FC<AuthorSimulatorProps> = ({ metrics, onPremiumFea
 
         setIsLoading(true);
         try {
-            if (!metrics.author_messages || !metrics.author_messages[selectedAuthor]) {
+            // The server loads the author's messages of a stored conversation itself
+            const source = metrics.conversation_id
+                ? { conversation_id: metrics.conversation_id }
+                : { conversation: metrics.author_messages?.[selectedAuthor] };
+            if (!('conversation_id' in source) && !source.conversation) {
                 throw new Error('No messages found for the selected author');
             }
 
@@ -34,7 +38,7 @@ const AuthorSimulator: React.FC<AuthorSimulatorProps> = ({ metrics, onPremiumFea
             const { data } = await apiClient.post(
                 '/simulate-message',
                 {
-                    conversation: metrics.author_messages[selectedAuthor],
+                    ...source,
                     author: selectedAuthor,
                     prompt: prompt,
                     language: 'pt',
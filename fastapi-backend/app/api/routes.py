@@ -1,17 +1,76 @@
-from fastapi import APIRouter, HTTPException, Depends, Security, Query, File, UploadFile
-from pydantic import BaseModel, Field
-from app.services.text_analyzer import calculate_all_metrics
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    HTTPException,
+    Depends,
+    Security,
+    Query,
+    Header,
+    File,
+    UploadFile,
+    Request,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from app.services.analysis_pipeline import (
+    DEFAULT_METRICS,
+    METRIC_CALCULATORS,
+    analysis_cache_key,
+    parse_metric_selection,
+    calculate_selected_metrics,
+    get_conversation_metrics,
+    persist_remaining_metrics,
+)
+from app.services.response_cache import cached_json_response
+from app.services.message_index import MAX_PAGE_SIZE, get_or_build_message_index
+from app.services.time_index import get_or_build_time_index
+from app.services.search_index import build_search_index, get_or_build_search_index
+from app.services.activity_rhythm import RHYTHM_RESOLUTIONS, calculate_activity_rhythm
+from app.services.activity_series import SERIES_RESOLUTIONS, get_or_build_minute_counts
+from app.services.session_index import SESSION_SORT_KEYS, get_or_build_session_index
+from app.services.metric_state import SESSION_GAP_SECONDS
+from app.services.topic_model import (
+    LOCAL_TOPIC_MODEL,
+    get_or_extract_local_themes,
+    load_local_themes,
+)
 from app.services.chatgpt_utils import (
+    THEMES_PROMPT_VERSION,
     simulate_author_message,
+    stream_author_message,
     extract_themes,
     parse_themes_response,
+    sample_seed,
+)
+from app.services.llm_cache import llm_cache_key, load_llm_response, save_llm_response
+from app.services.llm_admission import (
+    PRIORITY_MAP_REDUCE,
+    PRIORITY_SIMULATE,
+    PRIORITY_THEMES,
+    Overloaded,
+    get_admission_controller,
+    llm_single_flight,
 )
+from app.services.style_profile import (
+    build_style_profiles_in_background,
+    get_or_build_style_profiles,
+)
+from app.services.theme_map_reduce import MAP_REDUCE_PROMPT_VERSION, map_reduce_themes
 from app.models.data_formats import (
+    AuthorStyle,
     Message,
+    AnalysisResponse,
+    MessagePage,
+    SearchPage,
+    RangeStats,
+    ActivityRhythm,
+    ActivitySeries,
+    SessionInitiators,
+    SessionPage,
     ConversationThemesResponse,
     SimulatedMessageResponse,
 )
-from typing import List, Union, Optional
+from typing import Callable, List, Tuple, Union, Optional
 import mercadopago
 import os
 from dotenv import load_dotenv
@@ -21,12 +80,20 @@ from app.core.config import get_settings, clear_settings_cache
 from app.utils.cache_manager import CacheManager
 from sqlalchemy.orm import Session
 from app.models.database_models import Suggestion, ParsedConversation
+from app import database
 from app.database import get_db
 from datetime import datetime, timedelta
 from ..auth.security import verify_token, verify_password, create_access_token
 from ..auth.models import Admin
+import asyncio
+import hashlib
 import json
-from app.services.parsing_utils import get_or_create_parsed_conversation, extract_file_content
+import orjson
+from app.services.parsing_utils import (
+    get_or_create_parsed_conversation,
+    extract_file_content,
+    load_stored_messages,
+)
 
 # Load environment variables from .env file in development
 if os.getenv("ENVIRONMENT") != "production":
@@ -40,12 +107,20 @@ class FileRequest(BaseModel):
 
 
 class SimulationRequest(BaseModel):
-    conversation: List[Message]
+    # An analyzed conversation, or the whole conversation inline
+    conversation_id: Optional[str] = None
+    conversation: Optional[List[Message]] = None
     author: str = Field(..., min_length=1)
     prompt: str = Field(..., min_length=1)
     language: str = Field(default="pt")
     model: str = Field(...)
 
+    @model_validator(mode="after")
+    def check_conversation(self) -> "SimulationRequest":
+        if self.conversation_id is None and self.conversation is None:
+            raise ValueError("Either conversation_id or conversation is required")
+        return self
+
 
 class PaymentRequest(BaseModel):
     amount: float = Field(..., gt=0)
@@ -81,6 +156,8 @@ class AdminLogin(BaseModel):
 class ConversationThemesRequest(BaseModel):
     conversation_id: str
     model: str
+    # Ask the LLM again instead of answering from the cache
+    force_refresh: bool = False
 
 
 class AdminRegister(BaseModel):
@@ -103,9 +180,40 @@ def message_to_dict(msg: Message) -> dict:
     return {"date": msg.date.isoformat(), "author": msg.author, "content": msg.content}
 
 
-@router.post("/analyze")
-async def analyze(file: UploadFile = File(...), db: Session = Depends(get_db)):
+METRICS_QUERY_DESCRIPTION = (
+    f"Comma-separated AnalysisResponse sections to compute ({', '.join(METRIC_CALCULATORS)}). "
+    f"Defaults to {', '.join(DEFAULT_METRICS)}."
+)
+
+
+SLIM_QUERY_DESCRIPTION = (
+    "Leave out author_messages, messages can then be fetched page by page from "
+    "/conversations/{conversation_id}/messages."
+)
+
+
+def _parse_metrics_or_400(metrics: Optional[str], slim: bool = False) -> List[str]:
+    try:
+        selected = parse_metric_selection(metrics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if slim:
+        selected = [name for name in selected if name != "author_messages"]
+    return selected
+
+
+@router.post("/analyze", response_model=AnalysisResponse, response_model_exclude_none=True)
+async def analyze(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    metrics: Optional[str] = Query(default=None, description=METRICS_QUERY_DESCRIPTION),
+    slim: bool = Query(default=False, description=SLIM_QUERY_DESCRIPTION),
+    accept_encoding: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+):
     logger.info(f"Analyze endpoint hit with file: {file.filename}")
+    selected_metrics = _parse_metrics_or_400(metrics, slim)
 
     try:
         # Extract and validate file content
@@ -120,7 +228,30 @@ async def analyze(file: UploadFile = File(...), db: Session = Depends(get_db)):
                 content_hash,
             ) = get_or_create_parsed_conversation(file_content, db)
 
-            result = calculate_all_metrics(dates, author_and_messages, conversation, content_hash)
+            # Repeat analyses are served from the stored, already compressed response
+            result = cached_json_response(
+                db,
+                content_hash,
+                analysis_cache_key(selected_metrics),
+                accept_encoding,
+                lambda: calculate_selected_metrics(
+                    dates, author_and_messages, conversation, content_hash, selected_metrics, db
+                ),
+            )
+
+            background_tasks.add_task(build_search_index, content_hash, conversation)
+            background_tasks.add_task(
+                build_style_profiles_in_background, content_hash, conversation
+            )
+            # Compute the sections the client skipped after responding, for later retrieval
+            background_tasks.add_task(
+                persist_remaining_metrics,
+                dates,
+                author_and_messages,
+                conversation,
+                content_hash,
+                selected_metrics,
+            )
             return result
         except (ValueError, IndexError, AttributeError) as e:
             logger.error(f"Error parsing chat content: {str(e)}")
@@ -140,9 +271,394 @@ async def analyze(file: UploadFile = File(...), db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.get(
+    "/conversations/{conversation_id}/analysis",
+    response_model=AnalysisResponse,
+    response_model_exclude_none=True,
+)
+def get_conversation_analysis(
+    conversation_id: str,
+    metrics: Optional[str] = Query(default=None, description=METRICS_QUERY_DESCRIPTION),
+    slim: bool = Query(default=False, description=SLIM_QUERY_DESCRIPTION),
+    accept_encoding: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+):
+    """Retrieve metrics of an already analyzed conversation without uploading it again"""
+    selected_metrics = _parse_metrics_or_400(metrics, slim)
+
+    try:
+        result = cached_json_response(
+            db,
+            conversation_id,
+            analysis_cache_key(selected_metrics),
+            accept_encoding,
+            lambda: get_conversation_metrics(db, conversation_id, selected_metrics),
+        )
+    except Exception as e:
+        logger.error(f"Error retrieving analysis for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    return result
+
+
+def _check_date_range(start: Optional[datetime], end: Optional[datetime]) -> None:
+    """Date ranges are [start, end) in the naive local times of the exported messages"""
+    if any(value is not None and value.tzinfo is not None for value in (start, end)):
+        raise HTTPException(
+            status_code=400, detail="start and end must be local times without a UTC offset"
+        )
+    if start is not None and end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+def get_conversation_messages(
+    conversation_id: str,
+    cursor: int = Query(default=0, ge=0, description="next_cursor of the previous page"),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    author: Optional[str] = Query(default=None),
+    start: Optional[datetime] = Query(default=None, description="Range start, included"),
+    end: Optional[datetime] = Query(default=None, description="Range end, excluded"),
+    db: Session = Depends(get_db),
+):
+    """Page through the messages of an analyzed conversation, optionally filtered"""
+    _check_date_range(start, end)
+    try:
+        index = get_or_build_message_index(db, conversation_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return index.page(cursor, limit, author, start, end)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving messages for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/conversations/{conversation_id}/search", response_model=SearchPage)
+def search_conversation(
+    conversation_id: str,
+    q: str = Query(
+        min_length=1, description='Words that must all appear, "quoted phrases" verbatim'
+    ),
+    author: Optional[str] = Query(default=None),
+    start: Optional[datetime] = Query(default=None, description="Range start, included"),
+    end: Optional[datetime] = Query(default=None, description="Range end, excluded"),
+    cursor: int = Query(default=0, ge=0, description="next_cursor of the previous page"),
+    limit: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Full-text search of an analyzed conversation, with snippets around the matches"""
+    _check_date_range(start, end)
+    try:
+        index = get_or_build_search_index(db, conversation_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        messages = get_or_build_message_index(db, conversation_id)
+        return index.search(messages, q, author, start, end, cursor, limit)
+    except ValueError as e:
+        # Query made of stop words only
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get(
+    "/conversations/{conversation_id}/stats",
+    response_model=RangeStats,
+    response_model_exclude_none=True,
+)
+def get_conversation_range_stats(
+    conversation_id: str,
+    start: Optional[datetime] = Query(default=None, description="Range start, included"),
+    end: Optional[datetime] = Query(default=None, description="Range end, excluded"),
+    db: Session = Depends(get_db),
+):
+    """Message counts, stats and heatmap of any date range of an analyzed conversation"""
+    _check_date_range(start, end)
+
+    try:
+        index = get_or_build_time_index(db, conversation_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return index.range_stats(start, end)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing range stats for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/conversations/{conversation_id}/rhythm", response_model=ActivityRhythm)
+def get_conversation_rhythm(
+    conversation_id: str,
+    tz_offset_minutes: int = Query(
+        default=0, ge=-24 * 60, le=24 * 60, description="Shift applied to the exported times"
+    ),
+    resolution_minutes: int = Query(
+        default=60, description=f"One of {', '.join(map(str, RHYTHM_RESOLUTIONS))}"
+    ),
+    db: Session = Depends(get_db),
+):
+    """Weekday x time of day activity grid of the chat and of each author"""
+    if resolution_minutes not in RHYTHM_RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"resolution_minutes must be one of {', '.join(map(str, RHYTHM_RESOLUTIONS))}",
+        )
+
+    try:
+        index = get_or_build_message_index(db, conversation_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return calculate_activity_rhythm(
+            index.authors,
+            index.message_authors,
+            index.dates,
+            tz_offset_minutes,
+            resolution_minutes,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing activity rhythm for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/conversations/{conversation_id}/activity-series", response_model=ActivitySeries)
+def get_conversation_activity_series(
+    conversation_id: str,
+    resolution_minutes: int = Query(
+        default=24 * 60, description=f"One of {', '.join(map(str, SERIES_RESOLUTIONS))}"
+    ),
+    max_points: int = Query(default=1000, ge=3, le=5000, description="Bins returned at most"),
+    start: Optional[datetime] = Query(default=None, description="Range start, included"),
+    end: Optional[datetime] = Query(default=None, description="Range end, excluded"),
+    per_author: bool = Query(default=True, description="Include the series of every author"),
+    db: Session = Depends(get_db),
+):
+    """Message counts over time at a resolution, downsampled for charts of long histories"""
+    if resolution_minutes not in SERIES_RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"resolution_minutes must be one of {', '.join(map(str, SERIES_RESOLUTIONS))}",
+        )
+    _check_date_range(start, end)
+
+    try:
+        counts = get_or_build_minute_counts(db, conversation_id)
+        if counts is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return counts.series(resolution_minutes, max_points, start, end, per_author)
+    except ValueError as e:
+        # Range too long for the resolution
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing activity series for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+GAP_MINUTES_QUERY = Query(
+    default=SESSION_GAP_SECONDS // 60,
+    ge=1,
+    le=7 * 24 * 60,
+    description="Silence, in minutes, after which a new session starts",
+)
+
+
+def _session_index_or_404(db: Session, conversation_id: str, gap_minutes: int):
+    index = get_or_build_session_index(db, conversation_id, gap_minutes * 60)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return index
+
+
+@router.get("/conversations/{conversation_id}/sessions", response_model=SessionPage)
+def list_conversation_sessions(
+    conversation_id: str,
+    gap_minutes: int = GAP_MINUTES_QUERY,
+    sort: str = Query(default="start", description=f"One of {', '.join(SESSION_SORT_KEYS)}"),
+    descending: bool = Query(default=False),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Sessions (bursts of messages) of an analyzed conversation, sorted and paged"""
+    if sort not in SESSION_SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown session sort: {sort}. Available: {', '.join(SESSION_SORT_KEYS)}",
+        )
+
+    try:
+        return _session_index_or_404(db, conversation_id, gap_minutes).page(
+            sort, descending, offset, limit
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing sessions for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get(
+    "/conversations/{conversation_id}/sessions/initiators", response_model=SessionInitiators
+)
+def get_session_initiators(
+    conversation_id: str,
+    gap_minutes: int = GAP_MINUTES_QUERY,
+    db: Session = Depends(get_db),
+):
+    """How many sessions each participant started and ended"""
+    try:
+        return _session_index_or_404(db, conversation_id, gap_minutes).initiators()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing session initiators for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get(
+    "/conversations/{conversation_id}/sessions/{session_id}/messages",
+    response_model=MessagePage,
+)
+def get_session_messages(
+    conversation_id: str,
+    session_id: int,
+    gap_minutes: int = GAP_MINUTES_QUERY,
+    cursor: int = Query(default=0, ge=0, description="next_cursor of the previous page"),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Page through the messages of one session"""
+    try:
+        sessions = _session_index_or_404(db, conversation_id, gap_minutes)
+        if not 0 <= session_id < len(sessions):
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        messages = get_or_build_message_index(db, conversation_id)
+        return messages.page(
+            max(cursor, int(sessions.starts[session_id])),
+            limit,
+            first=int(sessions.starts[session_id]),
+            last=int(sessions.ends[session_id]),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving session messages for {conversation_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+async def _local_conversation_themes(
+    db: Session, conversation_id: str
+) -> ConversationThemesResponse:
+    """Themes from the in-process topic model instead of the LLM"""
+    themes = load_local_themes(db, conversation_id)
+    if themes is None:
+        # Loading the chat and extracting the themes take seconds on large chats
+        themes = await asyncio.to_thread(get_or_extract_local_themes, db, conversation_id)
+        if themes is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+    logger.info(f"Extracted local themes: {themes}")
+    if not themes:
+        raise HTTPException(status_code=422, detail="No themes extracted from conversation")
+    return ConversationThemesResponse(themes=themes)
+
+
+def _themes_cache_key(request: ConversationThemesRequest) -> str:
+    return llm_cache_key(
+        "themes",
+        request.conversation_id,
+        request.model,
+        THEMES_PROMPT_VERSION,
+        sample_seed(request.conversation_id),
+    )
+
+
+async def _llm_conversation_themes(
+    db: Session, request: ConversationThemesRequest, conversation: List[Message]
+) -> ConversationThemesResponse:
+    """Themes from the LLM, stored in the LLM response cache once parsed"""
+    themes = await extract_themes(
+        conversation, model=request.model, seed=sample_seed(request.conversation_id)
+    )
+    logger.info(f"Extracted themes: {themes}")
+
+    if not themes:
+        logger.warning("No themes extracted from LLM")
+        raise HTTPException(status_code=422, detail="No themes extracted from LLM")
+
+    # Theme Parsing
+    parsed_themes = parse_themes_response(themes)
+    logger.info(f"Parsed themes: {parsed_themes}")
+
+    if not parsed_themes:
+        logger.warning(f"Parsing {themes} resulted in no themes")
+        raise HTTPException(status_code=422, detail="Unable to parse extracted themes")
+
+    save_llm_response(
+        db, _themes_cache_key(request), request.conversation_id, request.model, parsed_themes
+    )
+    return ConversationThemesResponse(themes=parsed_themes)
+
+
+def _load_conversation_or_404(db: Session, conversation_id: str) -> List[Message]:
+    try:
+        parsed_conv = (
+            db.query(ParsedConversation)
+            .filter(ParsedConversation.content_hash == conversation_id)
+            .first()
+        )
+    except Exception as e:
+        logger.error(f"Database connection error: {str(e)}")
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    if not parsed_conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    conversation = [Message.model_validate(msg) for msg in json.loads(parsed_conv.conversation)]
+    logger.info(f"Loaded conversation with {len(conversation)} messages")
+    return conversation
+
+
+def _client_id(http_request: Request) -> str:
+    return http_request.client.host if http_request.client else "unknown"
+
+
+def _overloaded(e: Overloaded) -> HTTPException:
+    logger.warning(f"LLM request refused with {e.status_code}: {e.detail}")
+    return HTTPException(
+        status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def _admitted_llm_themes(
+    client: str, request: ConversationThemesRequest
+) -> ConversationThemesResponse:
+    # The call is shared with the requests joining it and can outlive the request that
+    # started it, so it has its own session rather than that request's
+    db = database.SessionLocal()
+    try:
+        async with get_admission_controller().slot(client, PRIORITY_THEMES):
+            conversation = _load_conversation_or_404(db, request.conversation_id)
+            return await _llm_conversation_themes(db, request, conversation)
+    finally:
+        db.close()
+
+
 @router.post("/conversation-themes", response_model=ConversationThemesResponse)
 async def get_conversation_themes(
-    request: ConversationThemesRequest, db: Session = Depends(get_db)
+    request: ConversationThemesRequest, http_request: Request, db: Session = Depends(get_db)
 ):
     try:
         logger.info(
@@ -151,74 +667,298 @@ async def get_conversation_themes(
                 and model {request.model}"
         )
 
-        try:
-            parsed_conv = (
-                db.query(ParsedConversation)
-                .filter(ParsedConversation.content_hash == request.conversation_id)
-                .first()
-            )
-        except Exception as e:
-            logger.error(f"Database connection error: {str(e)}")
-            raise HTTPException(status_code=503, detail="Database service unavailable")
+        if request.model == LOCAL_TOPIC_MODEL:
+            return await _local_conversation_themes(db, request.conversation_id)
+
+        if not request.force_refresh:
+            cached = load_llm_response(db, _themes_cache_key(request))
+            if cached:
+                logger.info(f"Themes of {request.conversation_id} served from the LLM cache")
+                return ConversationThemesResponse(themes=cached)
+
+        # Identical requests in flight (double clicks, several tabs) share one LLM call.
+        # It is admitted once, counted against the client that started it: joining an
+        # in-flight call takes no slot and is not charged to the joining client.
+        return await llm_single_flight.do(
+            ("themes", request.conversation_id, request.model),
+            lambda: _admitted_llm_themes(_client_id(http_request), request),
+        )
 
-        if not parsed_conv:
-            raise HTTPException(status_code=404, detail="Conversation not found")
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Unexpected error in conversation themes: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
-        conversation = [Message.model_validate(msg) for msg in json.loads(parsed_conv.conversation)]
-        logger.info(f"Loaded conversation with {len(conversation)} messages")
 
-        # Theme Extraction
-        themes = extract_themes(conversation, model=request.model)
-        logger.info(f"Extracted themes: {themes}")
+def _ndjson(event: dict) -> bytes:
+    return orjson.dumps(event) + b"\n"
 
-        if not themes:
-            logger.warning("No themes extracted from LLM")
-            raise HTTPException(status_code=422, detail="No themes extracted from LLM")
 
-        # Theme Parsing
-        parsed_themes = parse_themes_response(themes)
-        logger.info(f"Parsed themes: {parsed_themes}")
+def _sse(event: dict) -> bytes:
+    """A server-sent event named after event["event"], with the whole event as data"""
+    return b"event: " + event["event"].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
 
-        if not parsed_themes:
-            logger.warning(f"Parsing {themes} resulted in no themes")
-            raise HTTPException(status_code=422, detail="Unable to parse extracted themes")
 
-        return ConversationThemesResponse(themes=parsed_themes)
+# Proxies must pass server-sent events on as they come instead of buffering them
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
+
+async def _stream_map_reduce_themes(
+    request: ConversationThemesRequest,
+    conversation: List[Message],
+    session_starts,
+    cache_key: str,
+    client: str,
+    encode: Callable[[dict], bytes] = _ndjson,
+):
+    """Encoded events of map_reduce_themes, the merged themes are cached once complete"""
+    try:
+        # The slot is taken here, so it is only held while the response is being streamed
+        async with get_admission_controller().slot(client, PRIORITY_MAP_REDUCE):
+            async for event in map_reduce_themes(conversation, session_starts, model=request.model):
+                if event["event"] == "themes":
+                    db = database.SessionLocal()
+                    try:
+                        save_llm_response(
+                            db, cache_key, request.conversation_id, request.model, event["themes"]
+                        )
+                    finally:
+                        db.close()
+                yield encode(event)
+    except Overloaded as e:
+        yield encode({"event": "error", "detail": e.detail, "retry_after": e.retry_after})
+    except ValueError as e:
+        logger.warning(f"Map-reduce themes of {request.conversation_id} failed: {str(e)}")
+        yield encode({"event": "error", "detail": str(e)})
+    except Exception as e:
+        logger.error(f"Error in map-reduce themes of {request.conversation_id}: {str(e)}")
+        yield encode({"event": "error", "detail": "Internal server error"})
+
+
+def _load_map_reduce_input(db: Session, conversation_id: str):
+    """The messages of a stored conversation and its session starts, None if not found"""
+    messages = load_stored_messages(db, conversation_id)
+    if messages is None:
+        return None
+    conversation = [Message.model_validate(msg) for msg in messages]
+    return conversation, get_or_build_session_index(db, conversation_id).starts
+
+
+async def _map_reduce_themes_response(
+    request: ConversationThemesRequest,
+    http_request: Request,
+    db: Session,
+    encode: Callable[[dict], bytes],
+    media_type: str,
+    headers: Optional[dict] = None,
+) -> StreamingResponse:
+    if request.model == LOCAL_TOPIC_MODEL:
+        raise HTTPException(
+            status_code=400,
+            detail="The local model already covers the whole conversation",
+        )
+
+    cache_key = llm_cache_key(
+        "themes-map-reduce",
+        request.conversation_id,
+        request.model,
+        MAP_REDUCE_PROMPT_VERSION,
+        0,
+    )
+    cached = None if request.force_refresh else load_llm_response(db, cache_key)
+    if cached:
+        return StreamingResponse(
+            iter([encode({"event": "themes", "themes": cached})]),
+            media_type=media_type,
+            headers=headers,
+        )
+
+    # Refuse now with a status code rather than in the stream when already overloaded
+    client = _client_id(http_request)
+    get_admission_controller().check(client)
+
+    # Loading a long chat and building its session index would stall the event loop
+    loaded = await asyncio.to_thread(_load_map_reduce_input, db, request.conversation_id)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    conversation, session_starts = loaded
+
+    return StreamingResponse(
+        _stream_map_reduce_themes(request, conversation, session_starts, cache_key, client, encode),
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+@router.post("/conversation-themes/map-reduce")
+async def stream_conversation_themes(
+    request: ConversationThemesRequest, http_request: Request, db: Session = Depends(get_db)
+):
+    """
+    Themes of the whole conversation from the LLM, extracted chunk by chunk and merged.
+    Streams newline-delimited JSON events: the number of chunks, the themes of every
+    chunk as it completes, then the merged themes (or an error).
+    """
+    try:
+        return await _map_reduce_themes_response(
+            request, http_request, db, _ndjson, "application/x-ndjson"
+        )
     except HTTPException:
         raise
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
-        logger.error(f"Unexpected error in conversation themes: {str(e)}")
+        logger.error(f"Unexpected error in map-reduce themes: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.post("/simulate-message", response_model=SimulatedMessageResponse)
-async def simulate_message(request: SimulationRequest):
-    logger.info(
-        f"Message simulation endpoint hit using \
-                model {request.model}\
-                prompt {request.prompt}\
-                author {request.author}"
-    )
+@router.post("/conversation-themes/stream")
+async def stream_conversation_themes_events(
+    request: ConversationThemesRequest, http_request: Request, db: Session = Depends(get_db)
+):
+    """
+    The map-reduce themes as server-sent events, for EventSource style clients:
+    "chunks", one "partial" per chunk as it completes, then "themes" (or "error")
+    """
     try:
+        return await _map_reduce_themes_response(
+            request, http_request, db, _sse, "text/event-stream", SSE_HEADERS
+        )
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Unexpected error in streamed themes: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _simulation_source(
+    db: Session, request: SimulationRequest
+) -> Tuple[List[Message], Optional[AuthorStyle]]:
+    """
+    What the simulation is based on: the precomputed style profile of the author for a
+    stored conversation, the inline conversation otherwise
+    """
+    if request.conversation_id is None:
         # Ensure conversation messages are proper Message objects.
         conversation = [
             msg if isinstance(msg, Message) else Message.model_validate(msg)
             for msg in request.conversation
         ]
-        simulated_message = simulate_author_message(
+        return conversation, None
+
+    profiles = get_or_build_style_profiles(db, request.conversation_id)
+    if profiles is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return [], profiles.get(request.author)
+
+
+async def _admitted_simulation(
+    client: str,
+    request: SimulationRequest,
+    conversation: List[Message],
+    style: Optional[AuthorStyle],
+) -> str:
+    async with get_admission_controller().slot(client, PRIORITY_SIMULATE):
+        return await simulate_author_message(
             conversation,
             request.author,
             request.prompt,
             request.language,
             model=request.model,
+            style=style,
+        )
+
+
+@router.post("/simulate-message", response_model=SimulatedMessageResponse)
+async def simulate_message(
+    request: SimulationRequest, http_request: Request, db: Session = Depends(get_db)
+):
+    logger.info(
+        f"Message simulation endpoint hit using \
+                model {request.model}\
+                prompt {request.prompt}\
+                author {request.author}"
+    )
+    try:
+        conversation, style = await asyncio.to_thread(_simulation_source, db, request)
+        # The same simulation requested again while in flight shares its LLM call, admitted
+        # and counted once for the client that started it
+        key = hashlib.sha1(request.model_dump_json().encode()).hexdigest()
+        simulated_message = await llm_single_flight.do(
+            ("simulate", request.model, key),
+            lambda: _admitted_simulation(_client_id(http_request), request, conversation, style),
         )
         return SimulatedMessageResponse(simulated_message=simulated_message)
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error simulating message: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _stream_simulation(
+    request: SimulationRequest,
+    conversation: List[Message],
+    style: Optional[AuthorStyle],
+    client: str,
+):
+    """Server-sent "delta" events of the simulated message as it is generated, then done"""
+    try:
+        async with get_admission_controller().slot(client, PRIORITY_SIMULATE):
+            parts = []
+            async for text in stream_author_message(
+                conversation,
+                request.author,
+                request.prompt,
+                request.language,
+                model=request.model,
+                style=style,
+            ):
+                parts.append(text)
+                yield _sse({"event": "delta", "text": text})
+        yield _sse({"event": "done", "simulated_message": "".join(parts).strip()})
+    except Overloaded as e:
+        yield _sse({"event": "error", "detail": e.detail, "retry_after": e.retry_after})
+    except Exception as e:
+        logger.error(f"Error streaming simulated message: {str(e)}")
+        yield _sse({"event": "error", "detail": "Error generating message"})
+
+
+@router.post("/simulate-message/stream")
+async def stream_simulated_message(
+    request: SimulationRequest, http_request: Request, db: Session = Depends(get_db)
+):
+    """
+    The simulated message as server-sent events: a "delta" with every piece of text
+    as the model writes it, then "done" with the whole message (or "error")
+    """
+    logger.info(f"Streamed message simulation endpoint hit using model {request.model}")
+    try:
+        # Refuse now with a status code rather than in the stream when already overloaded
+        client = _client_id(http_request)
+        get_admission_controller().check(client)
+        conversation, style = await asyncio.to_thread(_simulation_source, db, request)
+        return StreamingResponse(
+            _stream_simulation(request, conversation, style, client),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Error starting streamed message simulation: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @router.post("/create-pix-payment", response_model=PaymentResponse)
 async def create_pix_payment(payment: PaymentRequest):
     try:
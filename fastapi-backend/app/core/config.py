@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Union, List
+from typing import Optional, Union, List
 from functools import lru_cache
 
 
@@ -10,6 +10,30 @@ class Settings(BaseSettings):
     # OpenAI key
     OPENAI_API_KEY: str
 
+    # OpenAI client, shared by every request for the lifetime of the application
+    OPENAI_BASE_URL: Optional[str] = None
+    OPENAI_TIMEOUT_SECONDS: float = 60.0
+    OPENAI_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    OPENAI_MAX_RETRIES: int = 2
+    OPENAI_MAX_CONNECTIONS: int = 50
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+
+    # Cache of LLM responses (themes), stored in the database
+    LLM_CACHE_TTL_HOURS: float = 7 * 24
+    LLM_CACHE_MAX_BYTES: int = 50_000_000
+
+    # Map-reduce theme extraction: LLM calls in flight per request, and the tokens per
+    # minute allowed to all requests of the process
+    LLM_MAP_CONCURRENCY: int = 4
+    LLM_TOKENS_PER_MINUTE: int = 200_000
+
+    # Admission control of the LLM endpoints: requests running at once, waiting at most,
+    # running or waiting per client, and the longest wait before giving up
+    LLM_MAX_CONCURRENT_CALLS: int = 8
+    LLM_MAX_QUEUED_CALLS: int = 32
+    LLM_MAX_PENDING_PER_CLIENT: int = 4
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 30.0
+
     # Security
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipMiddleware
 from app.api.routes import router as api_router
 from app.core.config import get_settings
 from app.middleware.security import SecurityHeadersMiddleware
@@ -9,6 +10,8 @@ from fastapi.staticfiles import StaticFiles
 import os
 from starlette.responses import FileResponse
 from fastapi.exceptions import HTTPException
+from contextlib import asynccontextmanager
+from app.services.openai_client import close_openai_client
 
 # Configure logging before creating the FastAPI app
 configure_logging()
@@ -18,12 +21,28 @@ logger = logging.getLogger(__name__)
 # Get settings
 settings = get_settings()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # The OpenAI client is shared by all requests, release its pooled connections
+    await close_openai_client()
+
+
 # Initialize FastAPI
-app = FastAPI(title=settings.PROJECT_NAME, openapi_url="/openapi.json")
+app = FastAPI(title=settings.PROJECT_NAME, openapi_url="/openapi.json", lifespan=lifespan)
 
 # Add Security Headers Middleware
 app.add_middleware(SecurityHeadersMiddleware)
 
+# Compress the other responses, the analysis endpoints send already compressed bytes.
+# Streamed events are left alone, gzip would hold them back until its buffer fills.
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=1000,
+    exclude_content_types=(*DEFAULT_EXCLUDED_CONTENT_TYPES, "application/x-ndjson"),
+)
+
 # Add CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +54,11 @@ app.add_middleware(
     max_age=3600,
 )
 
+# Register routes without prefix, before the catch-all static route so GET endpoints match
+logger.info("Registering API routes...")
+app.include_router(api_router)
+logger.info("API routes registered successfully")
+
 # Ensure static directory is correctly set
 static_directory = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
 os.makedirs(static_directory, exist_ok=True)
@@ -122,9 +146,3 @@ def test_prints():
     print("Test print 1")
     print("Test print 2")
     return {"message": "Check your console for prints"}
-
-
-# Register routes without prefix
-logger.info("Registering API routes...")
-app.include_router(api_router)
-logger.info("API routes registered successfully")
@@ -1,12 +1,23 @@
 from datetime import datetime
+from enum import IntEnum
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 
 
+class MessageKind(IntEnum):
+    TEXT = 0
+    MEDIA = 1
+    DELETED = 2
+    SYSTEM = 3
+    LINK = 4
+    STICKER = 5
+
+
 class Message(BaseModel):
     date: datetime
     author: str
     content: str
+    kind: MessageKind = MessageKind.TEXT
 
 
 class PeriodStats(BaseModel):
@@ -52,22 +63,176 @@ class WordMetrics(BaseModel):
     curse_words_per_author: Dict[str, int]
     curse_words_by_author: Dict[str, Dict[str, int]]
     curse_words_frequency: Dict[str, int]
+    # Vocabulary richness, estimated with HyperLogLog sketches on very large chats
+    vocabulary_size: Dict[str, int] = {}
+    type_token_ratio: Dict[str, float] = {}
+    hapax_legomena: Dict[str, int] = {}
+    distinct_words_per_month: Dict[str, int] = {}  # keyed by "YYYY-MM"
+
+
+class SliceWords(BaseModel):
+    top_words: Dict[str, int]
+    distinctive_words: Dict[str, float]  # TF-IDF against the other slices
+    vocabulary_size: int
+    word_count: int
+
+
+class WordFrequencies(BaseModel):
+    by_author: Dict[str, SliceWords]
+    by_month: Dict[str, SliceWords]  # keyed by "YYYY-MM"
+
+
+class ReplyPair(BaseModel):
+    from_author: str  # author replied to
+    to_author: str  # author replying
+    count: int
+    median_latency_seconds: float
+    latency_histogram: List[int]  # counts per ReplyGraph.latency_bins bin
+
+
+class ReplyGraph(BaseModel):
+    pairs: List[ReplyPair]  # most frequent first
+    latency_bins: List[int]  # upper bin edges in seconds, plus a last open bin
+    replies_per_author: Dict[str, int]
+    median_reply_latency: Dict[str, float]  # seconds
+
+
+class AuthorRhythm(BaseModel):
+    z: List[List[int]]  # weekday x time slot message counts
+    peak_hour: int  # hour of the day with the most messages
+    night_share: float  # share of messages sent from midnight to 6 AM
+
+
+class ActivityRhythm(BaseModel):
+    tz_offset_minutes: int
+    resolution_minutes: int
+    x: List[str]  # time slot labels, "HH:MM"
+    y: List[str]  # weekday labels, Monday first
+    z: List[List[int]]  # weekday x time slot message counts
+    by_author: Dict[str, AuthorRhythm]  # most active first
+
+
+class ContentStats(BaseModel):
+    kinds_per_author: Dict[str, Dict[str, int]]  # e.g. {"Ana": {"text": 10, "media": 2}}
+    media_per_author: Dict[str, int]  # media and stickers
+    links_per_author: Dict[str, int]  # URLs sent
+    emojis_per_author: Dict[str, int]
+    top_emojis: Dict[str, int]
+    top_emojis_by_author: Dict[str, Dict[str, int]]
+
+
+class AuthorSentiment(BaseModel):
+    weekly: List[Optional[float]]  # mean score of the week's scored messages, None if none
+    mean: float  # mean score of all their scored messages
+    positive_share: float  # share of their scored messages above zero
+    negative_share: float  # share of their scored messages below zero
+
+
+class SentimentTimeSeries(BaseModel):
+    weeks: List[str]  # Monday of each week, "YYYY-MM-DD"
+    weekly: List[Optional[float]]  # whole chat mean score per week
+    by_author: Dict[str, AuthorSentiment]  # most scored messages first
+
+
+class PhraseStats(BaseModel):
+    top_phrases: Dict[str, int]  # recurring phrases of 2 or more words, most frequent first
+    top_phrases_by_author: Dict[str, Dict[str, int]]
+    min_count: int  # phrases seen fewer times are not reported
 
 
 class AnalysisResponse(BaseModel):
-    conversation_stats: ConversationStats
-    word_metrics: WordMetrics
-    heatmap_data: HeatmapData
-    common_words: Dict[str, int]
-    author_messages: Dict[str, List[Message]]
+    # Sections are optional so clients can request a subset of metrics
+    conversation_stats: Optional[ConversationStats] = None
+    word_metrics: Optional[WordMetrics] = None
+    heatmap_data: Optional[HeatmapData] = None
+    common_words: Optional[Dict[str, int]] = None
+    author_messages: Optional[Dict[str, List[Message]]] = None
+    word_frequencies: Optional[WordFrequencies] = None
+    reply_graph: Optional[ReplyGraph] = None
+    activity_rhythm: Optional[ActivityRhythm] = None
+    content_stats: Optional[ContentStats] = None
+    sentiment: Optional[SentimentTimeSeries] = None
+    phrases: Optional[PhraseStats] = None
     conversation_id: Optional[str] = None
 
 
+class MessagePage(BaseModel):
+    messages: List[Message]
+    next_cursor: Optional[int] = None  # pass as cursor to get the next page, None on the last
+    total: int  # messages matching the filters
+
+
+class SearchHit(BaseModel):
+    offset: int  # position of the message in the conversation
+    message: Message
+    snippet: str  # message text around the first match
+
+
+class SearchPage(BaseModel):
+    hits: List[SearchHit]
+    next_cursor: Optional[int] = None  # pass as cursor to get the next page, None on the last
+    total: int  # messages matching the query and filters
+
+
+class RangeStats(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None  # excluded
+    total_messages: int
+    messages_per_author: Dict[str, int]
+    # Left out when no message falls in the range
+    conversation_stats: Optional[ConversationStats] = None
+    heatmap_data: Optional[HeatmapData] = None
+    busiest_days: Dict[str, int] = {}  # "YYYY-MM-DD" -> messages, busiest first
+
+
+class ActivitySeries(BaseModel):
+    resolution_minutes: int
+    total_bins: int  # bins at this resolution in the range, before downsampling
+    timestamps: List[datetime]  # start of each returned bin
+    total: List[int]  # messages in each returned bin
+    by_author: Dict[str, List[int]] = {}  # same bins, most active first
+
+
+class SessionSummary(BaseModel):
+    session_id: int  # position of the session in the conversation
+    start: datetime
+    end: datetime
+    message_count: int
+    duration_seconds: int
+    participants: List[str]
+    started_by: str
+    ended_by: str
+    first_offset: int  # positions of the first and last messages in the conversation
+    last_offset: int
+
+
+class SessionPage(BaseModel):
+    sessions: List[SessionSummary]
+    total: int
+    gap_seconds: int
+
+
+class SessionInitiators(BaseModel):
+    started: Dict[str, int]  # sessions started per author, most first
+    ended: Dict[str, int]
+    total: int
+    gap_seconds: int
+
+
 class ConversationThemesRequest(BaseModel):
     conversation_id: str
     model: str
 
 
+class AuthorStyle(BaseModel):
+    messages: int  # text messages of the author
+    examples: List[str]  # representative messages, in chat order
+    average_length: float  # characters per message
+    emoji_rate: float  # emojis per message
+    top_emojis: List[str]
+    common_phrases: List[str]
+
+
 class SimulationRequest(BaseModel):
     conversation: List[Message]
     author: str
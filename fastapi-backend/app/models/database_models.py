@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer
+from sqlalchemy import Column, String, DateTime, Integer, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 
@@ -33,3 +33,31 @@ class ParsedConversation(Base):
     author_and_messages = Column(String)  # JSON string of messages by author
     conversation = Column(String)  # JSON string of all messages
     timestamp = Column(DateTime, default=datetime.now)
+
+
+class ConversationArtifact(Base):
+    """Derived data (metric sections, indexes, caches) stored next to a parsed conversation"""
+
+    __tablename__ = "conversation_artifacts"
+    __table_args__ = (UniqueConstraint("content_hash", "kind", name="uq_artifact_hash_kind"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String, index=True)
+    kind = Column(String, nullable=False, index=True)  # e.g. "metric:v1:heatmap_data"
+    payload = Column(LargeBinary)
+    timestamp = Column(DateTime, default=datetime.now)
+
+
+class LLMResponse(Base):
+    """Cached LLM answer, keyed by conversation, model, prompt version and sample seed"""
+
+    __tablename__ = "llm_responses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True, nullable=False)
+    content_hash = Column(String, index=True)
+    model = Column(String)
+    payload = Column(String)  # JSON string of the parsed answer
+    size = Column(Integer)  # Bytes of payload, for size-based eviction
+    created_at = Column(DateTime, default=datetime.now)
+    last_used_at = Column(DateTime, default=datetime.now, index=True)
@@ -0,0 +1,74 @@
+from typing import List
+import numpy as np
+from app.models.data_formats import ActivityRhythm, AuthorRhythm
+
+RHYTHM_RESOLUTIONS = (15, 30, 60)  # minutes
+
+WEEKDAY_LABELS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Messages sent from midnight to 6 AM count towards the night share
+NIGHT_END_HOUR = 6
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def calculate_activity_rhythm(
+    authors: List[str],
+    message_authors: np.ndarray,
+    dates: np.ndarray,
+    tz_offset_minutes: int = 0,
+    resolution_minutes: int = 60,
+) -> ActivityRhythm:
+    """
+    Weekday x time of day message counts for the whole chat and for each author, from a
+    single bincount over (author, weekday, time slot) keys.
+
+    Args:
+        authors (list): Author names, indexed by author id
+        message_authors (np.ndarray): Author id of every message
+        dates (np.ndarray): datetime64 date of every message, as exported
+        tz_offset_minutes (int): Shift applied to the exported times, e.g. to show a chat
+            exported in UTC-3 in UTC
+        resolution_minutes (int): Time slot size, one of RHYTHM_RESOLUTIONS
+
+    Returns:
+        ActivityRhythm: 7 x (24 * 60 / resolution_minutes) grids, Monday first
+    """
+    if resolution_minutes not in RHYTHM_RESOLUTIONS:
+        raise ValueError(
+            f"Resolution must be one of {', '.join(map(str, RHYTHM_RESOLUTIONS))} minutes"
+        )
+
+    slots = 24 * 60 // resolution_minutes
+    seconds = dates.astype("datetime64[s]").astype(np.int64) + tz_offset_minutes * 60
+    # 1970-01-01 was a Thursday, weekday 3 counting from Monday
+    weekdays = (seconds // SECONDS_PER_DAY + 3) % 7
+    time_slots = (seconds % SECONDS_PER_DAY) // (resolution_minutes * 60)
+
+    keys = (message_authors.astype(np.int64) * 7 + weekdays) * slots + time_slots
+    grids = np.bincount(keys, minlength=len(authors) * 7 * slots).reshape(len(authors), 7, slots)
+
+    # Per author messages per hour of the day, to find peaks and night owls
+    hourly = grids.sum(axis=1).reshape(len(authors), 24, slots // 24).sum(axis=2)
+    totals = hourly.sum(axis=1)
+    night = hourly[:, :NIGHT_END_HOUR].sum(axis=1)
+
+    return ActivityRhythm(
+        tz_offset_minutes=tz_offset_minutes,
+        resolution_minutes=resolution_minutes,
+        x=[
+            f"{slot * resolution_minutes // 60:02d}:{slot * resolution_minutes % 60:02d}"
+            for slot in range(slots)
+        ],
+        y=WEEKDAY_LABELS,
+        z=grids.sum(axis=0).tolist(),
+        by_author={
+            authors[code]: AuthorRhythm(
+                z=grids[code].tolist(),
+                peak_hour=int(np.argmax(hourly[code])),
+                night_share=round(float(night[code] / totals[code]), 4),
+            )
+            for code in np.argsort(-totals, kind="stable")
+            if totals[code]
+        },
+    )
@@ -0,0 +1,229 @@
+from typing import Dict, List, Optional
+from datetime import datetime
+import io
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.data_formats import ActivitySeries
+from app.services.artifact_store import load_artifact, save_artifact
+from app.services.message_index import to_datetime64
+from app.services.parsing_utils import load_stored_messages
+
+logger = logging.getLogger(__name__)
+
+MINUTE_COUNTS_KIND = "minute_counts:v1"
+
+# Bin sizes, in minutes, the series can be requested at
+SERIES_RESOLUTIONS = (1, 5, 15, 60, 6 * 60, 24 * 60, 7 * 24 * 60)
+
+# Above this many bins in the range the request needs a coarser resolution or a shorter range
+MAX_SERIES_BINS = 500_000
+
+
+def _to_minute(value: datetime) -> int:
+    return int(to_datetime64(value, "m").astype(np.int64))
+
+
+def _binned(minutes: np.ndarray, counts: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Sum of counts of the minutes in each [edges[i], edges[i + 1]) bin"""
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    return np.diff(cumulative[np.searchsorted(minutes, edges)])
+
+
+def lttb(values: np.ndarray, n_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of an evenly spaced series: the first and
+    last points, and in each of n_points - 2 buckets the point forming the largest triangle
+    with the previously selected point and the average of the next bucket.
+
+    Returns:
+        np.ndarray: Sorted indices of the n_points kept, all of them if there are fewer
+    """
+    n = len(values)
+    if n_points >= n or n_points < 3:
+        return np.arange(n)
+
+    values = values.astype(np.float64)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    # Bucket k covers [bounds[k], bounds[k + 1]), first and last points excluded
+    bounds = (np.arange(n_points - 1) * (n - 2) / (n_points - 2)).astype(np.int64) + 1
+    bounds[-1] = n - 1
+
+    selected = np.empty(n_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for k in range(n_points - 2):
+        start, end = bounds[k], bounds[k + 1]
+        next_start, next_end = end, bounds[k + 2] if k + 2 < len(bounds) else n
+        next_x = (next_start + next_end - 1) / 2
+        next_y = (cumulative[next_end] - cumulative[next_start]) / (next_end - next_start)
+
+        x = np.arange(start, end)
+        areas = np.abs(
+            (previous - next_x) * (values[start:end] - values[previous])
+            - (previous - x) * (next_y - values[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[k + 1] = previous
+    return selected
+
+
+class MinuteCounts:
+    """
+    Per minute message counts of a conversation, overall and per author, keeping only the
+    minutes with messages. Counts at any resolution are differences of the cumulative
+    counts at the bin edges, found by binary search, so a series costs the same whatever
+    the number of messages.
+    """
+
+    def __init__(
+        self,
+        minutes: np.ndarray,
+        counts: np.ndarray,
+        authors: List[str],
+        author_offsets: np.ndarray,
+        author_minutes: np.ndarray,
+        author_counts: np.ndarray,
+    ):
+        # Minutes since the epoch with at least one message, sorted, and their counts
+        self.minutes = minutes
+        self.counts = counts
+        self.authors = authors
+        # Minutes and counts of author a are at author_offsets[a]:author_offsets[a + 1]
+        self.author_offsets = author_offsets
+        self.author_minutes = author_minutes
+        self.author_counts = author_counts
+
+    @classmethod
+    def build(cls, messages: List[Dict]) -> "MinuteCounts":
+        """Build from stored message dicts (date as ISO string, author, content)"""
+        authors: Dict[str, int] = {}
+        codes = np.array(
+            [authors.setdefault(msg["author"], len(authors)) for msg in messages], dtype=np.int64
+        )
+        minutes = np.array([msg["date"] for msg in messages], dtype="datetime64[m]").astype(
+            np.int64
+        )
+
+        unique_minutes, counts = np.unique(minutes, return_counts=True)
+        # Distinct (author, minute) keys, sorted by author then minute
+        base = int(minutes.min()) if len(minutes) else 0
+        span = int(minutes.max()) - base + 1 if len(minutes) else 1
+        keys, author_counts = np.unique(codes * span + (minutes - base), return_counts=True)
+        author_offsets = np.zeros(len(authors) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // span, minlength=len(authors)), out=author_offsets[1:])
+
+        return cls(
+            unique_minutes,
+            counts.astype(np.int32),
+            list(authors),
+            author_offsets,
+            keys % span + base,
+            author_counts.astype(np.int32),
+        )
+
+    def series(
+        self,
+        resolution_minutes: int = 60,
+        max_points: int = 1000,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        per_author: bool = True,
+    ) -> ActivitySeries:
+        """
+        Message counts per resolution_minutes bin in [start, end) (the whole conversation
+        by default), LTTB downsampled on the total to at most max_points bins. The per
+        author series are read at the same bins.
+
+        Raises:
+            ValueError: If the resolution is not one of SERIES_RESOLUTIONS or the range
+                spans more than MAX_SERIES_BINS bins
+        """
+        if resolution_minutes not in SERIES_RESOLUTIONS:
+            raise ValueError(
+                f"Resolution must be one of {', '.join(map(str, SERIES_RESOLUTIONS))} minutes"
+            )
+        if len(self.minutes) == 0:
+            return ActivitySeries(
+                resolution_minutes=resolution_minutes, total_bins=0, timestamps=[], total=[]
+            )
+
+        first = self.minutes[0] if start is None else _to_minute(start)
+        last = self.minutes[-1] + 1 if end is None else _to_minute(end)
+        # Bins are aligned to multiples of the resolution, so zooming keeps them stable
+        first_bin = first // resolution_minutes
+        n_bins = max(0, -(-last // resolution_minutes) - first_bin)
+        if n_bins > MAX_SERIES_BINS:
+            raise ValueError(
+                f"The range spans {n_bins} bins of {resolution_minutes} minutes, "
+                f"more than {MAX_SERIES_BINS}: use a coarser resolution or a shorter range"
+            )
+
+        edges = (first_bin + np.arange(n_bins + 1)) * resolution_minutes
+        edges[0], edges[-1] = max(edges[0], first), min(edges[-1], last)
+        total = _binned(self.minutes, self.counts, edges)
+        kept = lttb(total, max_points)
+
+        by_author = {}
+        if per_author:
+            for code in range(len(self.authors)):
+                low, high = self.author_offsets[code], self.author_offsets[code + 1]
+                counts = _binned(self.author_minutes[low:high], self.author_counts[low:high], edges)
+                if counts.any():
+                    by_author[self.authors[code]] = counts
+        ranked = sorted(by_author.items(), key=lambda x: int(x[1].sum()), reverse=True)
+
+        return ActivitySeries(
+            resolution_minutes=resolution_minutes,
+            total_bins=n_bins,
+            timestamps=(((first_bin + kept) * resolution_minutes).astype("datetime64[m]").tolist()),
+            total=total[kept].tolist(),
+            by_author={author: counts[kept].tolist() for author, counts in ranked},
+        )
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            minutes=self.minutes,
+            counts=self.counts,
+            authors=np.array(self.authors, dtype=str),
+            author_offsets=self.author_offsets,
+            author_minutes=self.author_minutes,
+            author_counts=self.author_counts,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "MinuteCounts":
+        arrays = np.load(io.BytesIO(payload))
+        return cls(
+            arrays["minutes"],
+            arrays["counts"],
+            arrays["authors"].tolist(),
+            arrays["author_offsets"],
+            arrays["author_minutes"],
+            arrays["author_counts"],
+        )
+
+
+def get_or_build_minute_counts(db: Session, content_hash: str) -> Optional[MinuteCounts]:
+    """
+    Load the persisted per minute counts of a conversation, building and storing them from
+    the stored conversation if missing.
+
+    Returns:
+        MinuteCounts or None: None if the conversation does not exist
+    """
+    payload = load_artifact(db, content_hash, MINUTE_COUNTS_KIND)
+    if payload is not None:
+        return MinuteCounts.from_bytes(payload)
+
+    messages = load_stored_messages(db, content_hash)
+    if messages is None:
+        return None
+
+    logger.info(f"Building minute counts for {content_hash}")
+    counts = MinuteCounts.build(messages)
+    save_artifact(db, content_hash, MINUTE_COUNTS_KIND, counts.to_bytes())
+    return counts
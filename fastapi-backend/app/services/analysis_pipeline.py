@@ -0,0 +1,270 @@
+from typing import Callable, Dict, List, Optional
+from datetime import datetime
+import json
+import logging
+from sqlalchemy.orm import Session
+from app import database
+from app.models.data_formats import AnalysisResponse, Message
+from app.services.artifact_store import load_artifacts, save_artifact
+from app.services.parsing_utils import load_parsed_conversation
+from app.services.metric_state import (
+    SECTION_AGGREGATES,
+    ConversationAggregate,
+    get_or_build_aggregate,
+)
+from app.services.activity_rhythm import calculate_activity_rhythm
+from app.services.message_index import MessageIndex, get_or_build_message_index
+from app.services.phrase_mining import calculate_phrase_stats
+from app.services.reply_graph import calculate_reply_graph
+from app.services.sentiment import calculate_sentiment, score_messages
+from app.services.term_matrix import (
+    TermMatrix,
+    calculate_word_frequencies,
+    get_or_build_term_matrix,
+)
+from app.services.text_analyzer import EXACT_WORD_COUNT_MAX_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# Bump when an analyzer changes its output so persisted sections are recomputed
+ANALYSIS_VERSION = 4
+
+# Sections returned when the client doesn't select any, the others are opt-in
+DEFAULT_METRICS = [
+    "conversation_stats",
+    "word_metrics",
+    "heatmap_data",
+    "common_words",
+    "author_messages",
+]
+
+
+class AnalysisContext:
+    """Parsed conversation plus its persisted aggregates, shared by the metric calculators"""
+
+    def __init__(
+        self,
+        db: Session,
+        content_hash: str,
+        dates: List[datetime],
+        author_and_messages: Dict,
+        conversation: List[Message],
+    ):
+        self.db = db
+        self.content_hash = content_hash
+        self.dates = dates
+        self.author_and_messages = author_and_messages
+        self.conversation = conversation
+        self._aggregate = ConversationAggregate(parts=[])
+        self._term_matrix = None
+        self._message_index = None
+
+    def word_count_part(self) -> str:
+        """Exact word counts for small chats, a bounded-memory sketch for huge ones"""
+        if len(self.conversation) > EXACT_WORD_COUNT_MAX_MESSAGES:
+            return "word_sketch"
+        return "words"
+
+    def aggregate(self, *parts: str) -> ConversationAggregate:
+        """Aggregates of the conversation, loaded from storage or built once per request"""
+        missing = [name for name in parts if name not in self._aggregate.parts]
+        if missing:
+            loaded = get_or_build_aggregate(
+                self.db, self.content_hash, self.dates, self.conversation, missing
+            )
+            self._aggregate.parts.update(loaded.parts)
+        return self._aggregate
+
+    def term_matrix(self) -> TermMatrix:
+        """Message x term matrix of the conversation, loaded from storage or built once"""
+        if self._term_matrix is None:
+            self._term_matrix = get_or_build_term_matrix(
+                self.db, self.content_hash, self.conversation
+            )
+        return self._term_matrix
+
+    def message_index(self) -> MessageIndex:
+        """Author and date arrays of the conversation, loaded from storage or built once"""
+        if self._message_index is None:
+            self._message_index = get_or_build_message_index(self.db, self.content_hash)
+        return self._message_index
+
+
+# Each section of AnalysisResponse and the calculator that produces it from the context
+METRIC_CALCULATORS: Dict[str, Callable[[AnalysisContext], object]] = {
+    "conversation_stats": lambda ctx: ctx.aggregate("activity", "sessions").conversation_stats(),
+    "word_metrics": lambda ctx: ctx.aggregate(*SECTION_AGGREGATES["word_metrics"]).word_metrics(),
+    "heatmap_data": lambda ctx: ctx.aggregate("heatmap").heatmap_data(),
+    "common_words": lambda ctx: ctx.aggregate(ctx.word_count_part()).common_words(),
+    "author_messages": lambda ctx: ctx.author_and_messages,
+    "word_frequencies": lambda ctx: calculate_word_frequencies(ctx.term_matrix()),
+    "reply_graph": lambda ctx: calculate_reply_graph(
+        ctx.message_index().authors,
+        ctx.message_index().message_authors,
+        ctx.message_index().dates,
+    ),
+    "activity_rhythm": lambda ctx: calculate_activity_rhythm(
+        ctx.message_index().authors,
+        ctx.message_index().message_authors,
+        ctx.message_index().dates,
+    ),
+    "content_stats": lambda ctx: ctx.aggregate("content").content_stats(),
+    "sentiment": lambda ctx: calculate_sentiment(
+        ctx.message_index().authors,
+        ctx.message_index().message_authors,
+        ctx.message_index().dates,
+        score_messages(ctx.conversation),
+    ),
+    "phrases": lambda ctx: calculate_phrase_stats(ctx.conversation),
+}
+
+# author_messages is an echo of the stored conversation, there is nothing to persist
+NON_PERSISTED_METRICS = {"author_messages"}
+
+
+def parse_metric_selection(metrics: Optional[str]) -> List[str]:
+    """
+    Parse a comma-separated metric selection into a list of AnalysisResponse sections.
+
+    Args:
+        metrics (str): Comma-separated section names, None or empty for DEFAULT_METRICS
+
+    Returns:
+        list: Selected section names, in METRIC_CALCULATORS order
+
+    Raises:
+        ValueError: If an unknown section is requested
+    """
+    if not metrics or not metrics.strip():
+        return list(DEFAULT_METRICS)
+
+    requested = {name.strip() for name in metrics.split(",") if name.strip()}
+    unknown = requested - METRIC_CALCULATORS.keys()
+    if unknown:
+        raise ValueError(
+            f"Unknown metrics: {', '.join(sorted(unknown))}. "
+            f"Available: {', '.join(METRIC_CALCULATORS)}"
+        )
+
+    return [name for name in METRIC_CALCULATORS if name in requested]
+
+
+def _metric_kind(name: str) -> str:
+    return f"metric:v{ANALYSIS_VERSION}:{name}"
+
+
+def analysis_cache_key(metrics: List[str]) -> str:
+    """Key of the encoded response of a metric selection, see response_cache"""
+    return f"analysis:v{ANALYSIS_VERSION}:{','.join(sorted(metrics))}"
+
+
+def _serialize_section(response: AnalysisResponse, name: str) -> bytes:
+    return json.dumps(response.model_dump(mode="json", include={name})[name]).encode()
+
+
+def load_persisted_metrics(db: Session, content_hash: str, metrics: List[str]) -> Dict:
+    """
+    Load the persisted sections of a conversation analysis.
+
+    Returns:
+        dict: Raw (JSON decoded) section values by name, only for sections found
+    """
+    names = [name for name in metrics if name not in NON_PERSISTED_METRICS]
+    payloads = load_artifacts(db, content_hash, [_metric_kind(name) for name in names])
+
+    return {
+        name: json.loads(payloads[_metric_kind(name)])
+        for name in names
+        if _metric_kind(name) in payloads
+    }
+
+
+def persist_metrics(db: Session, content_hash: str, response: AnalysisResponse) -> None:
+    """Persist every computed, persistable section of an analysis"""
+    for name in METRIC_CALCULATORS:
+        if name in NON_PERSISTED_METRICS or getattr(response, name) is None:
+            continue
+        save_artifact(db, content_hash, _metric_kind(name), _serialize_section(response, name))
+
+
+def calculate_selected_metrics(
+    dates: List[datetime],
+    author_and_messages: Dict,
+    conversation: List[Message],
+    content_hash: str,
+    metrics: List[str],
+    db: Session,
+) -> AnalysisResponse:
+    """
+    Build an AnalysisResponse containing only the selected sections.
+
+    Sections already persisted for this conversation are loaded instead of recomputed,
+    newly computed sections are persisted for later requests.
+    """
+    sections = load_persisted_metrics(db, content_hash, metrics)
+    missing = [name for name in metrics if name not in sections]
+    logger.info(f"Metrics loaded from storage: {list(sections)}, computing: {missing}")
+
+    context = AnalysisContext(db, content_hash, dates, author_and_messages, conversation)
+    computed = {name: METRIC_CALCULATORS[name](context) for name in missing}
+    response = AnalysisResponse(**sections, **computed, conversation_id=content_hash)
+
+    if any(name not in NON_PERSISTED_METRICS for name in computed):
+        persist_metrics(db, content_hash, AnalysisResponse(**computed))
+
+    return response
+
+
+def get_conversation_metrics(
+    db: Session, content_hash: str, metrics: List[str]
+) -> Optional[AnalysisResponse]:
+    """
+    Retrieve the selected sections of an already parsed conversation.
+
+    The stored conversation is only deserialized when a section is not persisted yet.
+
+    Returns:
+        AnalysisResponse or None: None if the conversation does not exist
+    """
+    sections = load_persisted_metrics(db, content_hash, metrics)
+    if len(sections) == len(metrics):
+        return AnalysisResponse(**sections, conversation_id=content_hash)
+
+    parsed = load_parsed_conversation(db, content_hash)
+    if not parsed:
+        return None
+
+    dates, author_and_messages, conversation, _ = parsed
+    return calculate_selected_metrics(
+        dates, author_and_messages, conversation, content_hash, metrics, db
+    )
+
+
+def persist_remaining_metrics(
+    dates: List[datetime],
+    author_and_messages: Dict,
+    conversation: List[Message],
+    content_hash: str,
+    computed: List[str],
+) -> None:
+    """
+    Background task: compute and persist the default sections the client did not ask for,
+    so they can be retrieved later without parsing the chat again.
+    """
+    remaining = [
+        name
+        for name in DEFAULT_METRICS
+        if name not in computed and name not in NON_PERSISTED_METRICS
+    ]
+    if not remaining:
+        return
+
+    db = database.SessionLocal()
+    try:
+        calculate_selected_metrics(
+            dates, author_and_messages, conversation, content_hash, remaining, db
+        )
+    except Exception as e:
+        logger.error(f"Error persisting remaining metrics for {content_hash}: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,115 @@
+from typing import Any, Dict, Iterable, Optional
+import json
+import logging
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from app.models.database_models import ConversationArtifact
+
+logger = logging.getLogger(__name__)
+
+
+def load_artifact(db: Session, content_hash: str, kind: str) -> Optional[bytes]:
+    """
+    Load a single artifact payload stored for a conversation.
+
+    Args:
+        db (Session): Database session
+        content_hash (str): Hash of the conversation content
+        kind (str): Artifact kind
+
+    Returns:
+        bytes or None: Stored payload, or None if the artifact does not exist
+    """
+    artifact = (
+        db.query(ConversationArtifact)
+        .filter(
+            ConversationArtifact.content_hash == content_hash,
+            ConversationArtifact.kind == kind,
+        )
+        .first()
+    )
+    return artifact.payload if artifact else None
+
+
+def artifact_exists(db: Session, content_hash: str, kind: str) -> bool:
+    """Whether an artifact of a conversation is stored, without loading its payload"""
+    query = db.query(ConversationArtifact.id).filter(
+        ConversationArtifact.content_hash == content_hash,
+        ConversationArtifact.kind == kind,
+    )
+    return db.query(query.exists()).scalar()
+
+
+def load_artifacts(db: Session, content_hash: str, kinds: Iterable[str]) -> Dict[str, bytes]:
+    """
+    Load several artifacts of a conversation with a single query.
+
+    Returns:
+        dict: Payloads by kind, only for the kinds that exist
+    """
+    kinds = list(kinds)
+    if not kinds:
+        return {}
+
+    artifacts = (
+        db.query(ConversationArtifact)
+        .filter(
+            ConversationArtifact.content_hash == content_hash,
+            ConversationArtifact.kind.in_(kinds),
+        )
+        .all()
+    )
+    return {artifact.kind: artifact.payload for artifact in artifacts}
+
+
+def save_artifact(db: Session, content_hash: str, kind: str, payload: bytes) -> None:
+    """
+    Insert or replace an artifact of a conversation.
+
+    Args:
+        db (Session): Database session
+        content_hash (str): Hash of the conversation content
+        kind (str): Artifact kind
+        payload (bytes): Serialized artifact
+    """
+    artifact = (
+        db.query(ConversationArtifact)
+        .filter(
+            ConversationArtifact.content_hash == content_hash,
+            ConversationArtifact.kind == kind,
+        )
+        .first()
+    )
+    if artifact:
+        artifact.payload = payload
+    else:
+        db.add(ConversationArtifact(content_hash=content_hash, kind=kind, payload=payload))
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request stored the same artifact first, keep theirs
+        logger.warning(f"Artifact {kind} for {content_hash} stored concurrently")
+        db.rollback()
+
+
+def load_json_artifact(db: Session, content_hash: str, kind: str) -> Any:
+    """Load an artifact stored with save_json_artifact, or None if it does not exist"""
+    payload = load_artifact(db, content_hash, kind)
+    return json.loads(payload) if payload is not None else None
+
+
+def save_json_artifact(db: Session, content_hash: str, kind: str, value: Any) -> None:
+    """Store a JSON serializable value as an artifact"""
+    save_artifact(db, content_hash, kind, json.dumps(value).encode())
+
+
+def delete_artifacts(db: Session, content_hash: str) -> int:
+    """Delete every artifact of a conversation, returns the number of deleted rows"""
+    count = (
+        db.query(ConversationArtifact)
+        .filter(ConversationArtifact.content_hash == content_hash)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return count
@@ -1,14 +1,37 @@
-from typing import List, Dict, Tuple
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from functools import lru_cache
 from langdetect import detect, LangDetectException
-import openai
+import numpy as np
 import tiktoken
-from app.models.data_formats import Message
+from app.models.data_formats import AuthorStyle, Message
+from app.services.openai_client import get_openai_client
+import asyncio
 import logging
 import random
 import json
+import zlib
 
 logger = logging.getLogger(__name__)
 
+# Context window of each model family in tokens, the longest matching prefix applies
+MODEL_CONTEXT_LIMITS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_LIMIT = 16385
+DEFAULT_ENCODING = "cl100k_base"
+# Tokens left free for the chat message framing
+PROMPT_TOKEN_BUFFER = 100
+
+# Bump when the themes prompt changes, so cached answers are not reused
+THEMES_PROMPT_VERSION = 1
+
+# Messages of an author quoted in the simulation prompt as examples of their style
+STYLE_EXAMPLES = 5
+
 
 def detect_language(conversation: List[Message]) -> str:
     """
@@ -24,7 +47,12 @@ def detect_language(conversation: List[Message]) -> str:
         return "en"
 
 
-def create_prompt(conversation: List[Message], language: str, max_output_tokens: int) -> dict:
+def create_prompt(
+    conversation: List[Message],
+    language: str,
+    max_output_tokens: int,
+    model: str = "gpt-3.5-turbo",
+) -> dict:
     """
     Create the system and user messages for ChatGPT based on the conversation and detected language.
     Returns a dictionary with the structured format specification and conversation.
@@ -67,6 +95,7 @@ def create_prompt(conversation: List[Message], language: str, max_output_tokens:
         messages_text,
         system_prompts.get(language, system_prompts["en"]),
         max_output_tokens,
+        model,
     )
 
     return {
@@ -76,32 +105,73 @@ def create_prompt(conversation: List[Message], language: str, max_output_tokens:
     }
 
 
-def count_tokens(text: str) -> int:
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo") -> tiktoken.Encoding:
+    """Tokenizer of a model, loaded once per process"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def context_limit(model: str) -> int:
+    """Context window of a model in tokens, from its longest matching name prefix"""
+    prefixes = [prefix for prefix in MODEL_CONTEXT_LIMITS if model.startswith(prefix)]
+    if not prefixes:
+        return DEFAULT_CONTEXT_LIMIT
+    return MODEL_CONTEXT_LIMITS[max(prefixes, key=len)]
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     """
-    Count the number of tokens in a text using GPT-3.5's tokenizer
+    Count the number of tokens in a text using the model's tokenizer
     """
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    return len(encoding.encode(text))
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """The start of text that fits in max_tokens tokens"""
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def count_message_tokens(messages: List[str], model: str = "gpt-3.5-turbo") -> np.ndarray:
+    """Token count of every message, encoded in one batch"""
+    encoded = get_encoding(model).encode_batch(messages, disallowed_special=())
+    return np.fromiter((len(tokens) for tokens in encoded), dtype=np.int64, count=len(messages))
+
+
+def messages_within_budget(token_counts: np.ndarray, budget: int) -> int:
+    """
+    Number of leading messages that fit in budget tokens once joined with newlines,
+    found by binary search over the cumulative token counts
+    """
+    # Each message also pays one token for the newline that follows it
+    totals = np.cumsum(np.asarray(token_counts, dtype=np.int64) + 1)
+    return int(np.searchsorted(totals, budget, side="right"))
 
 
 def format_conversation_within_token_limit(
-    messages: List[str], system_prompt: str, max_output_tokens: int
+    messages: List[str],
+    system_prompt: str,
+    max_output_tokens: int,
+    model: str = "gpt-3.5-turbo",
 ) -> str:
-    """Helper function to format conversation text within token limits"""
-    max_tokens = 16385  # GPT-3.5-turbo token limit
-    base_tokens = count_tokens(system_prompt)
-    max_conversation_tokens = (
-        max_tokens - base_tokens - max_output_tokens - 100
-    )  # Leave some buffer
-
-    conversation_text = "\n".join(messages)
-    while (
-        count_tokens(conversation_text) > (max_conversation_tokens - max_output_tokens) and messages
-    ):
-        messages = messages[:-100]
-        conversation_text = "\n".join(messages)
+    """Helper function to format conversation text within the model's token limit"""
+    budget = (
+        context_limit(model)
+        - count_tokens(system_prompt, model)
+        - max_output_tokens
+        - PROMPT_TOKEN_BUFFER
+    )
+    if budget <= 0 or not messages:
+        return ""
 
-    return conversation_text
+    kept = messages_within_budget(count_message_tokens(messages, model), budget)
+    return "\n".join(messages[:kept])
 
 
 def parse_themes_response(response_json: dict) -> Dict[str, str]:
@@ -147,9 +217,12 @@ def parse_themes_response(response_json: dict) -> Dict[str, str]:
     return themes_with_examples
 
 
-def extract_themes(conversation: List[Message], model: str = "gpt-3.5-turbo") -> Dict[str, str]:
+async def extract_themes(
+    conversation: List[Message], model: str = "gpt-3.5-turbo", seed: Optional[int] = None
+) -> Dict[str, str]:
     """
-    Extract main themes from a conversation using specified OpenAI model with structured output
+    Extract main themes from a conversation using specified OpenAI model with structured output.
+    The same seed samples the same messages.
     """
     MAX_OUTPUT_TOKENS = 1000
 
@@ -159,15 +232,18 @@ def extract_themes(conversation: List[Message], model: str = "gpt-3.5-turbo") ->
 
     logger.info(f"Extracting themes from conversation with {len(conversation)} messages")
 
-    sampled_messages = sample_conversation(conversation)
+    sampled_messages = sample_conversation(conversation, seed=seed)
     logger.info(f"Created {len(sampled_messages)} message samples for theme analysis")
 
     try:
-        client = openai.OpenAI()
-        language = detect_language(sampled_messages)
-        prompt_data = create_prompt(sampled_messages, language, MAX_OUTPUT_TOKENS)
+        client = get_openai_client()
+        # Language detection and token counting are CPU bound, keep them off the event loop
+        language = await asyncio.to_thread(detect_language, sampled_messages)
+        prompt_data = await asyncio.to_thread(
+            create_prompt, sampled_messages, language, MAX_OUTPUT_TOKENS, model
+        )
 
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": prompt_data["system_message"]},
@@ -188,8 +264,16 @@ def extract_themes(conversation: List[Message], model: str = "gpt-3.5-turbo") ->
         return {}
 
 
+def sample_seed(content_hash: str) -> int:
+    """Sample seed of a conversation, stable across processes"""
+    return zlib.crc32(content_hash.encode())
+
+
 def sample_conversation(
-    conversation: List[Message], sample_size: int = 50, num_samples: int = 20
+    conversation: List[Message],
+    sample_size: int = 50,
+    num_samples: int = 20,
+    seed: Optional[int] = None,
 ) -> List[Message]:
     """
     Sample the conversation into smaller chunks for analysis.
@@ -199,6 +283,7 @@ def sample_conversation(
         conversation: Full list of messages
         sample_size: Size of each consecutive message chunk
         num_samples: Number of chunks to sample
+        seed: Seed of the chunk selection, random if None
     """
     if len(conversation) <= sample_size * num_samples:
         return conversation
@@ -206,7 +291,9 @@ def sample_conversation(
     samples = []
     # Create samples of consecutive messages
     valid_start_indices = range(len(conversation) - sample_size)
-    selected_starts = random.sample(valid_start_indices, min(num_samples, len(valid_start_indices)))
+    selected_starts = random.Random(seed).sample(
+        valid_start_indices, min(num_samples, len(valid_start_indices))
+    )
 
     for start_idx in selected_starts:
         samples.extend(conversation[start_idx : start_idx + sample_size])
@@ -232,24 +319,58 @@ def extract_examples_from_themes(theme: str, language: str) -> Tuple[str, str]:
         return parts[0].strip(), ""  # Return theme without example
 
 
-def simulate_author_message(
+def style_summary(style: AuthorStyle, language: str = "pt") -> str:
+    """One line of the style statistics of an author, for the simulation prompt"""
+    if language == "pt":
+        parts = [
+            f"em média {style.average_length:.0f} caracteres "
+            f"e {style.emoji_rate:.1f} emojis por mensagem"
+        ]
+        if style.top_emojis:
+            parts.append(f"emojis mais usados: {' '.join(style.top_emojis)}")
+        if style.common_phrases:
+            parts.append(f"expressões frequentes: {', '.join(style.common_phrases)}")
+        return "Estilo: " + "; ".join(parts) + "."
+
+    parts = [
+        f"on average {style.average_length:.0f} characters "
+        f"and {style.emoji_rate:.1f} emojis per message"
+    ]
+    if style.top_emojis:
+        parts.append(f"most used emojis: {' '.join(style.top_emojis)}")
+    if style.common_phrases:
+        parts.append(f"frequent expressions: {', '.join(style.common_phrases)}")
+    return "Style: " + "; ".join(parts) + "."
+
+
+def simulation_messages(
     conversation: List[Message],
     author: str,
     prompt: str,
     language: str = "pt",
-    model: str = "gpt-3.5-turbo",
-) -> str:
+    style: Optional[AuthorStyle] = None,
+) -> Optional[List[dict]]:
     """
-    Simulate a message from a specific author using specified OpenAI model
+    Chat messages asking the model to answer prompt in the style of author. With the
+    precomputed style profile of the author, the conversation is not scanned and its
+    examples and statistics are quoted instead of the first messages of the author.
+
+    Returns:
+        list: The system and user messages, None if the author has no messages
     """
-    # Get messages from the specific author to analyze their style
-    author_messages = [msg for msg in conversation if msg.author == author]
+    if style is not None:
+        examples = style.examples
+    else:
+        # Get messages from the specific author to analyze their style
+        examples = [msg.content for msg in conversation if msg.author == author][:STYLE_EXAMPLES]
 
-    if not author_messages:
-        return "Author not found in conversation"
+    if not examples:
+        return None
 
     # Create a prompt that includes author's style examples and the user's prompt
-    style_examples = "\n".join([f"{msg.content}" for msg in author_messages[:5]])
+    style_examples = "\n".join(examples)
+    if style is not None:
+        style_examples += "\n\n" + style_summary(style, language)
 
     system_prompts = {
         "pt": (
@@ -278,22 +399,69 @@ def simulate_author_message(
         ),
     }
 
+    return [
+        {"role": "system", "content": system_prompts.get(language, system_prompts["en"])},
+        {"role": "user", "content": prompt},
+    ]
+
+
+async def simulate_author_message(
+    conversation: List[Message],
+    author: str,
+    prompt: str,
+    language: str = "pt",
+    model: str = "gpt-3.5-turbo",
+    style: Optional[AuthorStyle] = None,
+) -> str:
+    """
+    Simulate a message from a specific author using specified OpenAI model, from the
+    style profile of the author when given
+    """
+    messages = simulation_messages(conversation, author, prompt, language, style)
+    if messages is None:
+        return "Author not found in conversation"
+
     try:
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
+        client = get_openai_client()
+        response = await client.chat.completions.create(
             model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompts.get(language, system_prompts["en"]),
-                },
-                {"role": "user", "content": prompt},
-            ],
+            messages=messages,
             temperature=0.9,
             max_tokens=150,
         )
 
         return response.choices[0].message.content.strip()
     except Exception as e:
-        print(f"Error simulating message: {str(e)}")
+        logger.error(f"Error simulating message: {str(e)}")
         return "Error generating message"
+
+
+async def stream_author_message(
+    conversation: List[Message],
+    author: str,
+    prompt: str,
+    language: str = "pt",
+    model: str = "gpt-3.5-turbo",
+    style: Optional[AuthorStyle] = None,
+) -> AsyncIterator[str]:
+    """
+    Simulate a message like simulate_author_message, yielding the text as the model
+    writes it. Errors of the LLM call are raised, as part of the text may be out already.
+    """
+    messages = simulation_messages(conversation, author, prompt, language, style)
+    if messages is None:
+        yield "Author not found in conversation"
+        return
+
+    stream = await get_openai_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.9,
+        max_tokens=150,
+        stream=True,
+    )
+    # Closing the stream when the caller stops early ends the generation upstream
+    async with stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
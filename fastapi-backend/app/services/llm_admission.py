@@ -0,0 +1,172 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Queue priorities of the LLM endpoints, lower first: short interactive calls go
+# before the long theme extractions
+PRIORITY_SIMULATE = 0
+PRIORITY_THEMES = 1
+PRIORITY_MAP_REDUCE = 2
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls: while a call for a key is in flight, the other callers
+    with the same key await its result (or exception) instead of starting their own.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            logger.info(f"Joining in-flight LLM call {key}")
+        # A caller going away must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+
+class Overloaded(Exception):
+    """A request refused by admission control, to retry after retry_after seconds"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds the LLM calls running at once. Past max_concurrent, requests wait in a
+    priority queue of at most max_queued entries (lower priority first, then arrival
+    order) for up to queue_timeout seconds. Load is shed with 503 when the queue is
+    full or the wait times out, and with 429 when one client already has
+    max_per_client requests running or queued.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queued: int,
+        max_per_client: int,
+        queue_timeout: float,
+        initial_call_seconds: float = 10.0,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_per_client = max_per_client
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        # Heap of [priority, arrival, future], a done future is a waiter that left
+        self._queue: List[list] = []
+        self._arrivals = itertools.count()
+        self._per_client: Dict[str, int] = {}
+        # Moving average of the time a slot is held, for Retry-After
+        self._call_seconds = initial_call_seconds
+
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: the queue ahead drained at the average pace"""
+        slots = max(self.max_concurrent, 1)
+        return max(1, math.ceil(self._call_seconds * (self.queued() + 1) / slots))
+
+    def check(self, client: str) -> None:
+        """
+        Raises:
+            Overloaded: If a request of client would be refused right now
+        """
+        if self._per_client.get(client, 0) >= self.max_per_client:
+            raise Overloaded(429, "Too many LLM requests in progress", self.retry_after())
+        if self.running >= self.max_concurrent and self.queued() >= self.max_queued:
+            raise Overloaded(503, "LLM service busy, try again later", self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, client: str, priority: int = 0) -> AsyncIterator[None]:
+        """
+        Hold one of the max_concurrent slots, waiting in the queue if needed.
+
+        Raises:
+            Overloaded: If the request is refused or waited longer than queue_timeout
+        """
+        self.check(client)
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        try:
+            await self._acquire(priority)
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._call_seconds = 0.8 * self._call_seconds + 0.2 * (time.monotonic() - started)
+                self._release()
+        finally:
+            self._per_client[client] -= 1
+            if not self._per_client[client]:
+                del self._per_client[client]
+
+    async def _acquire(self, priority: int) -> None:
+        if self.running < self.max_concurrent and not self.queued():
+            self.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._arrivals), future])
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                raise Overloaded(503, "LLM service busy, try again later", self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over as the waiter left, pass it on
+                self._release()
+            future.cancel()
+            raise
+
+    def _release(self) -> None:
+        # Hand the slot to the first waiter still there, or free it
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+
+_admission: Optional[AdmissionController] = None
+
+llm_single_flight = SingleFlight()
+
+
+def get_admission_controller() -> AdmissionController:
+    """The process-wide admission controller of the LLM endpoints, from the settings"""
+    global _admission
+    if _admission is None:
+        settings = get_settings()
+        _admission = AdmissionController(
+            settings.LLM_MAX_CONCURRENT_CALLS,
+            settings.LLM_MAX_QUEUED_CALLS,
+            settings.LLM_MAX_PENDING_PER_CLIENT,
+            settings.LLM_QUEUE_TIMEOUT_SECONDS,
+        )
+    return _admission
@@ -0,0 +1,116 @@
+from typing import Any, Optional
+from datetime import datetime, timedelta
+import json
+import logging
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from app.core.config import get_settings
+from app.models.database_models import LLMResponse
+
+logger = logging.getLogger(__name__)
+
+
+def llm_cache_key(
+    task: str, content_hash: str, model: str, prompt_version: int, sample_seed: int
+) -> str:
+    """Identifies an LLM answer: same conversation, model, prompt and sample give the same key"""
+    return f"{task}:{content_hash}:{model}:p{prompt_version}:s{sample_seed}"
+
+
+def _ttl() -> timedelta:
+    return timedelta(hours=get_settings().LLM_CACHE_TTL_HOURS)
+
+
+def load_llm_response(db: Session, cache_key: str) -> Any:
+    """
+    Load a cached LLM answer and mark it as recently used.
+
+    Returns:
+        The stored JSON value, or None if missing or older than the TTL
+    """
+    entry = db.query(LLMResponse).filter(LLMResponse.cache_key == cache_key).first()
+    if entry is None:
+        return None
+
+    now = datetime.now()
+    if entry.created_at < now - _ttl():
+        logger.info(f"LLM response {cache_key} expired")
+        db.delete(entry)
+        db.commit()
+        return None
+
+    entry.last_used_at = now
+    db.commit()
+    return json.loads(entry.payload)
+
+
+def save_llm_response(
+    db: Session, cache_key: str, content_hash: str, model: str, value: Any
+) -> None:
+    """Insert or replace a cached LLM answer, then evict to stay within the size limit"""
+    payload = json.dumps(value)
+    now = datetime.now()
+    entry = db.query(LLMResponse).filter(LLMResponse.cache_key == cache_key).first()
+    if entry is None:
+        entry = LLMResponse(cache_key=cache_key, content_hash=content_hash, model=model)
+        db.add(entry)
+    entry.payload = payload
+    entry.size = len(payload.encode())
+    entry.created_at = now
+    entry.last_used_at = now
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request stored the same answer first, keep theirs
+        logger.warning(f"LLM response {cache_key} stored concurrently")
+        db.rollback()
+        return
+    evict_llm_responses(db)
+
+
+def evict_llm_responses(db: Session, max_bytes: Optional[int] = None) -> int:
+    """
+    Delete the expired LLM answers, then the least recently used ones until the total
+    payload size is within max_bytes (LLM_CACHE_MAX_BYTES by default).
+
+    Returns:
+        int: Number of deleted answers
+    """
+    if max_bytes is None:
+        max_bytes = get_settings().LLM_CACHE_MAX_BYTES
+
+    deleted = (
+        db.query(LLMResponse)
+        .filter(LLMResponse.created_at < datetime.now() - _ttl())
+        .delete(synchronize_session=False)
+    )
+
+    # Most recently used first, everything past the size limit goes
+    total, evicted = 0, []
+    rows = db.query(LLMResponse.id, LLMResponse.size).order_by(LLMResponse.last_used_at.desc())
+    for entry_id, size in rows:
+        total += size or 0
+        if total > max_bytes:
+            evicted.append(entry_id)
+    if evicted:
+        deleted += (
+            db.query(LLMResponse)
+            .filter(LLMResponse.id.in_(evicted))
+            .delete(synchronize_session=False)
+        )
+    db.commit()
+    if deleted:
+        logger.info(f"Evicted {deleted} cached LLM responses")
+    return deleted
+
+
+def delete_llm_responses(db: Session, content_hash: str) -> int:
+    """Delete every cached LLM answer of a conversation, returns the number of deleted rows"""
+    count = (
+        db.query(LLMResponse)
+        .filter(LLMResponse.content_hash == content_hash)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return count
@@ -0,0 +1,83 @@
+from typing import List, Tuple
+import re
+from app.models.data_formats import MessageKind
+
+# Whole message placeholders of the Android and iOS exports, in Portuguese and English,
+# lowercased and without the surrounding "<>" and invisible left-to-right marks
+PLACEHOLDER_KINDS = {
+    "mídia oculta": MessageKind.MEDIA,
+    "media omitted": MessageKind.MEDIA,
+    "imagem ocultada": MessageKind.MEDIA,
+    "vídeo omitido": MessageKind.MEDIA,
+    "áudio ocultado": MessageKind.MEDIA,
+    "gif omitido": MessageKind.MEDIA,
+    "documento omitido": MessageKind.MEDIA,
+    "image omitted": MessageKind.MEDIA,
+    "video omitted": MessageKind.MEDIA,
+    "audio omitted": MessageKind.MEDIA,
+    "gif omitted": MessageKind.MEDIA,
+    "document omitted": MessageKind.MEDIA,
+    "figurinha omitida": MessageKind.STICKER,
+    "sticker omitted": MessageKind.STICKER,
+    "mensagem apagada": MessageKind.DELETED,
+    "esta mensagem foi apagada": MessageKind.DELETED,
+    "você apagou esta mensagem": MessageKind.DELETED,
+    "this message was deleted": MessageKind.DELETED,
+    "you deleted this message": MessageKind.DELETED,
+}
+
+# Kinds whose content is written text, the others are skipped by the word analyzers
+TEXT_KINDS = frozenset({MessageKind.TEXT, MessageKind.LINK})
+
+_URL = r"(?:https?://|www\.)[^\s<>\"]+"
+
+_EMOJI_CHAR = (
+    "["
+    "\U0001f1e6-\U0001f1ff"  # regional indicators (flags)
+    "\U0001f300-\U0001f5ff"  # symbols and pictographs
+    "\U0001f600-\U0001f64f"  # emoticons
+    "\U0001f680-\U0001f6ff"  # transport and map
+    "\U0001f900-\U0001f9ff"  # supplemental symbols and pictographs
+    "\U0001fa70-\U0001faff"  # symbols and pictographs extended-A
+    "\u2600-\u27bf"  # miscellaneous symbols and dingbats
+    "\u2b50\u2b55"
+    "]"
+)
+# A base emoji, optional skin tone or presentation selector, and zero width joined parts
+_EMOJI = (
+    f"{_EMOJI_CHAR}[\U0001f3fb-\U0001f3ff\ufe0f]?"
+    f"(?:\u200d{_EMOJI_CHAR}[\U0001f3fb-\U0001f3ff\ufe0f]?)*"
+)
+
+# Single pass scanner of the emojis and URLs of a message
+SCANNER = re.compile(f"(?P<url>{_URL})|(?P<emoji>{_EMOJI})")
+
+_URL_PATTERN = re.compile(_URL)
+
+
+def classify_message(author: str, content: str) -> MessageKind:
+    """
+    Classify a message by its content: media, sticker and deleted placeholders, links,
+    or text. Lines without an author (group events, encryption notice) are system lines.
+    """
+    if author is None or author == "None":
+        return MessageKind.SYSTEM
+
+    placeholder = content.strip().strip("\u200e").strip("<>").strip().lower()
+    kind = PLACEHOLDER_KINDS.get(placeholder)
+    if kind is not None:
+        return kind
+    if _URL_PATTERN.search(content):
+        return MessageKind.LINK
+    return MessageKind.TEXT
+
+
+def scan_message(content: str) -> Tuple[List[str], int]:
+    """Emojis (in order) and number of URLs of a message"""
+    emojis, urls = [], 0
+    for match in SCANNER.finditer(content):
+        if match.lastgroup == "url":
+            urls += 1
+        else:
+            emojis.append(match.group())
+    return emojis, urls
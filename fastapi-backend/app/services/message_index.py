@@ -0,0 +1,240 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import io
+import json
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.data_formats import Message, MessagePage
+from app.services.artifact_store import load_artifact, save_artifact
+from app.services.parsing_utils import load_stored_messages
+from app.utils.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_INDEX_KIND = "message_index:v2"
+
+MAX_PAGE_SIZE = 1000
+
+# Indexes of the conversations browsed lately, by content hash
+_index_cache = CacheManager(max_size=20, expiration_minutes=30)
+
+
+def to_datetime64(value: datetime, unit: str = "s") -> np.datetime64:
+    """
+    A date range bound as the exported message times, naive local times of the phone
+
+    Raises:
+        ValueError: If value has a UTC offset, the offset of the export is not known
+    """
+    if value.tzinfo is not None:
+        raise ValueError("Dates must be local times without a UTC offset, like the messages")
+    return np.datetime64(value, unit)
+
+
+class MessageIndex:
+    """
+    Stored conversation as one JSON line per message plus columnar author and date arrays,
+    and the positions of the messages of each author. Exported messages are in date order,
+    so a date range is a range of positions found by binary search, and filtered pages
+    are read with a few binary searches; only the messages of the page are decoded, by
+    slicing their lines out of the buffer with the byte offsets.
+    """
+
+    def __init__(
+        self,
+        lines: np.ndarray,
+        offsets: np.ndarray,
+        dates: np.ndarray,
+        authors: List[str],
+        message_authors: np.ndarray,
+        author_offsets: np.ndarray,
+        author_positions: np.ndarray,
+    ):
+        self.lines = lines
+        self.offsets = offsets
+        self.dates = dates
+        self.authors = authors
+        self.message_authors = message_authors
+        # Positions of author a are author_positions[author_offsets[a]:author_offsets[a + 1]]
+        self.author_offsets = author_offsets
+        self.author_positions = author_positions
+        self._author_codes = {author: code for code, author in enumerate(authors)}
+        # Lines edited by hand can be out of order, date ranges are then filtered by scanning
+        self.in_date_order = bool(np.all(dates[1:] >= dates[:-1]))
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def build(cls, messages: List[Dict]) -> "MessageIndex":
+        """Build from stored message dicts (date as ISO string, author, content)"""
+        authors: Dict[str, int] = {}
+        message_authors = np.array(
+            [authors.setdefault(msg["author"], len(authors)) for msg in messages], dtype=np.int32
+        )
+        encoded = [json.dumps(msg).encode() for msg in messages]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(line) for line in encoded], out=offsets[1:])
+
+        author_offsets = np.zeros(len(authors) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(message_authors, minlength=len(authors)), out=author_offsets[1:])
+
+        return cls(
+            np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            offsets,
+            np.array([msg["date"] for msg in messages], dtype="datetime64[s]"),
+            list(authors),
+            message_authors,
+            author_offsets,
+            np.argsort(message_authors, kind="stable").astype(np.int64),
+        )
+
+    def message(self, position: int) -> Message:
+        line = self.lines[self.offsets[position] : self.offsets[position + 1]].tobytes()
+        return Message.model_validate(json.loads(line))
+
+    def _selection(
+        self,
+        author: Optional[str],
+        start: Optional[datetime],
+        end: Optional[datetime],
+        first: int,
+        last: Optional[int],
+    ) -> Tuple[Optional[np.ndarray], int, int]:
+        """
+        The matching positions as source[low:high], source being sorted positions or None
+        for all the positions (then low and high are positions themselves)
+        """
+        last = len(self) if last is None else min(last, len(self))
+        if not self.in_date_order and (start is not None or end is not None):
+            mask = np.zeros(len(self), dtype=bool)
+            mask[first:last] = True
+            if start is not None:
+                mask &= self.dates >= to_datetime64(start)
+            if end is not None:
+                mask &= self.dates < to_datetime64(end)
+            if author is not None:
+                mask &= self.message_authors == self._author_codes.get(author, -1)
+            positions = np.flatnonzero(mask)
+            return positions, 0, len(positions)
+
+        if start is not None:
+            first = max(first, int(np.searchsorted(self.dates, to_datetime64(start))))
+        if end is not None:
+            last = min(last, int(np.searchsorted(self.dates, to_datetime64(end))))
+        last = max(first, last)
+        if author is None:
+            return None, first, last
+
+        code = self._author_codes.get(author)
+        if code is None:
+            return None, 0, 0
+        positions = self.author_positions[self.author_offsets[code] : self.author_offsets[code + 1]]
+        low, high = np.searchsorted(positions, [first, last])
+        return positions, int(low), int(high)
+
+    def matching(
+        self,
+        author: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        first: int = 0,
+        last: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Positions of the messages from `author` sent in [start, end), among the positions
+        first to last excluded
+        """
+        source, low, high = self._selection(author, start, end, first, last)
+        if source is None:
+            return np.arange(low, high, dtype=np.int64)
+        return source[low:high]
+
+    def page(
+        self,
+        cursor: int = 0,
+        limit: int = 100,
+        author: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        first: int = 0,
+        last: Optional[int] = None,
+    ) -> MessagePage:
+        """
+        Messages matching the filters, starting at position `cursor` of the conversation.
+
+        Returns:
+            MessagePage: At most `limit` messages, with the cursor of the next page or None
+            if this is the last one
+        """
+        source, low, high = self._selection(author, start, end, first, last)
+        if source is None:
+            begin = min(max(cursor, low), high)
+            selected = np.arange(begin, min(begin + limit, high), dtype=np.int64)
+        else:
+            begin = min(max(int(np.searchsorted(source, cursor)), low), high)
+            selected = source[begin : min(begin + limit, high)]
+        has_more = begin + limit < high
+
+        return MessagePage(
+            messages=[self.message(position) for position in selected],
+            next_cursor=int(selected[-1]) + 1 if has_more else None,
+            total=high - low,
+        )
+
+    def to_bytes(self) -> bytes:
+        # Not compressed, a page then costs no decompression of the whole conversation
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            lines=self.lines,
+            offsets=self.offsets,
+            dates=self.dates.astype(np.int64),
+            authors=np.array(self.authors, dtype=str),
+            message_authors=self.message_authors,
+            author_offsets=self.author_offsets,
+            author_positions=self.author_positions,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "MessageIndex":
+        arrays = np.load(io.BytesIO(payload))
+        return cls(
+            arrays["lines"],
+            arrays["offsets"],
+            arrays["dates"].astype("datetime64[s]"),
+            arrays["authors"].tolist(),
+            arrays["message_authors"],
+            arrays["author_offsets"],
+            arrays["author_positions"],
+        )
+
+
+def get_or_build_message_index(db: Session, content_hash: str) -> Optional[MessageIndex]:
+    """
+    Load the message index of a conversation from the process cache or the persisted
+    artifact, building and storing it from the stored conversation if missing.
+
+    Returns:
+        MessageIndex or None: None if the conversation does not exist
+    """
+    index = _index_cache.get(content_hash)
+    if index is not None:
+        return index
+
+    payload = load_artifact(db, content_hash, MESSAGE_INDEX_KIND)
+    if payload is not None:
+        index = MessageIndex.from_bytes(payload)
+    else:
+        messages = load_stored_messages(db, content_hash)
+        if messages is None:
+            return None
+
+        logger.info(f"Building message index for {content_hash}")
+        index = MessageIndex.build(messages)
+        save_artifact(db, content_hash, MESSAGE_INDEX_KIND, index.to_bytes())
+
+    _index_cache.set(content_hash, index)
+    return index
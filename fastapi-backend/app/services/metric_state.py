@@ -0,0 +1,715 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import bisect
+import json
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.data_formats import (
+    ContentStats,
+    ConversationStats,
+    HeatmapData,
+    Message,
+    WordMetrics,
+)
+from app.services.artifact_store import load_artifacts, save_artifact
+from app.services.message_classifier import TEXT_KINDS, scan_message
+from app.services.sketches import DistinctSample, HyperLogLog, SpaceSaving, stable_hash
+from app.services.text_analyzer import (
+    EXACT_VOCABULARY_MAX_TOKENS,
+    TOP_WORDS_SKETCH_CAPACITY,
+    count_curse_words,
+    conversation_stats_from_counts,
+    heatmap_from_matrix,
+    message_words,
+    top_words,
+    vocabulary_richness_from_counts,
+    word_metrics_from_counts,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump when an aggregate changes its serialized layout
+AGGREGATE_VERSION = 3
+
+SESSION_GAP_SECONDS = 30 * 60
+
+# Messages folded at a time by ConversationAggregate.update, so only the words of one
+# chunk are held at once whatever the size of the chat
+UPDATE_CHUNK_SIZE = 10_000
+
+
+# Every metric is kept as a partial aggregate with three operations:
+# - update(dates, messages, tokens) folds new messages (in chronological order) into the
+#   aggregate; tokens are the processed words of each message, shared by the parts that
+#   set uses_tokens so a message is tokenized once
+# - merge(other) folds the aggregate of the *following* messages into this one
+# - to_dict()/from_dict() serialize it for persistence
+# merge is associative and an empty aggregate is its identity, so a conversation can be
+# processed in chunks (sequentially, in parallel or appended later) with identical results.
+
+
+def tokenize(messages: List[Message]) -> List[List[str]]:
+    return [message_words(msg) for msg in messages]
+
+
+class ActivityCounts:
+    """Message counts per author, text length per author and per weekday/week/month counts"""
+
+    name = "activity"
+
+    def __init__(self):
+        self.total = 0
+        self.messages_per_author = Counter()
+        self.length_per_author = Counter()
+        self.weekday_counts = [0] * 7
+        self.week_counts = [0] * 53
+        self.month_counts = [0] * 12
+
+    def update(self, dates, messages, tokens=None) -> "ActivityCounts":
+        for msg in messages:
+            self.total += 1
+            self.messages_per_author[msg.author] += 1
+            self.length_per_author[msg.author] += len(msg.content)
+            self.weekday_counts[msg.date.weekday()] += 1
+            self.week_counts[msg.date.isocalendar()[1] - 1] += 1
+            self.month_counts[msg.date.month - 1] += 1
+        return self
+
+    def merge(self, other: "ActivityCounts") -> "ActivityCounts":
+        self.total += other.total
+        self.messages_per_author.update(other.messages_per_author)
+        self.length_per_author.update(other.length_per_author)
+        self.weekday_counts = [a + b for a, b in zip(self.weekday_counts, other.weekday_counts)]
+        self.week_counts = [a + b for a, b in zip(self.week_counts, other.week_counts)]
+        self.month_counts = [a + b for a, b in zip(self.month_counts, other.month_counts)]
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "messages_per_author": dict(self.messages_per_author),
+            "length_per_author": dict(self.length_per_author),
+            "weekday_counts": self.weekday_counts,
+            "week_counts": self.week_counts,
+            "month_counts": self.month_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ActivityCounts":
+        state = cls()
+        state.total = data["total"]
+        state.messages_per_author = Counter(data["messages_per_author"])
+        state.length_per_author = Counter(data["length_per_author"])
+        state.weekday_counts = data["weekday_counts"]
+        state.week_counts = data["week_counts"]
+        state.month_counts = data["month_counts"]
+        return state
+
+
+class SessionState:
+    """
+    Conversation sessions: runs of messages separated by gaps longer than gap_seconds.
+    Sessions are kept as [start, end, length]; the last session of a chunk stays open, so
+    merging joins it with the first session of the next chunk when the gap is short enough.
+    """
+
+    name = "sessions"
+
+    def __init__(self, gap_seconds: int = SESSION_GAP_SECONDS):
+        self.gap_seconds = gap_seconds
+        self.sessions: List[list] = []
+
+    def _joins(self, previous_end: datetime, next_start: datetime) -> bool:
+        return (next_start - previous_end).total_seconds() <= self.gap_seconds
+
+    def update(self, dates, messages, tokens=None) -> "SessionState":
+        for msg in messages:
+            if self.sessions and self._joins(self.sessions[-1][1], msg.date):
+                self.sessions[-1][1] = msg.date
+                self.sessions[-1][2] += 1
+            else:
+                self.sessions.append([msg.date, msg.date, 1])
+        return self
+
+    def merge(self, other: "SessionState") -> "SessionState":
+        other_sessions = [list(session) for session in other.sessions]
+        if self.sessions and other_sessions:
+            first = other_sessions[0]
+            if self._joins(self.sessions[-1][1], first[0]):
+                self.sessions[-1][1] = first[1]
+                self.sessions[-1][2] += first[2]
+                other_sessions = other_sessions[1:]
+        self.sessions.extend(other_sessions)
+        return self
+
+    def longest(self) -> list:
+        """Longest session, the earliest one on ties"""
+        return max(self.sessions, key=lambda session: session[2])
+
+    def to_dict(self) -> dict:
+        return {
+            "gap_seconds": self.gap_seconds,
+            "sessions": [
+                [start.isoformat(), end.isoformat(), length] for start, end, length in self.sessions
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SessionState":
+        state = cls(gap_seconds=data["gap_seconds"])
+        state.sessions = [
+            [datetime.fromisoformat(start), datetime.fromisoformat(end), length]
+            for start, end, length in data["sessions"]
+        ]
+        return state
+
+
+class CurseWordCounts:
+    """Curse word occurrences per author"""
+
+    name = "curse_words"
+
+    def __init__(self):
+        self.by_author: Dict[str, Counter] = {}
+
+    def update(self, dates, messages, tokens=None) -> "CurseWordCounts":
+        for msg in messages:
+            self.by_author.setdefault(msg.author, Counter()).update(count_curse_words([msg]))
+        return self
+
+    def merge(self, other: "CurseWordCounts") -> "CurseWordCounts":
+        for author, counts in other.by_author.items():
+            self.by_author.setdefault(author, Counter()).update(counts)
+        return self
+
+    def to_dict(self) -> dict:
+        return {"by_author": {author: dict(c) for author, c in self.by_author.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CurseWordCounts":
+        state = cls()
+        state.by_author = {author: Counter(c) for author, c in data["by_author"].items()}
+        return state
+
+
+class WordCounts:
+    """Frequencies of the processed (tokenized, stop word free) words"""
+
+    name = "words"
+    uses_tokens = True
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def update(self, dates, messages, tokens=None) -> "WordCounts":
+        for words in tokens if tokens is not None else tokenize(messages):
+            self.counts.update(words)
+        return self
+
+    def merge(self, other: "WordCounts") -> "WordCounts":
+        self.counts.update(other.counts)
+        return self
+
+    def to_dict(self) -> dict:
+        return {"counts": dict(self.counts)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WordCounts":
+        state = cls()
+        state.counts = Counter(data["counts"])
+        return state
+
+
+class WordSketch:
+    """Bounded-memory (SpaceSaving) frequencies of the processed words, for huge chats"""
+
+    name = "word_sketch"
+    uses_tokens = True
+
+    def __init__(self, capacity: int = TOP_WORDS_SKETCH_CAPACITY):
+        self.sketch = SpaceSaving(capacity=capacity)
+
+    def update(self, dates, messages, tokens=None) -> "WordSketch":
+        for words in tokens if tokens is not None else tokenize(messages):
+            self.sketch.update(words)
+        return self
+
+    def merge(self, other: "WordSketch") -> "WordSketch":
+        self.sketch.merge(other.sketch)
+        return self
+
+    def to_dict(self) -> dict:
+        return self.sketch.to_dict()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WordSketch":
+        state = cls()
+        state.sketch = SpaceSaving.from_dict(data)
+        return state
+
+
+class VocabularyState:
+    """
+    Vocabulary richness: distinct and once-used (hapax) words per author, distinct words
+    per month. Counted exactly until more than max_exact_tokens words were seen, then
+    switched to HyperLogLog distinct counts plus a distinct sample to estimate hapax.
+    """
+
+    name = "vocabulary"
+    uses_tokens = True
+
+    def __init__(self, max_exact_tokens: int = EXACT_VOCABULARY_MAX_TOKENS):
+        self.max_exact_tokens = max_exact_tokens
+        self.exact = True
+        self.tokens_per_author = Counter()
+        # Exact mode
+        self.author_words: Dict[str, Counter] = {}
+        self.month_words: Dict[str, set] = {}
+        # Sketch mode
+        self.author_distinct: Dict[str, HyperLogLog] = {}
+        self.author_samples: Dict[str, DistinctSample] = {}
+        self.month_distinct: Dict[str, HyperLogLog] = {}
+
+    def update(self, dates, messages, tokens=None) -> "VocabularyState":
+        tokens = tokens if tokens is not None else tokenize(messages)
+        author_batch: Dict[str, Counter] = {}
+        month_batch: Dict[str, Counter] = {}
+        for msg, words in zip(messages, tokens):
+            self.tokens_per_author[msg.author] += len(words)
+            author_batch.setdefault(msg.author, Counter()).update(words)
+            month_batch.setdefault(msg.date.strftime("%Y-%m"), Counter()).update(words)
+
+        self._add_counts(author_batch, month_batch)
+        return self
+
+    def _add_counts(self, author_batch: Dict[str, Counter], month_batch: Dict[str, Counter]):
+        if self.exact:
+            for author, counts in author_batch.items():
+                self.author_words.setdefault(author, Counter()).update(counts)
+            for month, counts in month_batch.items():
+                self.month_words.setdefault(month, set()).update(counts)
+            if sum(self.tokens_per_author.values()) > self.max_exact_tokens:
+                self._switch_to_sketches()
+            return
+
+        # Hash every distinct word of the batch once for all sketches
+        hashes = {word: stable_hash(word) for counts in author_batch.values() for word in counts}
+        for author, counts in author_batch.items():
+            self.author_distinct.setdefault(author, HyperLogLog()).add_hashes(
+                np.fromiter((hashes[word] for word in counts), dtype=np.uint64)
+            )
+            sample = self.author_samples.setdefault(author, DistinctSample())
+            for word, count in counts.items():
+                sample.add(word, count, hashes[word])
+        for month, counts in month_batch.items():
+            self.month_distinct.setdefault(month, HyperLogLog()).add_hashes(
+                np.fromiter((hashes[word] for word in counts), dtype=np.uint64)
+            )
+
+    def _switch_to_sketches(self):
+        author_words, month_words = self.author_words, self.month_words
+        self.exact = False
+        self.author_words, self.month_words = {}, {}
+        self._add_counts(
+            author_words, {month: Counter(words) for month, words in month_words.items()}
+        )
+
+    def merge(self, other: "VocabularyState") -> "VocabularyState":
+        self.tokens_per_author.update(other.tokens_per_author)
+        if self.exact and other.exact:
+            self._add_counts(
+                other.author_words,
+                {month: Counter(words) for month, words in other.month_words.items()},
+            )
+            return self
+
+        if self.exact:
+            self._switch_to_sketches()
+        if other.exact:
+            other = VocabularyState.from_dict(other.to_dict())
+            other._switch_to_sketches()
+        for author, sketch in other.author_distinct.items():
+            self.author_distinct.setdefault(author, HyperLogLog()).merge(sketch)
+        for author, sample in other.author_samples.items():
+            self.author_samples.setdefault(author, DistinctSample()).merge(sample)
+        for month, sketch in other.month_distinct.items():
+            self.month_distinct.setdefault(month, HyperLogLog()).merge(sketch)
+        return self
+
+    def richness(self) -> dict:
+        """Vocabulary fields of WordMetrics"""
+        if self.exact:
+            vocabulary_size = {author: len(c) for author, c in self.author_words.items()}
+            hapax = {
+                author: sum(1 for count in c.values() if count == 1)
+                for author, c in self.author_words.items()
+            }
+            distinct_per_month = {month: len(words) for month, words in self.month_words.items()}
+        else:
+            vocabulary_size = {
+                author: min(sketch.count(), self.tokens_per_author[author])
+                for author, sketch in self.author_distinct.items()
+            }
+            hapax = {
+                author: round(size * self.author_samples[author].fraction(lambda c: c == 1))
+                for author, size in vocabulary_size.items()
+            }
+            distinct_per_month = {
+                month: sketch.count() for month, sketch in self.month_distinct.items()
+            }
+
+        return vocabulary_richness_from_counts(
+            vocabulary_size, hapax, self.tokens_per_author, distinct_per_month
+        )
+
+    def to_dict(self) -> dict:
+        data = {
+            "max_exact_tokens": self.max_exact_tokens,
+            "exact": self.exact,
+            "tokens_per_author": dict(self.tokens_per_author),
+        }
+        if self.exact:
+            data["author_words"] = {a: dict(c) for a, c in self.author_words.items()}
+            data["month_words"] = {m: sorted(words) for m, words in self.month_words.items()}
+        else:
+            data["author_distinct"] = {a: h.to_dict() for a, h in self.author_distinct.items()}
+            data["author_samples"] = {a: s.to_dict() for a, s in self.author_samples.items()}
+            data["month_distinct"] = {m: h.to_dict() for m, h in self.month_distinct.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "VocabularyState":
+        state = cls(max_exact_tokens=data["max_exact_tokens"])
+        state.exact = data["exact"]
+        state.tokens_per_author = Counter(data["tokens_per_author"])
+        if state.exact:
+            state.author_words = {a: Counter(c) for a, c in data["author_words"].items()}
+            state.month_words = {m: set(words) for m, words in data["month_words"].items()}
+        else:
+            state.author_distinct = {
+                a: HyperLogLog.from_dict(h) for a, h in data["author_distinct"].items()
+            }
+            state.author_samples = {
+                a: DistinctSample.from_dict(s) for a, s in data["author_samples"].items()
+            }
+            state.month_distinct = {
+                m: HyperLogLog.from_dict(h) for m, h in data["month_distinct"].items()
+            }
+        return state
+
+
+class HeatmapGrid:
+    """7x53 (weekday x ISO week) counts of every dated line and the last date of each cell"""
+
+    name = "heatmap"
+
+    def __init__(self):
+        self.matrix = [[0] * 53 for _ in range(7)]
+        self.dates_matrix = [[""] * 53 for _ in range(7)]
+
+    def update(self, dates, messages, tokens=None) -> "HeatmapGrid":
+        for date in dates:
+            weekday = date.weekday()
+            week = date.isocalendar()[1] - 1  # 0-52
+            self.matrix[weekday][week] += 1
+            self.dates_matrix[weekday][week] = date.strftime("%d/%m/%Y")
+        return self
+
+    def merge(self, other: "HeatmapGrid") -> "HeatmapGrid":
+        for weekday in range(7):
+            for week in range(53):
+                self.matrix[weekday][week] += other.matrix[weekday][week]
+                if other.dates_matrix[weekday][week]:
+                    self.dates_matrix[weekday][week] = other.dates_matrix[weekday][week]
+        return self
+
+    def to_dict(self) -> dict:
+        return {"matrix": self.matrix, "dates_matrix": self.dates_matrix}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HeatmapGrid":
+        state = cls()
+        state.matrix = data["matrix"]
+        state.dates_matrix = data["dates_matrix"]
+        return state
+
+
+class ContentCounts:
+    """Message kinds, emojis and URLs per author"""
+
+    name = "content"
+
+    def __init__(self):
+        self.kinds: Dict[str, Counter] = {}
+        self.emojis: Dict[str, Counter] = {}
+        self.urls = Counter()
+
+    def update(self, dates, messages, tokens=None) -> "ContentCounts":
+        for msg in messages:
+            self.kinds.setdefault(msg.author, Counter())[msg.kind.name.lower()] += 1
+            if msg.kind in TEXT_KINDS:
+                emojis, urls = scan_message(msg.content)
+                self.emojis.setdefault(msg.author, Counter()).update(emojis)
+                self.urls[msg.author] += urls
+        return self
+
+    def merge(self, other: "ContentCounts") -> "ContentCounts":
+        for author, counts in other.kinds.items():
+            self.kinds.setdefault(author, Counter()).update(counts)
+        for author, counts in other.emojis.items():
+            self.emojis.setdefault(author, Counter()).update(counts)
+        self.urls.update(other.urls)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "kinds": {author: dict(c) for author, c in self.kinds.items()},
+            "emojis": {author: dict(c) for author, c in self.emojis.items()},
+            "urls": dict(self.urls),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ContentCounts":
+        state = cls()
+        state.kinds = {author: Counter(c) for author, c in data["kinds"].items()}
+        state.emojis = {author: Counter(c) for author, c in data["emojis"].items()}
+        state.urls = Counter(data["urls"])
+        return state
+
+
+AGGREGATE_TYPES = {
+    aggregate.name: aggregate
+    for aggregate in (
+        ActivityCounts,
+        SessionState,
+        CurseWordCounts,
+        WordCounts,
+        WordSketch,
+        VocabularyState,
+        HeatmapGrid,
+        ContentCounts,
+    )
+}
+
+# Aggregates maintained when no parts are specified, the sketch replaces WordCounts on demand
+DEFAULT_PARTS = ("activity", "sessions", "curse_words", "words", "vocabulary", "heatmap")
+
+# Aggregates needed to produce each AnalysisResponse section
+SECTION_AGGREGATES = {
+    "conversation_stats": ("activity", "sessions"),
+    "word_metrics": ("activity", "curse_words", "vocabulary"),
+    "heatmap_data": ("heatmap",),
+    "common_words": ("words",),  # or ("word_sketch",) above the exact counting crossover
+    "content_stats": ("content",),
+}
+
+
+class ConversationAggregate:
+    """
+    A set of partial aggregates for (a chunk of) a conversation.
+    Only the aggregates listed in `parts` are maintained.
+    """
+
+    def __init__(self, parts: Optional[Iterable[str]] = None):
+        names = DEFAULT_PARTS if parts is None else parts
+        self.parts = {name: AGGREGATE_TYPES[name]() for name in names}
+
+    @classmethod
+    def from_conversation(
+        cls,
+        dates: List[datetime],
+        conversation: List[Message],
+        parts: Optional[Iterable[str]] = None,
+    ) -> "ConversationAggregate":
+        return cls(parts).update(dates, conversation)
+
+    def update(self, dates: List[datetime], messages: List[Message]) -> "ConversationAggregate":
+        """
+        Fold new dated lines and messages, which must follow the ones already seen, one
+        chunk of UPDATE_CHUNK_SIZE messages at a time
+        """
+        needs_tokens = any(getattr(part, "uses_tokens", False) for part in self.parts.values())
+        for chunk_dates, chunk in _chunks(dates, messages, UPDATE_CHUNK_SIZE):
+            tokens = tokenize(chunk) if needs_tokens else None
+            for part in self.parts.values():
+                part.update(chunk_dates, chunk, tokens)
+        return self
+
+    def merge(self, other: "ConversationAggregate") -> "ConversationAggregate":
+        """Fold the aggregate of the messages following this chunk; parts must match"""
+        if self.parts.keys() != other.parts.keys():
+            raise ValueError("Cannot merge aggregates with different parts")
+        for name, part in self.parts.items():
+            part.merge(other.parts[name])
+        return self
+
+    def to_dict(self) -> dict:
+        return {name: part.to_dict() for name, part in self.parts.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ConversationAggregate":
+        aggregate = cls(parts=[])
+        aggregate.parts = {
+            name: AGGREGATE_TYPES[name].from_dict(value) for name, value in data.items()
+        }
+        return aggregate
+
+    def conversation_stats(self) -> ConversationStats:
+        activity = self.parts["activity"]
+        sessions = self.parts["sessions"]
+        longest_start, longest_end, longest_length = sessions.longest()
+
+        return conversation_stats_from_counts(
+            total_messages=activity.total,
+            participant_count=len(activity.messages_per_author),
+            weekday_counts=dict(enumerate(activity.weekday_counts)),
+            week_counts=dict(enumerate(activity.week_counts)),
+            month_counts=dict(enumerate(activity.month_counts, start=1)),
+            conversation_lenghts=[length for _, _, length in sessions.sessions],
+            longest_conversation=(longest_length, longest_start, longest_end),
+        )
+
+    def word_metrics(self) -> WordMetrics:
+        activity = self.parts["activity"]
+        return word_metrics_from_counts(
+            dict(activity.messages_per_author),
+            dict(activity.length_per_author),
+            self.parts["curse_words"].by_author,
+            self.parts["vocabulary"].richness(),
+        )
+
+    def heatmap_data(self) -> HeatmapData:
+        heatmap = self.parts["heatmap"]
+        return heatmap_from_matrix(heatmap.matrix, heatmap.dates_matrix)
+
+    def content_stats(self, top_n=20, top_n_by_author=5) -> ContentStats:
+        content = self.parts["content"]
+
+        def by_count(values):
+            """Non-zero values, largest first"""
+            ranked = sorted(values.items(), key=lambda x: x[1], reverse=True)
+            return {author: count for author, count in ranked if count}
+
+        all_emojis = Counter()
+        for counts in content.emojis.values():
+            all_emojis.update(counts)
+
+        return ContentStats(
+            kinds_per_author={author: dict(c) for author, c in content.kinds.items()},
+            media_per_author=by_count(
+                {author: c["media"] + c["sticker"] for author, c in content.kinds.items()}
+            ),
+            links_per_author=by_count(dict(content.urls)),
+            emojis_per_author=by_count(
+                {author: sum(c.values()) for author, c in content.emojis.items()}
+            ),
+            top_emojis=top_words(all_emojis, top_n),
+            top_emojis_by_author={
+                author: top_words(c, top_n_by_author) for author, c in content.emojis.items()
+            },
+        )
+
+    def common_words(self, top_n=20) -> Dict[str, int]:
+        """Exact top words when word counts are maintained, sketched ones otherwise"""
+        if "words" in self.parts:
+            return top_words(self.parts["words"].counts, top_n)
+        return top_words(self.parts["word_sketch"].sketch, top_n)
+
+
+def aggregate_in_chunks(
+    dates: List[datetime],
+    conversation: List[Message],
+    chunk_size: int,
+    parts: Optional[Iterable[str]] = None,
+) -> ConversationAggregate:
+    """
+    Build a conversation aggregate chunk by chunk and merge the partial results.
+    Every chunk can also be built independently (e.g. by a worker pool) and merged in order.
+    """
+    parts = list(DEFAULT_PARTS if parts is None else parts)
+    result = ConversationAggregate(parts)
+    for chunk_dates, chunk in _chunks(dates, conversation, chunk_size):
+        result.merge(ConversationAggregate.from_conversation(chunk_dates, chunk, parts))
+    return result
+
+
+def _chunks(
+    dates: List[datetime], messages: List[Message], chunk_size: int
+) -> Iterator[Tuple[List[datetime], List[Message]]]:
+    """
+    Consecutive chunks of chunk_size messages with their dated lines. Dated lines are split
+    at the date of the last message of each chunk, the last chunk takes the remaining ones
+    (all of them when there are no messages).
+    """
+    date_start = 0
+    for start in range(0, max(len(messages), 1), chunk_size):
+        chunk = messages[start : start + chunk_size]
+        is_last = start + chunk_size >= len(messages)
+        date_end = len(dates) if is_last else _date_index_after(dates, chunk[-1].date, date_start)
+        yield dates[date_start:date_end], chunk
+        date_start = date_end
+
+
+def _date_index_after(dates: List[datetime], date: datetime, start: int) -> int:
+    """First index from start of the sorted dates later than date"""
+    return bisect.bisect_right(dates, date, lo=start)
+
+
+def _aggregate_kind(name: str) -> str:
+    return f"aggregate:v{AGGREGATE_VERSION}:{name}"
+
+
+def load_aggregate(
+    db: Session, content_hash: str, parts: Iterable[str]
+) -> Optional[ConversationAggregate]:
+    """Load the persisted aggregates among `parts`, None if none of them is stored"""
+    parts = list(parts)
+    payloads = load_artifacts(db, content_hash, [_aggregate_kind(name) for name in parts])
+    if not payloads:
+        return None
+
+    return ConversationAggregate.from_dict(
+        {
+            name: json.loads(payloads[_aggregate_kind(name)])
+            for name in parts
+            if _aggregate_kind(name) in payloads
+        }
+    )
+
+
+def save_aggregate(db: Session, content_hash: str, aggregate: ConversationAggregate) -> None:
+    """Persist every part of a conversation aggregate"""
+    for name, part in aggregate.parts.items():
+        save_artifact(db, content_hash, _aggregate_kind(name), json.dumps(part.to_dict()).encode())
+
+
+def get_or_build_aggregate(
+    db: Session,
+    content_hash: str,
+    dates: List[datetime],
+    conversation: List[Message],
+    parts: Iterable[str],
+) -> ConversationAggregate:
+    """
+    Load the requested aggregates of a conversation, building and persisting the missing
+    ones from the parsed messages.
+    """
+    parts = list(parts)
+    payloads = load_artifacts(db, content_hash, [_aggregate_kind(name) for name in parts])
+    stored = {
+        name: json.loads(payloads[_aggregate_kind(name)])
+        for name in parts
+        if _aggregate_kind(name) in payloads
+    }
+    aggregate = ConversationAggregate.from_dict(stored)
+
+    missing = [name for name in parts if name not in stored]
+    if missing:
+        logger.info(f"Building aggregates {missing} for {content_hash}")
+        built = ConversationAggregate.from_conversation(dates, conversation, missing)
+        save_aggregate(db, content_hash, built)
+        aggregate.parts.update(built.parts)
+
+    return aggregate
@@ -0,0 +1,50 @@
+from typing import Optional
+import logging
+import httpx
+import openai
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[openai.AsyncOpenAI] = None
+
+
+def create_openai_client() -> openai.AsyncOpenAI:
+    """
+    Async OpenAI client with a pooled HTTP connection, so concurrent requests share
+    kept-alive TLS connections instead of opening one per call. Timeouts, retries and
+    pool sizes come from the settings.
+    """
+    settings = get_settings()
+    http_client = openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(
+            settings.OPENAI_TIMEOUT_SECONDS, connect=settings.OPENAI_CONNECT_TIMEOUT_SECONDS
+        ),
+    )
+    return openai.AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    """The application-wide OpenAI client, created on first use"""
+    global _client
+    if _client is None:
+        logger.info("Creating shared OpenAI client")
+        _client = create_openai_client()
+    return _client
+
+
+async def close_openai_client() -> None:
+    """Close the shared client's connections, on application shutdown"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -1,3 +1,4 @@
+from typing import Dict, List, Optional
 from bisect import bisect_left
 from datetime import datetime, timedelta
 from app.models.data_formats import Message
@@ -6,7 +7,15 @@ import json
 from hashlib import sha256
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from app.models.database_models import ParsedConversation
+from app.models.database_models import ParsedConversation, ConversationArtifact
+from app.services.artifact_store import save_artifact
+from app.services.message_classifier import classify_message
+from app.services.metric_state import (
+    AGGREGATE_TYPES,
+    ConversationAggregate,
+    load_aggregate,
+    save_aggregate,
+)
 import logging
 import zipfile
 import io
@@ -14,6 +23,10 @@ from fastapi import UploadFile, HTTPException
 
 logger = logging.getLogger(__name__)
 
+# Conversations longer than this register a hash of their head, so a later export of the same
+# chat (the old content plus new lines) is recognised and only the new lines are parsed
+PREFIX_HEAD_CHARS = 4096
+
 
 def is_new_message(line):
     # Check if line starts with date pattern DD/MM/YYYY HH:MM
@@ -145,7 +158,10 @@ def _create_message(date, author, content):
     Returns:
         Message: Constructed message object
     """
-    return Message(date=date, author=author, content=content.strip())
+    content = content.strip()
+    return Message(
+        date=date, author=author, content=content, kind=classify_message(author, content)
+    )
 
 
 def _update_conversation_data(conversation, author_and_messages, msg):
@@ -265,6 +281,11 @@ def get_or_create_parsed_conversation(content: str, db: Session) -> tuple[list,
     if parsed_conv:
         return _deserialize_parsed_conversation(parsed_conv)
 
+    # A longer export of an already parsed chat only needs its new lines parsed
+    extended = _extend_previous_conversation(db, content, content_hash)
+    if extended:
+        return extended
+
     # If not found, parse the conversation
     dates, author_and_messages, conversation = parse_whatsapp_chat(content)
 
@@ -280,9 +301,131 @@ def get_or_create_parsed_conversation(content: str, db: Session) -> tuple[list,
         parsed_conv = _retrieve_existing_conversation(db, content_hash)
         return _deserialize_parsed_conversation(parsed_conv)
 
+    _register_content_head(db, content, content_hash)
     return dates, author_and_messages, conversation, content_hash
 
 
+def _head_kind(content: str) -> str:
+    return f"head:{sha256(content[:PREFIX_HEAD_CHARS].encode()).hexdigest()}"
+
+
+def _register_content_head(db: Session, content: str, content_hash: str):
+    """Remember the head and length of a stored conversation for prefix lookups"""
+    if len(content) > PREFIX_HEAD_CHARS:
+        save_artifact(db, content_hash, _head_kind(content), str(len(content)).encode())
+
+
+def _find_previous_conversation(db: Session, content: str):
+    """
+    Find a stored conversation whose content is a strict prefix of this content.
+
+    Returns:
+        tuple or None: (content_hash, length) of the previous conversation
+    """
+    if len(content) <= PREFIX_HEAD_CHARS:
+        return None
+
+    head_kind = _head_kind(content)
+    candidates = db.query(ConversationArtifact).filter(ConversationArtifact.kind == head_kind).all()
+    for candidate in candidates:
+        length = int(candidate.payload)
+        if length < len(content):
+            prefix_hash = sha256(content[:length].encode()).hexdigest()
+            if prefix_hash == candidate.content_hash:
+                return candidate.content_hash, length
+    return None
+
+
+def _extend_previous_conversation(db: Session, content: str, content_hash: str):
+    """
+    Parse only the lines appended to a previously stored export of the same chat.
+
+    Returns:
+        tuple or None: (dates, author_and_messages, conversation, content_hash), or None if
+        there is no previous conversation or the new lines can't be parsed on their own
+    """
+    previous = _find_previous_conversation(db, content)
+    if not previous:
+        return None
+
+    previous_hash, length = previous
+    tail_lines = content[length:].split("\n")
+    first_line = next((line for line in tail_lines[1:] if line.strip()), "")
+    # The previous export must end at a line break followed by a new message
+    if tail_lines[0].strip() or not is_new_message(first_line):
+        return None
+
+    previous_conv = _retrieve_existing_conversation(db, previous_hash)
+    if not previous_conv:
+        return None
+    dates, author_and_messages, conversation, _ = _deserialize_parsed_conversation(previous_conv)
+
+    # Once the first message falls out of the analyzed year a full parse starts elsewhere
+    if dates[0] < datetime.now() - timedelta(days=365):
+        return None
+
+    try:
+        tail_dates, tail_authors, tail_conversation = _process_chat_lines_from_index(tail_lines)
+    except ValueError:
+        return None
+
+    logger.info(f"Extending conversation {previous_hash} with {len(tail_dates)} new lines")
+    dates.extend(tail_dates)
+    conversation.extend(tail_conversation)
+    for author, messages in tail_authors.items():
+        author_and_messages.setdefault(author, []).extend(messages)
+
+    try:
+        _store_new_conversation(db, content_hash, dates, author_and_messages, conversation)
+    except IntegrityError:
+        db.rollback()
+        return _deserialize_parsed_conversation(_retrieve_existing_conversation(db, content_hash))
+
+    _register_content_head(db, content, content_hash)
+    _extend_aggregate(db, previous_hash, content_hash, tail_dates, tail_conversation)
+    return dates, author_and_messages, conversation, content_hash
+
+
+def _extend_aggregate(db, previous_hash, content_hash, tail_dates, tail_conversation):
+    """Merge the persisted metric aggregates of the previous export with the new lines"""
+    previous = load_aggregate(db, previous_hash, AGGREGATE_TYPES)
+    if previous is None:
+        return
+
+    tail = ConversationAggregate.from_conversation(
+        tail_dates, tail_conversation, previous.parts.keys()
+    )
+    save_aggregate(db, content_hash, previous.merge(tail))
+
+
+def load_parsed_conversation(db: Session, content_hash: str):
+    """
+    Load a previously parsed conversation by its content hash.
+
+    Returns:
+        tuple or None: (dates, author_and_messages, conversation, content_hash),
+        or None if the conversation was never parsed
+    """
+    parsed_conv = _retrieve_existing_conversation(db, content_hash)
+    if not parsed_conv:
+        return None
+    return _deserialize_parsed_conversation(parsed_conv)
+
+
+def load_stored_messages(db: Session, content_hash: str) -> Optional[List[Dict]]:
+    """
+    Load the stored messages of a conversation as dicts, without validating them.
+
+    Returns:
+        list or None: Messages with "date" (ISO string), "author" and "content" keys,
+        or None if the conversation was never parsed
+    """
+    parsed_conv = _retrieve_existing_conversation(db, content_hash)
+    if not parsed_conv:
+        return None
+    return json.loads(parsed_conv.conversation)
+
+
 def _retrieve_existing_conversation(db: Session, content_hash: str):
     """
     Retrieve an existing parsed conversation from the database.
@@ -363,7 +506,12 @@ def _deserialize_parsed_conversation(parsed_conv):
 
 
 def message_to_dict(msg: Message) -> dict:
-    return {"date": msg.date.isoformat(), "author": msg.author, "content": msg.content}
+    return {
+        "date": msg.date.isoformat(),
+        "author": msg.author,
+        "content": msg.content,
+        "kind": int(msg.kind),
+    }
 
 
 def extract_txt_from_zip(zip_content: bytes) -> str:
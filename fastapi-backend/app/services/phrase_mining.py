@@ -0,0 +1,204 @@
+from typing import Dict, List, Tuple
+import itertools
+import numpy as np
+from app.models.data_formats import Message, PhraseStats
+from app.services.message_classifier import TEXT_KINDS
+from app.services.text_analyzer import stop_words, tokenize_text
+
+# Phrases seen fewer times are not counted beyond their first level
+MIN_PHRASE_COUNT = 3
+MAX_PHRASE_LENGTH = 3
+# Memory cap: distinct n-grams kept per phrase length, the most frequent ones
+MAX_PHRASE_CANDIDATES = 100_000
+
+
+def _count_sorted(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct values of keys and their counts, by sorting"""
+    keys = np.sort(keys)
+    if len(keys) == 0:
+        return keys, np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.diff(np.append(starts, len(keys)))
+
+
+class _TokenStream:
+    """Words of the text messages as one id array, with message and author ids"""
+
+    def __init__(self, conversation: List[Message]):
+        authors: Dict[str, int] = {}
+        positions, message_authors, texts = [], [], []
+        for position, msg in enumerate(conversation):
+            if msg.kind in TEXT_KINDS:
+                positions.append(position)
+                message_authors.append(authors.setdefault(msg.author, len(authors)))
+                texts.append(msg.content)
+
+        # Words as the common words count them, so both agree on what a word is
+        tokenized = [tokenize_text(text) for text in texts]
+        words = list(itertools.chain.from_iterable(tokenized))
+        vocabulary = {word: i for i, word in enumerate(dict.fromkeys(words))}
+        ids = np.fromiter(map(vocabulary.__getitem__, words), dtype=np.int64, count=len(words))
+        message_of_token = np.repeat(
+            np.arange(len(texts)), np.fromiter(map(len, tokenized), np.int64, len(tokenized))
+        )
+
+        self.vocabulary = list(vocabulary)
+        self.authors = list(authors)
+        self.ids = ids
+        self.messages = np.array(positions, dtype=np.int64)[message_of_token]
+        self.token_authors = np.array(message_authors, dtype=np.int64)[message_of_token]
+        self.is_stop = np.array([word in stop_words for word in self.vocabulary], dtype=bool)
+
+
+class _Level:
+    """Frequent n-grams of one length, as (prefix (n-1)-gram, last word) pairs"""
+
+    def __init__(self, prefixes, last_words, counts, only_stop_words, texts, occurrences):
+        self.prefixes = prefixes
+        self.last_words = last_words
+        self.counts = counts
+        self.only_stop_words = only_stop_words
+        self.texts = texts
+        # n-gram id starting at every token position, -1 where none is frequent
+        self.occurrences = occurrences
+
+
+def mine_phrases(
+    stream: _TokenStream,
+    min_count: int = MIN_PHRASE_COUNT,
+    max_length: int = MAX_PHRASE_LENGTH,
+    max_candidates: int = MAX_PHRASE_CANDIDATES,
+) -> List[_Level]:
+    """
+    Apriori-style n-gram counting: an n-gram is only counted where its two (n-1)-grams
+    (at the same position and one word later) are frequent, so rare prefixes never
+    produce candidates. Counting sorts integer keys (prefix id * vocabulary + last word);
+    no more than max_candidates n-grams of each length are kept, raising the frequency
+    threshold when needed, which bounds the memory whatever the chat size.
+
+    Returns:
+        list: The frequent n-grams of every length from 1 to max_length
+    """
+    n_tokens, n_words = len(stream.ids), max(len(stream.vocabulary), 1)
+    counts = np.bincount(stream.ids, minlength=len(stream.vocabulary))
+    frequent = counts >= min_count
+    words = np.arange(len(stream.vocabulary))
+    levels = [
+        _Level(
+            words,
+            words,
+            counts,
+            stream.is_stop,
+            stream.vocabulary,
+            np.where(frequent[stream.ids], stream.ids, -1),
+        )
+    ]
+
+    for length in range(2, max_length + 1):
+        previous = levels[-1].occurrences
+        starts = np.arange(max(n_tokens - length + 1, 0))
+        valid = (
+            (stream.messages[starts] == stream.messages[starts + length - 1])
+            & (previous[starts] >= 0)
+            & (previous[starts + 1] >= 0)
+        )
+        starts = starts[valid]
+        keys = previous[starts] * n_words + stream.ids[starts + length - 1]
+        distinct, key_counts = _count_sorted(keys)
+
+        kept = key_counts >= min_count
+        if np.count_nonzero(kept) > max_candidates:
+            kept = np.zeros(len(distinct), dtype=bool)
+            kept[np.argsort(-key_counts, kind="stable")[:max_candidates]] = True
+        distinct, key_counts = distinct[kept], key_counts[kept]
+        if len(distinct) == 0:
+            break
+
+        occurrences = np.full(n_tokens, -1, dtype=np.int64)
+        found = np.searchsorted(distinct, keys)
+        found[found == len(distinct)] = 0
+        matched = distinct[found] == keys
+        occurrences[starts[matched]] = found[matched]
+
+        prefixes, last_words = distinct // n_words, distinct % n_words
+        previous_level = levels[-1]
+        levels.append(
+            _Level(
+                prefixes,
+                last_words,
+                key_counts,
+                previous_level.only_stop_words[prefixes] & stream.is_stop[last_words],
+                [
+                    f"{previous_level.texts[prefix]} {stream.vocabulary[word]}"
+                    for prefix, word in zip(prefixes.tolist(), last_words.tolist())
+                ],
+                occurrences,
+            )
+        )
+    return levels
+
+
+def _reported(stream: _TokenStream, levels: List[_Level]) -> List[np.ndarray]:
+    """
+    Phrases worth reporting at each length from 2: not only stop words, not ending with
+    one ("bom dia e"), and not always seen inside the same longer phrase ("de boa" is
+    dropped when every occurrence is part of "tá de boa")
+    """
+    masks = []
+    for n in range(1, len(levels)):
+        level = levels[n]
+        mask = ~level.only_stop_words & ~stream.is_stop[level.last_words]
+        if n + 1 < len(levels):
+            longer = levels[n + 1]
+            covered = np.zeros(len(level.counts), dtype=np.int64)
+            # Counts of the longer phrases starting with, and ending with, each phrase
+            np.maximum.at(covered, longer.prefixes, longer.counts)
+            positions = np.flatnonzero(longer.occurrences >= 0)
+            suffixes = level.occurrences[positions + 1]
+            np.maximum.at(covered, suffixes, longer.counts[longer.occurrences[positions]])
+            mask &= covered < level.counts
+        masks.append(mask)
+    return masks
+
+
+def calculate_phrase_stats(
+    conversation: List[Message],
+    top_n: int = 20,
+    top_n_by_author: int = 10,
+    min_count: int = MIN_PHRASE_COUNT,
+    max_length: int = MAX_PHRASE_LENGTH,
+    max_candidates: int = MAX_PHRASE_CANDIDATES,
+) -> PhraseStats:
+    """Most frequent phrases of 2 to max_length words, overall and per author"""
+    stream = _TokenStream(conversation)
+    levels = mine_phrases(stream, min_count, max_length, max_candidates)
+    masks = _reported(stream, levels)
+
+    phrases: List[Tuple[str, int]] = []
+    by_author: Dict[int, List[Tuple[str, int]]] = {}
+    for level, mask in zip(levels[1:], masks):
+        ids = np.flatnonzero(mask)
+        phrases.extend((level.texts[k], int(level.counts[k])) for k in ids)
+
+        positions = np.flatnonzero(level.occurrences >= 0)
+        positions = positions[mask[level.occurrences[positions]]]
+        keys, counts = _count_sorted(
+            stream.token_authors[positions] * len(level.counts) + level.occurrences[positions]
+        )
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            author, phrase = divmod(key, len(level.counts))
+            by_author.setdefault(author, []).append((level.texts[phrase], count))
+
+    def ranked(items, n):
+        return dict(sorted(items, key=lambda x: (-x[1], x[0]))[:n])
+
+    return PhraseStats(
+        top_phrases=ranked(phrases, top_n),
+        top_phrases_by_author={
+            stream.authors[author]: ranked(items, top_n_by_author)
+            for author, items in sorted(
+                by_author.items(), key=lambda x: sum(c for _, c in x[1]), reverse=True
+            )
+        },
+        min_count=min_count,
+    )
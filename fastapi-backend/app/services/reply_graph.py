@@ -0,0 +1,90 @@
+from typing import List
+import numpy as np
+from app.models.data_formats import ReplyGraph, ReplyPair
+from app.services.metric_state import SESSION_GAP_SECONDS
+
+# Upper edges, in seconds, of the reply latency histogram bins, the last bin is open
+REPLY_LATENCY_BINS = [30, 60, 120, 300, 600, 1800]
+
+
+def _group_medians(groups: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Median of values per group, NaN for empty groups"""
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    medians = np.full(n_groups, np.nan)
+    present = counts > 0
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    medians[present] = (values[low] + values[high]) / 2
+    return medians
+
+
+def calculate_reply_graph(
+    authors: List[str],
+    message_authors: np.ndarray,
+    dates: np.ndarray,
+    max_latency_seconds: int = SESSION_GAP_SECONDS,
+) -> ReplyGraph:
+    """
+    Who replies to whom: author B replies to author A when B's message directly follows
+    one of A's within max_latency_seconds (the session gap, later messages start a new
+    conversation instead). Transitions are counted on the author-id and timestamp arrays
+    of the conversation in message order, pairs being keyed as from * n_authors + to.
+
+    Args:
+        authors (list): Author names, indexed by author id
+        message_authors (np.ndarray): Author id of every message
+        dates (np.ndarray): datetime64 date of every message
+
+    Returns:
+        ReplyGraph: Reply counts, median latency and latency histogram per author pair
+    """
+    n_authors = len(authors)
+    latencies = np.diff(dates).astype("timedelta64[s]").astype(np.int64)
+    senders, repliers = message_authors[:-1].astype(np.int64), message_authors[1:].astype(np.int64)
+    replies = (senders != repliers) & (latencies >= 0) & (latencies <= max_latency_seconds)
+    senders, repliers, latencies = senders[replies], repliers[replies], latencies[replies]
+
+    pair_keys, pair_ids = np.unique(senders * n_authors + repliers, return_inverse=True)
+    counts = np.bincount(pair_ids, minlength=len(pair_keys))
+    medians = _group_medians(pair_ids, latencies, len(pair_keys))
+
+    n_bins = len(REPLY_LATENCY_BINS) + 1
+    latency_bins = np.searchsorted(REPLY_LATENCY_BINS, latencies, side="left")
+    histograms = np.bincount(
+        pair_ids * n_bins + latency_bins, minlength=len(pair_keys) * n_bins
+    ).reshape(len(pair_keys), n_bins)
+
+    replier_medians = _group_medians(repliers, latencies, n_authors)
+
+    order = np.argsort(-counts, kind="stable")
+    return ReplyGraph(
+        pairs=[
+            ReplyPair(
+                from_author=authors[pair_keys[k] // n_authors],
+                to_author=authors[pair_keys[k] % n_authors],
+                count=int(counts[k]),
+                median_latency_seconds=float(medians[k]),
+                latency_histogram=histograms[k].tolist(),
+            )
+            for k in order
+        ],
+        latency_bins=REPLY_LATENCY_BINS,
+        replies_per_author={
+            authors[code]: int(n)
+            for code, n in sorted(
+                enumerate(np.bincount(repliers, minlength=n_authors)),
+                key=lambda x: x[1],
+                reverse=True,
+            )
+            if n
+        },
+        median_reply_latency={
+            authors[code]: float(median)
+            for code, median in enumerate(replier_medians)
+            if not np.isnan(median)
+        },
+    )
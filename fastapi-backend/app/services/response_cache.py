@@ -0,0 +1,120 @@
+from typing import Callable, Optional
+import gzip
+import logging
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from app.services.artifact_store import load_artifacts, save_artifact
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the encoding of cached responses changes
+RESPONSE_CACHE_VERSION = 1
+
+# Below this size compressing costs more than it saves
+MIN_COMPRESS_SIZE = 1000
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """
+    Pick the response encoding from an Accept-Encoding header.
+
+    Returns:
+        str: "br" if accepted and brotli is installed, else "gzip" if accepted,
+        else "identity"
+    """
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def encode_json(model: BaseModel) -> bytes:
+    """Serialize a response model, leaving out unset (None) sections, with orjson"""
+    return orjson.dumps(model.model_dump(exclude_none=True))
+
+
+def _response_kind(key: str, encoding: str) -> str:
+    return f"response:v{RESPONSE_CACHE_VERSION}:{key}:{encoding}"
+
+
+def encoded_response(body: bytes, encoding: str) -> Response:
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached_json_response(
+    db: Session,
+    content_hash: str,
+    key: str,
+    accept_encoding: Optional[str],
+    build: Callable[[], Optional[BaseModel]],
+) -> Optional[Response]:
+    """
+    Serve a JSON response from the encoded bytes stored for a conversation, building,
+    encoding and compressing it only the first time.
+
+    Args:
+        db (Session): Database session
+        content_hash (str): Hash of the conversation content
+        key (str): Identifies the response among those of the conversation, e.g. the
+            analysis version and selected metrics
+        accept_encoding (str): Accept-Encoding header of the request
+        build (callable): Builds the response model on a cache miss, None if not found
+
+    Returns:
+        Response or None: Encoded (and compressed when negotiated) JSON response,
+        None if build returned None
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    kinds = [_response_kind(key, "identity")]
+    if encoding != "identity":
+        kinds.append(_response_kind(key, encoding))
+    stored = load_artifacts(db, content_hash, kinds)
+
+    if _response_kind(key, encoding) in stored:
+        return encoded_response(stored[_response_kind(key, encoding)], encoding)
+
+    body = stored.get(_response_kind(key, "identity"))
+    if body is None:
+        model = build()
+        if model is None:
+            return None
+        body = encode_json(model)
+        save_artifact(db, content_hash, _response_kind(key, "identity"), body)
+
+    if encoding == "identity" or len(body) < MIN_COMPRESS_SIZE:
+        return encoded_response(body, "identity")
+
+    logger.info(f"Compressing {len(body)} bytes response with {encoding} for {content_hash}")
+    compressed = _compress(body, encoding)
+    save_artifact(db, content_hash, _response_kind(key, encoding), compressed)
+    return encoded_response(compressed, encoding)
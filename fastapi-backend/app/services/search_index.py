@@ -0,0 +1,226 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import io
+import logging
+import re
+import numpy as np
+from sqlalchemy.orm import Session
+from app import database
+from app.models.data_formats import Message, SearchHit, SearchPage
+from app.services.artifact_store import load_artifact, save_artifact
+from app.services.message_index import MessageIndex, get_or_build_message_index
+from app.services.parsing_utils import load_stored_messages
+from app.services.term_matrix import TermMatrix, get_or_build_term_matrix
+from app.services.text_analyzer import process_text, stop_words
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_KIND = "search_index:v1"
+
+# Characters of message text shown around the first match
+SNIPPET_CHARS = 120
+
+_PHRASE = re.compile(r'"([^"]*)"')
+
+
+def parse_query(query: str) -> Tuple[List[str], List[str]]:
+    """
+    Split a search query into the indexed words that must all appear in a message and
+    the quoted phrases that must appear verbatim.
+
+    Returns:
+        tuple: (words, phrases), words processed like the common words and lowercased
+    """
+    phrases = [phrase.strip() for phrase in _PHRASE.findall(query) if phrase.strip()]
+    words = []
+    for part in phrases + [_PHRASE.sub(" ", query)]:
+        for word in process_text(part):
+            word = word.lower()
+            if word not in stop_words and word not in words:
+                words.append(word)
+    return words, phrases
+
+
+def _whole_words(texts: List[str]) -> re.Pattern:
+    alternatives = "|".join(re.escape(text) for text in sorted(texts, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE)
+
+
+def snippet(content: str, pattern: re.Pattern, size: int = SNIPPET_CHARS) -> str:
+    """The part of a message around the first match of pattern, cut at size characters"""
+    if len(content) <= size:
+        return content
+    match = pattern.search(content)
+    start = 0
+    if match is not None:
+        # Center the match in the window, without going past the end of the message
+        start = max(0, match.start() - (size - len(match.group())) // 2)
+        start = min(start, len(content) - size)
+    text = content[start : start + size]
+    return ("…" if start > 0 else "") + text + ("…" if start + size < len(content) else "")
+
+
+class SearchIndex:
+    """
+    Inverted index of a conversation: for every lowercased term of the message x term
+    matrix, the sorted positions of the messages containing it. Posting lists are stored
+    as gaps between consecutive positions, in the smallest unsigned type that fits, and
+    decoded with a cumulative sum when a term is looked up.
+    """
+
+    def __init__(self, terms: List[str], indptr: np.ndarray, gaps: np.ndarray):
+        self.terms = terms
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        # Postings of term t are cumsum(gaps[indptr[t]:indptr[t + 1]])
+        self.indptr = indptr
+        self.gaps = gaps
+
+    @classmethod
+    def build(cls, term_matrix: TermMatrix) -> "SearchIndex":
+        messages = term_matrix.messages
+        # Terms differing only in case share a posting list
+        lowered: Dict[str, int] = {}
+        term_ids = np.array(
+            [lowered.setdefault(term.lower(), len(lowered)) for term in term_matrix.vocabulary],
+            dtype=np.int64,
+        )
+        terms = list(lowered)
+        n_messages = max(messages.shape[0], 1)
+        # Distinct (term, message) pairs, sorted by term then message position
+        keys = np.sort(term_ids[messages.indices] * n_messages + messages.row_ids())
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = keys[1:] != keys[:-1]
+        keys = keys[distinct]
+        term_of_key, positions = keys // n_messages, keys % n_messages
+
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_of_key, minlength=len(terms)), out=indptr[1:])
+        # The first posting of each term is kept as is, the others as gaps
+        gaps = np.diff(positions, prepend=0)
+        list_starts = indptr[:-1][np.diff(indptr) > 0]
+        gaps[list_starts] = positions[list_starts]
+        dtype = np.min_scalar_type(int(gaps.max())) if len(gaps) else np.uint8
+        return cls(terms, indptr, gaps.astype(dtype))
+
+    def postings(self, term: str) -> np.ndarray:
+        """Sorted positions of the messages containing term"""
+        t = self._term_ids.get(term)
+        if t is None:
+            return np.empty(0, dtype=np.int64)
+        return np.cumsum(self.gaps[self.indptr[t] : self.indptr[t + 1]], dtype=np.int64)
+
+    def candidates(self, words: List[str]) -> np.ndarray:
+        """Positions of the messages containing every word, rarest word first"""
+        lists = sorted((self.postings(word) for word in words), key=len)
+        positions = lists[0]
+        for other in lists[1:]:
+            positions = np.intersect1d(positions, other, assume_unique=True)
+        return positions
+
+    def search(
+        self,
+        messages: MessageIndex,
+        query: str,
+        author: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        cursor: int = 0,
+        limit: int = 20,
+    ) -> SearchPage:
+        """
+        Messages containing every word and quoted phrase of the query, from `author` and
+        sent in [start, end), in conversation order from `cursor`.
+
+        Raises:
+            ValueError: If the query has no searchable word (only stop words)
+        """
+        words, phrases = parse_query(query)
+        if not words:
+            raise ValueError("The query has no searchable words")
+
+        positions = self.candidates(words)
+        if author is not None or start is not None or end is not None:
+            positions = positions[
+                np.isin(positions, messages.matching(author, start, end), assume_unique=True)
+            ]
+
+        highlight = _whole_words(phrases or words)
+        if phrases:
+            # The index narrows down to messages with all the words, check their order here
+            phrase_patterns = [_whole_words([phrase]) for phrase in phrases]
+            positions = np.array(
+                [
+                    position
+                    for position in positions
+                    if all(p.search(messages.message(position).content) for p in phrase_patterns)
+                ],
+                dtype=np.int64,
+            )
+
+        first = int(np.searchsorted(positions, cursor))
+        selected = positions[first : first + limit]
+        hits = []
+        for position in selected:
+            message: Message = messages.message(int(position))
+            hits.append(
+                SearchHit(
+                    offset=int(position),
+                    message=message,
+                    snippet=snippet(message.content, highlight),
+                )
+            )
+        return SearchPage(
+            hits=hits,
+            next_cursor=int(selected[-1]) + 1 if first + limit < len(positions) else None,
+            total=len(positions),
+        )
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer, terms=np.array(self.terms, dtype=str), indptr=self.indptr, gaps=self.gaps
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "SearchIndex":
+        arrays = np.load(io.BytesIO(payload))
+        return cls(arrays["terms"].tolist(), arrays["indptr"], arrays["gaps"])
+
+
+def get_or_build_search_index(
+    db: Session, content_hash: str, conversation: Optional[List[Message]] = None
+) -> Optional[SearchIndex]:
+    """
+    Load the persisted search index of a conversation, building and storing it from its
+    term matrix if missing.
+
+    Returns:
+        SearchIndex or None: None if the conversation does not exist
+    """
+    payload = load_artifact(db, content_hash, SEARCH_INDEX_KIND)
+    if payload is not None:
+        return SearchIndex.from_bytes(payload)
+
+    if conversation is None:
+        messages = load_stored_messages(db, content_hash)
+        if messages is None:
+            return None
+        conversation = [Message.model_validate(msg) for msg in messages]
+
+    logger.info(f"Building search index for {content_hash}")
+    index = SearchIndex.build(get_or_build_term_matrix(db, content_hash, conversation))
+    save_artifact(db, content_hash, SEARCH_INDEX_KIND, index.to_bytes())
+    return index
+
+
+def build_search_index(content_hash: str, conversation: List[Message]) -> None:
+    """Background task: index a freshly parsed conversation so its first search is fast"""
+    db = database.SessionLocal()
+    try:
+        get_or_build_search_index(db, content_hash, conversation)
+        get_or_build_message_index(db, content_hash)
+    except Exception as e:
+        logger.error(f"Error building search index for {content_hash}: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,280 @@
+from typing import Dict, Iterable, List
+import re
+import unicodedata
+import numpy as np
+from app.models.data_formats import AuthorSentiment, Message, SentimentTimeSeries
+from app.services.message_classifier import TEXT_KINDS
+
+# Valence of Portuguese and English words and expressions, from -3 (very negative) to 3
+VALENCE_LEXICON = {
+    # Portuguese
+    "amo": 3,
+    "amei": 3,
+    "adoro": 3,
+    "adorei": 3,
+    "maravilhoso": 3,
+    "maravilhosa": 3,
+    "perfeito": 3,
+    "perfeita": 3,
+    "incrível": 3,
+    "sensacional": 3,
+    "excelente": 3,
+    "ótimo": 2,
+    "ótima": 2,
+    "feliz": 2,
+    "felizes": 2,
+    "lindo": 2,
+    "linda": 2,
+    "massa": 2,
+    "top": 2,
+    "demais": 1,
+    "legal": 2,
+    "gostei": 2,
+    "gosto": 1,
+    "obrigado": 2,
+    "obrigada": 2,
+    "valeu": 2,
+    "parabéns": 3,
+    "saudade": 1,
+    "saudades": 1,
+    "bom": 1,
+    "boa": 1,
+    "bem": 1,
+    "beleza": 1,
+    "show": 2,
+    "tranquilo": 1,
+    "de boa": 1,
+    "certo": 1,
+    "sucesso": 2,
+    "alegria": 2,
+    "divertido": 2,
+    "engraçado": 1,
+    "fofo": 2,
+    "fofa": 2,
+    "querido": 2,
+    "querida": 2,
+    "amor": 2,
+    "feliz aniversário": 3,
+    "ruim": -2,
+    "péssimo": -3,
+    "péssima": -3,
+    "horrível": -3,
+    "odeio": -3,
+    "odiei": -3,
+    "triste": -2,
+    "tristeza": -2,
+    "chato": -2,
+    "chata": -2,
+    "chatice": -2,
+    "raiva": -2,
+    "puto": -2,
+    "puta": -2,
+    "irritado": -2,
+    "irritada": -2,
+    "cansado": -1,
+    "cansada": -1,
+    "preocupado": -1,
+    "preocupada": -1,
+    "medo": -2,
+    "problema": -1,
+    "problemas": -1,
+    "difícil": -1,
+    "pior": -2,
+    "mal": -2,
+    "doente": -2,
+    "dor": -2,
+    "saco": -1,
+    "droga": -2,
+    "merda": -2,
+    "desculpa": -1,
+    "infelizmente": -2,
+    "chorar": -2,
+    "chorando": -2,
+    "decepcionado": -2,
+    "decepcionada": -2,
+    "estressado": -2,
+    "estressada": -2,
+    # English
+    "love": 3,
+    "loved": 3,
+    "amazing": 3,
+    "awesome": 3,
+    "perfect": 3,
+    "wonderful": 3,
+    "excellent": 3,
+    "congratulations": 3,
+    "great": 2,
+    "happy": 2,
+    "glad": 2,
+    "beautiful": 2,
+    "cool": 1,
+    "nice": 2,
+    "fun": 2,
+    "funny": 1,
+    "thanks": 2,
+    "thank you": 2,
+    "good": 1,
+    "fine": 1,
+    "ok": 1,
+    "like": 1,
+    "miss you": 1,
+    "happy birthday": 3,
+    "bad": -2,
+    "terrible": -3,
+    "awful": -3,
+    "horrible": -3,
+    "hate": -3,
+    "sad": -2,
+    "angry": -2,
+    "annoying": -2,
+    "boring": -2,
+    "tired": -1,
+    "worried": -1,
+    "afraid": -2,
+    "problem": -1,
+    "sick": -2,
+    "worse": -2,
+    "worst": -3,
+    "sorry": -1,
+    "unfortunately": -2,
+    "disappointed": -2,
+    "stressed": -2,
+    "damn": -1,
+    "shit": -2,
+}
+
+# Preceding a lexicon entry, these flip its valence ("não gostei", "not bad")
+NEGATORS = ["não", "nao", "nunca", "jamais", "nem", "not", "never", "don't", "dont", "no"]
+
+# Laughter (kkkk, hahaha, rsrs, huehue) is mildly positive
+LAUGHTER_VALENCE = 1
+_LAUGHTER = r"k{3,}|(?:ha){2,}h?|(?:rs){2,}|(?:hue){2,}"
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(
+        ch for ch in unicodedata.normalize("NFD", text) if unicodedata.category(ch) != "Mn"
+    )
+
+
+def _with_unaccented(lexicon: Dict[str, float]) -> Dict[str, float]:
+    """Add the accentless spelling of every entry ("otimo" for "ótimo"), common in chats"""
+    expanded = dict(lexicon)
+    for term, valence in lexicon.items():
+        expanded.setdefault(_strip_accents(term), valence)
+    return expanded
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """
+    Regex alternation of terms factored by common prefixes, so the regex engine follows a
+    single branch per character instead of trying every term at every position
+    """
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def pattern(node: Dict) -> str:
+        optional = "" in node
+        branches = [re.escape(ch) + pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        alternation = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if optional:
+            return f"(?:{alternation})?"
+        return alternation
+
+    return pattern(trie)
+
+
+LEXICON = _with_unaccented(VALENCE_LEXICON)
+
+# Single pass matcher of every lexicon entry and laughter, with an optional negator before
+MATCHER = re.compile(
+    rf"(?<!\w)(?:(?P<negator>{_trie_pattern(NEGATORS)})\s+)?"
+    rf"(?:(?P<term>{_trie_pattern(LEXICON)})|(?P<laughter>{_LAUGHTER}))(?!\w)"
+)
+
+
+def score_message(content: str) -> float:
+    """Sum of the valences found in a message, NaN if no lexicon entry is found"""
+    score, found = 0.0, False
+    for match in MATCHER.finditer(content.lower()):
+        found = True
+        if match.lastgroup == "laughter":
+            valence = LAUGHTER_VALENCE
+        else:
+            valence = LEXICON[match.group("term")]
+        score += -valence if match.group("negator") else valence
+    return score if found else np.nan
+
+
+def score_messages(messages: List[Message]) -> np.ndarray:
+    """Score of every message, NaN for messages without text or lexicon entries"""
+    return np.fromiter(
+        (score_message(msg.content) if msg.kind in TEXT_KINDS else np.nan for msg in messages),
+        dtype=np.float64,
+        count=len(messages),
+    )
+
+
+def _means(sums: np.ndarray, counts: np.ndarray) -> List:
+    return [round(float(s / n), 4) if n else None for s, n in zip(sums, counts)]
+
+
+def calculate_sentiment(
+    authors: List[str],
+    message_authors: np.ndarray,
+    dates: np.ndarray,
+    scores: np.ndarray,
+) -> SentimentTimeSeries:
+    """
+    Weekly mean sentiment of the chat and of each author, grouping the scored messages
+    by (author, week) keys with bincount.
+
+    Args:
+        authors (list): Author names, indexed by author id
+        message_authors (np.ndarray): Author id of every message
+        dates (np.ndarray): datetime64 date of every message
+        scores (np.ndarray): Score of every message, NaN for unscored messages
+
+    Returns:
+        SentimentTimeSeries: Weeks start on Monday, weeks without scored messages are None
+    """
+    scored = ~np.isnan(scores)
+    codes = message_authors[scored].astype(np.int64)
+    values = scores[scored]
+    days = dates[scored].astype("datetime64[D]").astype(np.int64)
+    # 1970-01-01 was a Thursday, shifting by 3 days makes weeks start on Monday
+    weeks = (days + 3) // 7
+    if len(weeks) == 0:
+        return SentimentTimeSeries(weeks=[], weekly=[], by_author={})
+
+    first_week = int(weeks.min())
+    n_weeks = int(weeks.max()) - first_week + 1
+    keys = codes * n_weeks + (weeks - first_week)
+    size = len(authors) * n_weeks
+    sums = np.bincount(keys, weights=values, minlength=size).reshape(len(authors), n_weeks)
+    counts = np.bincount(keys, minlength=size).reshape(len(authors), n_weeks)
+    positive = np.bincount(codes, weights=values > 0, minlength=len(authors))
+    negative = np.bincount(codes, weights=values < 0, minlength=len(authors))
+    totals = counts.sum(axis=1)
+
+    week_starts = (np.arange(first_week, first_week + n_weeks) * 7 - 3).astype("datetime64[D]")
+    return SentimentTimeSeries(
+        weeks=[str(week) for week in week_starts],
+        weekly=_means(sums.sum(axis=0), counts.sum(axis=0)),
+        by_author={
+            authors[code]: AuthorSentiment(
+                weekly=_means(sums[code], counts[code]),
+                mean=round(float(sums[code].sum() / totals[code]), 4),
+                positive_share=round(float(positive[code] / totals[code]), 4),
+                negative_share=round(float(negative[code] / totals[code]), 4),
+            )
+            for code in np.argsort(-totals, kind="stable")
+            if totals[code]
+        },
+    )
@@ -0,0 +1,234 @@
+from typing import Dict, List, Optional
+import io
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.data_formats import SessionInitiators, SessionPage, SessionSummary
+from app.services.artifact_store import load_artifact, save_artifact
+from app.services.metric_state import SESSION_GAP_SECONDS
+from app.services.parsing_utils import load_stored_messages
+from app.utils.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+SESSION_INDEX_VERSION = 1
+
+# Orders of the session listing and the value each sorts on
+SESSION_SORT_KEYS = ("start", "length", "duration", "participants")
+
+
+# Only the index at the default gap is persisted. The gap is a client parameter, indexes
+# at other gaps are rebuilt when needed and kept a while in the process.
+SESSION_INDEX_KIND = f"session_index:v{SESSION_INDEX_VERSION}:{SESSION_GAP_SECONDS}"
+_other_gaps_cache = CacheManager(max_size=20, expiration_minutes=30)
+
+
+class SessionIndex:
+    """
+    Sessions of a conversation (runs of messages separated by gaps longer than
+    gap_seconds, as in calculate_conversation_parts) as columnar arrays: first and last
+    message offsets, start and end times, starting and ending author and participants.
+    """
+
+    def __init__(
+        self,
+        gap_seconds: int,
+        authors: List[str],
+        starts: np.ndarray,
+        ends: np.ndarray,
+        start_times: np.ndarray,
+        end_times: np.ndarray,
+        starters: np.ndarray,
+        enders: np.ndarray,
+        participant_indptr: np.ndarray,
+        participants: np.ndarray,
+    ):
+        self.gap_seconds = gap_seconds
+        self.authors = authors
+        # Session k is made of the messages starts[k] to ends[k] excluded
+        self.starts = starts
+        self.ends = ends
+        self.start_times = start_times
+        self.end_times = end_times
+        self.starters = starters
+        self.enders = enders
+        # Author codes of session k are participants[indptr[k]:indptr[k + 1]]
+        self.participant_indptr = participant_indptr
+        self.participants = participants
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def build(cls, messages: List[Dict], gap_seconds: int = SESSION_GAP_SECONDS) -> "SessionIndex":
+        """Build from stored message dicts (date as ISO string, author, content)"""
+        authors: Dict[str, int] = {}
+        codes = np.array(
+            [authors.setdefault(msg["author"], len(authors)) for msg in messages], dtype=np.int64
+        )
+        times = np.array([msg["date"] for msg in messages], dtype="datetime64[s]")
+
+        breaks = np.flatnonzero(np.diff(times).astype(np.int64) > gap_seconds) + 1
+        starts = np.concatenate(([0], breaks)).astype(np.int64)
+        ends = np.concatenate((breaks, [len(times)])).astype(np.int64)
+        if len(times) == 0:
+            starts = ends = np.empty(0, dtype=np.int64)
+
+        # Distinct (session, author) pairs, sorted by session, give the participants
+        sessions = np.repeat(np.arange(len(starts)), ends - starts)
+        pairs = np.unique(sessions * max(len(authors), 1) + codes)
+        participant_indptr = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(pairs // max(len(authors), 1), minlength=len(starts)),
+            out=participant_indptr[1:],
+        )
+
+        return cls(
+            gap_seconds,
+            list(authors),
+            starts,
+            ends,
+            times[starts],
+            times[ends - 1],
+            codes[starts].astype(np.int32),
+            codes[ends - 1].astype(np.int32),
+            participant_indptr,
+            (pairs % max(len(authors), 1)).astype(np.int32),
+        )
+
+    def lengths(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    def durations(self) -> np.ndarray:
+        return (self.end_times - self.start_times).astype(np.int64)
+
+    def participant_counts(self) -> np.ndarray:
+        return np.diff(self.participant_indptr)
+
+    def summary(self, k: int) -> SessionSummary:
+        codes = self.participants[self.participant_indptr[k] : self.participant_indptr[k + 1]]
+        return SessionSummary(
+            session_id=k,
+            start=self.start_times[k].item(),
+            end=self.end_times[k].item(),
+            message_count=int(self.ends[k] - self.starts[k]),
+            duration_seconds=int(self.durations()[k]),
+            participants=[self.authors[code] for code in codes],
+            started_by=self.authors[self.starters[k]],
+            ended_by=self.authors[self.enders[k]],
+            first_offset=int(self.starts[k]),
+            last_offset=int(self.ends[k]) - 1,
+        )
+
+    def page(
+        self, sort: str = "start", descending: bool = False, offset: int = 0, limit: int = 50
+    ) -> SessionPage:
+        """
+        Sessions sorted by start, length (messages), duration or participant count,
+        ties kept in chronological order
+        """
+        if sort not in SESSION_SORT_KEYS:
+            raise ValueError(
+                f"Unknown session sort: {sort}. Available: {', '.join(SESSION_SORT_KEYS)}"
+            )
+
+        keys = {
+            "start": lambda: np.arange(len(self)),
+            "length": self.lengths,
+            "duration": self.durations,
+            "participants": self.participant_counts,
+        }[sort]()
+        order = np.argsort(-keys if descending else keys, kind="stable")
+
+        return SessionPage(
+            sessions=[self.summary(int(k)) for k in order[offset : offset + limit]],
+            total=len(self),
+            gap_seconds=self.gap_seconds,
+        )
+
+    def initiators(self) -> SessionInitiators:
+        """How many sessions each author started and ended"""
+
+        def by_author(codes):
+            counts = np.bincount(codes, minlength=len(self.authors))
+            ranked = sorted(
+                ((self.authors[code], int(n)) for code, n in enumerate(counts) if n),
+                key=lambda x: x[1],
+                reverse=True,
+            )
+            return dict(ranked)
+
+        return SessionInitiators(
+            started=by_author(self.starters),
+            ended=by_author(self.enders),
+            total=len(self),
+            gap_seconds=self.gap_seconds,
+        )
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            gap_seconds=np.array(self.gap_seconds),
+            authors=np.array(self.authors, dtype=str),
+            starts=self.starts,
+            ends=self.ends,
+            start_times=self.start_times.astype(np.int64),
+            end_times=self.end_times.astype(np.int64),
+            starters=self.starters,
+            enders=self.enders,
+            participant_indptr=self.participant_indptr,
+            participants=self.participants,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "SessionIndex":
+        arrays = np.load(io.BytesIO(payload))
+        return cls(
+            int(arrays["gap_seconds"]),
+            arrays["authors"].tolist(),
+            arrays["starts"],
+            arrays["ends"],
+            arrays["start_times"].astype("datetime64[s]"),
+            arrays["end_times"].astype("datetime64[s]"),
+            arrays["starters"],
+            arrays["enders"],
+            arrays["participant_indptr"],
+            arrays["participants"],
+        )
+
+
+def get_or_build_session_index(
+    db: Session, content_hash: str, gap_seconds: int = SESSION_GAP_SECONDS
+) -> Optional[SessionIndex]:
+    """
+    Session index of a conversation for a gap threshold. At the default gap it is loaded
+    from storage, built and stored from the stored conversation if missing; at other gaps
+    it is built from the stored conversation and only cached in the process.
+
+    Returns:
+        SessionIndex or None: None if the conversation does not exist
+    """
+    persisted = gap_seconds == SESSION_GAP_SECONDS
+    if persisted:
+        payload = load_artifact(db, content_hash, SESSION_INDEX_KIND)
+        if payload is not None:
+            return SessionIndex.from_bytes(payload)
+    else:
+        cache_key = f"{content_hash}:{gap_seconds}"
+        index = _other_gaps_cache.get(cache_key)
+        if index is not None:
+            return index
+
+    messages = load_stored_messages(db, content_hash)
+    if messages is None:
+        return None
+
+    logger.info(f"Building session index for {content_hash} with a {gap_seconds}s gap")
+    index = SessionIndex.build(messages, gap_seconds)
+    if persisted:
+        save_artifact(db, content_hash, SESSION_INDEX_KIND, index.to_bytes())
+    else:
+        _other_gaps_cache.set(cache_key, index)
+    return index
@@ -0,0 +1,249 @@
+from typing import Dict, Hashable, Iterable, List, Tuple
+import base64
+import hashlib
+import heapq
+import math
+import numpy as np
+
+
+class SpaceSaving:
+    """
+    Streaming heavy hitters (Metwally et al. SpaceSaving) with at most `capacity` counters.
+
+    Every reported count overestimates the true count by at most total / capacity (and by
+    exactly errors[item] at most), and every item more frequent than total / capacity is
+    guaranteed to be kept. Exposes the subset of the Counter API used by the analyzers.
+    """
+
+    def __init__(self, capacity: int = 10_000):
+        if capacity < 1:
+            raise ValueError("SpaceSaving capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        # Lazy min-heap of (count, item), entries are stale when the count has changed
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    @classmethod
+    def for_error(cls, epsilon: float) -> "SpaceSaving":
+        """Sketch whose counts are off by at most epsilon * total"""
+        return cls(capacity=math.ceil(1 / epsilon))
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            # Replace the least frequent item, inheriting its count as error
+            min_count, min_item = self._pop_min()
+            del self.counts[min_item]
+            del self.errors[min_item]
+            self.counts[item] = min_count + count
+            self.errors[item] = min_count
+
+        self._push(item)
+
+    def update(self, items: Iterable[Hashable]) -> None:
+        """Count every item of an iterable, like Counter.update"""
+        for item in items:
+            self.add(item)
+
+    def _push(self, item: Hashable) -> None:
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[int, Hashable]:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def min_count(self) -> int:
+        """Smallest tracked count when the sketch is full, 0 otherwise"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def items(self):
+        return self.counts.items()
+
+    def most_common(self, n: int = None) -> List[Tuple[Hashable, int]]:
+        ordered = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+        return ordered if n is None else ordered[:n]
+
+    def guaranteed_count(self, item: Hashable) -> int:
+        """Lower bound of the true count of an item"""
+        return self.counts.get(item, 0) - self.errors.get(item, 0)
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """
+        Merge another sketch (Agarwal et al. mergeable summaries): items missing from one
+        side are assumed to have that side's minimum count, then the top counters are kept.
+        The error bound of the result is (total + other.total) / capacity.
+        """
+        own_min, other_min = self.min_count(), other.min_count()
+        counts, errors = {}, {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, own_min) + other.counts.get(item, other_min)
+            errors[item] = self.errors.get(item, own_min) + other.errors.get(item, other_min)
+
+        kept = heapq.nlargest(self.capacity, counts.items(), key=lambda x: (x[1], x[0]))
+        self.counts = {item: count for item, count in kept}
+        self.errors = {item: errors[item] for item in self.counts}
+        self.total += other.total
+        self._rebuild_heap()
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "counts": self.counts,
+            "errors": self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SpaceSaving":
+        sketch = cls(capacity=data["capacity"])
+        sketch.total = data["total"]
+        sketch.counts = dict(data["counts"])
+        sketch.errors = dict(data["errors"])
+        sketch._rebuild_heap()
+        return sketch
+
+
+def stable_hash(item: str) -> int:
+    """64 bit hash that, unlike hash(), is the same across processes and can be persisted"""
+    return int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Mergeable distinct count sketch (Flajolet et al.) of 2**precision one byte registers.
+    The relative standard error is about 1.04 / sqrt(2**precision), e.g. 1.6% for 4 KB.
+    """
+
+    def __init__(self, precision: int = 12):
+        # Precision >= 11 keeps the hash bits used for ranks exact as float64
+        if not 11 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 11 and 18")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, items: Iterable[str]) -> None:
+        """Add every item of an iterable"""
+        self.add_hashes(np.fromiter((stable_hash(item) for item in items), dtype=np.uint64))
+
+    def add(self, item: str) -> None:
+        self.update([item])
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        if len(hashes) == 0:
+            return
+        remaining_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << remaining_bits) - 1)
+        # Rank is the position of the first set bit of the remaining bits
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        ranks = (remaining_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate for small cardinalities
+        if estimate <= 2.5 * m and empty:
+            estimate = m * math.log(m / empty)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precisions")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def memory_bytes(self) -> int:
+        return self.registers.nbytes
+
+    def to_dict(self) -> dict:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(self.registers.tobytes()).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        sketch = cls(precision=data["precision"])
+        sketch.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return sketch
+
+
+class DistinctSample:
+    """
+    Exact counts of the `size` distinct items with the smallest hashes (a bottom-k sample).
+    The sample is a uniform sample of the distinct items, so the share of items with a
+    given count (e.g. used only once) estimates that share over all distinct items.
+    Merging keeps exact counts, since an item kept overall is kept by every side seeing it.
+    """
+
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.counts: Dict[str, int] = {}
+        self.hashes: Dict[str, int] = {}
+        # Max-heap (negated hashes) of the sampled items
+        self._heap: List[Tuple[int, str]] = []
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def add(self, item: str, count: int = 1, item_hash: int = None) -> None:
+        if item in self.counts:
+            self.counts[item] += count
+            return
+
+        item_hash = stable_hash(item) if item_hash is None else item_hash
+        if len(self.counts) < self.size:
+            self._insert(item, item_hash, count)
+        elif item_hash < -self._heap[0][0]:
+            _, evicted = heapq.heappop(self._heap)
+            del self.counts[evicted]
+            del self.hashes[evicted]
+            self._insert(item, item_hash, count)
+
+    def _insert(self, item: str, item_hash: int, count: int) -> None:
+        self.counts[item] = count
+        self.hashes[item] = item_hash
+        heapq.heappush(self._heap, (-item_hash, item))
+
+    def fraction(self, predicate) -> float:
+        """Share of the sampled distinct items whose count satisfies predicate"""
+        if not self.counts:
+            return 0.0
+        return sum(1 for count in self.counts.values() if predicate(count)) / len(self.counts)
+
+    def merge(self, other: "DistinctSample") -> "DistinctSample":
+        for item, count in other.counts.items():
+            self.add(item, count, other.hashes[item])
+        return self
+
+    def to_dict(self) -> dict:
+        return {"size": self.size, "counts": self.counts, "hashes": self.hashes}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DistinctSample":
+        sample = cls(size=data["size"])
+        for item, count in data["counts"].items():
+            sample._insert(item, data["hashes"][item], count)
+        return sample
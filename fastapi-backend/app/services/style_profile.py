@@ -0,0 +1,148 @@
+from collections import Counter
+from typing import Dict, List, Optional
+import logging
+import re
+import numpy as np
+from sqlalchemy.orm import Session
+from app import database
+from app.models.data_formats import AuthorStyle, Message
+from app.services.artifact_store import (
+    artifact_exists,
+    load_json_artifact,
+    save_json_artifact,
+)
+from app.services.chatgpt_utils import STYLE_EXAMPLES
+from app.services.message_classifier import TEXT_KINDS, scan_message
+from app.services.parsing_utils import load_stored_messages
+from app.services.phrase_mining import calculate_phrase_stats
+from app.utils.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+STYLE_PROFILE_VERSION = 1
+STYLE_PROFILE_KIND = f"style_profile:v{STYLE_PROFILE_VERSION}"
+
+# Examples are chosen among the latest messages of an author, the style of the
+# beginning of a long chat is often outdated
+RECENT_CANDIDATES = 500
+TOP_EMOJIS = 5
+COMMON_PHRASES = 5
+
+_WORD = re.compile(r"\w+")
+
+# Profiles of the conversations simulated lately, by content hash
+_profiles_cache = CacheManager(max_size=100, expiration_minutes=30)
+
+
+def _jaccard_distances(words: set, others: List[set]) -> np.ndarray:
+    return np.array(
+        [1 - len(words & other) / len(words | other) if words | other else 0.0 for other in others]
+    )
+
+
+def choose_examples(texts: List[str], n: int = STYLE_EXAMPLES) -> List[str]:
+    """
+    Representative and varied messages of an author: among their recent distinct messages
+    of a typical length (between the 10th and 90th percentiles), the one closest to the
+    median length, then greedily the one sharing the fewest words with those already chosen.
+
+    Returns:
+        list: At most n messages, in chat order
+    """
+    candidates = list(dict.fromkeys(texts[-RECENT_CANDIDATES:]))
+    if len(candidates) <= n:
+        return candidates
+
+    lengths = np.array([len(text) for text in candidates])
+    low, median, high = np.percentile(lengths, [10, 50, 90])
+    typical = np.flatnonzero((lengths >= low) & (lengths <= high))
+    if len(typical) < n:
+        typical = np.arange(len(candidates))
+
+    words = [set(_WORD.findall(candidates[i].lower())) for i in typical]
+    chosen = [int(np.argmin(np.abs(lengths[typical] - median)))]
+    distances = _jaccard_distances(words[chosen[0]], words)
+    while len(chosen) < n:
+        distances[chosen] = -1
+        best = int(np.argmax(distances))
+        chosen.append(best)
+        distances = np.minimum(distances, _jaccard_distances(words[best], words))
+    return [candidates[typical[i]] for i in sorted(chosen)]
+
+
+def build_style_profiles(conversation: List[Message]) -> Dict[str, AuthorStyle]:
+    """Writing style of every author of the text messages, in one pass over the chat"""
+    texts: Dict[str, List[str]] = {}
+    emojis: Dict[str, Counter] = {}
+    for msg in conversation:
+        if msg.kind in TEXT_KINDS:
+            texts.setdefault(msg.author, []).append(msg.content)
+            emojis.setdefault(msg.author, Counter()).update(scan_message(msg.content)[0])
+
+    phrases = calculate_phrase_stats(
+        conversation, top_n_by_author=COMMON_PHRASES
+    ).top_phrases_by_author
+
+    return {
+        author: AuthorStyle(
+            messages=len(author_texts),
+            examples=choose_examples(author_texts),
+            average_length=round(float(np.mean([len(text) for text in author_texts])), 1),
+            emoji_rate=round(sum(emojis[author].values()) / len(author_texts), 2),
+            top_emojis=[emoji for emoji, _ in emojis[author].most_common(TOP_EMOJIS)],
+            common_phrases=list(phrases.get(author, {})),
+        )
+        for author, author_texts in texts.items()
+    }
+
+
+def get_or_build_style_profiles(
+    db: Session, content_hash: str, conversation: Optional[List[Message]] = None
+) -> Optional[Dict[str, AuthorStyle]]:
+    """
+    Style profiles of a conversation, from the process cache or the persisted artifact,
+    building and storing them from the conversation (loaded if not given) if missing.
+
+    Returns:
+        dict or None: Profiles by author, None if the conversation does not exist
+    """
+    profiles = _profiles_cache.get(content_hash)
+    if profiles is not None:
+        return profiles
+
+    stored = load_json_artifact(db, content_hash, STYLE_PROFILE_KIND)
+    if stored is not None:
+        profiles = {author: AuthorStyle.model_validate(style) for author, style in stored.items()}
+    else:
+        if conversation is None:
+            messages = load_stored_messages(db, content_hash)
+            if messages is None:
+                return None
+            conversation = [Message.model_validate(msg) for msg in messages]
+
+        logger.info(f"Building style profiles for {content_hash}")
+        profiles = build_style_profiles(conversation)
+        save_json_artifact(
+            db,
+            content_hash,
+            STYLE_PROFILE_KIND,
+            {author: style.model_dump() for author, style in profiles.items()},
+        )
+
+    _profiles_cache.set(content_hash, profiles)
+    return profiles
+
+
+def build_style_profiles_in_background(content_hash: str, conversation: List[Message]) -> None:
+    """Background task: profile the authors of a freshly parsed conversation"""
+    if _profiles_cache.get(content_hash) is not None:
+        return
+    db = database.SessionLocal()
+    try:
+        # Already built for an earlier upload of the same chat, or by a simulation request
+        if not artifact_exists(db, content_hash, STYLE_PROFILE_KIND):
+            get_or_build_style_profiles(db, content_hash, conversation)
+    except Exception as e:
+        logger.error(f"Error building style profiles for {content_hash}: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,216 @@
+from typing import Dict, List, Tuple
+import io
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.data_formats import Message, SliceWords, WordFrequencies
+from app.services.artifact_store import load_artifact, save_artifact
+from app.services.text_analyzer import message_words
+
+logger = logging.getLogger(__name__)
+
+TERM_MATRIX_KIND = "term_matrix:v2"
+
+
+class CSRMatrix:
+    """Minimal compressed sparse row matrix of counts on top of numpy arrays"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = tuple(shape)
+        self._document_frequency = None
+
+    @classmethod
+    def from_coo(cls, rows: np.ndarray, cols: np.ndarray, values: np.ndarray, shape):
+        """Build from (row, col, value) triplets, summing duplicated cells"""
+        n_rows, n_cols = shape
+        keys = rows.astype(np.int64) * n_cols + cols.astype(np.int64)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        data = np.bincount(inverse, weights=values, minlength=len(unique_keys)).astype(np.int64)
+        row_of_key = unique_keys // n_cols
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_of_key, minlength=n_rows), out=indptr[1:])
+        return cls(indptr, (unique_keys % n_cols).astype(np.int32), data, shape)
+
+    def row_ids(self) -> np.ndarray:
+        """Row of every stored value"""
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def group_rows(self, groups: np.ndarray, n_groups: int) -> "CSRMatrix":
+        """Sum rows into n_groups rows, groups[i] being the new row of row i"""
+        return CSRMatrix.from_coo(
+            groups[self.row_ids()], self.indices, self.data, (n_groups, self.shape[1])
+        )
+
+    def row(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_sums(self) -> np.ndarray:
+        return np.bincount(self.row_ids(), weights=self.data, minlength=self.shape[0])
+
+    def column_sums(self) -> np.ndarray:
+        return np.bincount(self.indices, weights=self.data, minlength=self.shape[1])
+
+    def document_frequency(self) -> np.ndarray:
+        """Number of rows each column appears in"""
+        if self._document_frequency is None:
+            self._document_frequency = np.bincount(self.indices, minlength=self.shape[1])
+        return self._document_frequency
+
+
+class TermMatrix:
+    """
+    Conversation tokenized once into a message x term count matrix, with author x term and
+    month x term views derived by summing rows. Any slice's top words, distinctive words or
+    vocabulary size is then an operation on one row.
+    """
+
+    def __init__(
+        self,
+        vocabulary: List[str],
+        messages: CSRMatrix,
+        authors: List[str],
+        message_authors: np.ndarray,
+        months: List[str],
+        message_months: np.ndarray,
+    ):
+        self.vocabulary = vocabulary
+        self.messages = messages
+        self.authors = authors
+        self.message_authors = message_authors
+        self.months = months
+        self.message_months = message_months
+        self._views: Dict[str, CSRMatrix] = {}
+        # Alphabetical position of every term, to break count ties like top_words does
+        self._alphabetical_rank = np.empty(len(vocabulary), dtype=np.int64)
+        self._alphabetical_rank[np.argsort(np.array(vocabulary, dtype=str))] = np.arange(
+            len(vocabulary)
+        )
+
+    @classmethod
+    def build(cls, conversation: List[Message]) -> "TermMatrix":
+        vocabulary: Dict[str, int] = {}
+        authors: Dict[str, int] = {}
+        months: Dict[str, int] = {}
+        rows, cols = [], []
+        message_authors = np.empty(len(conversation), dtype=np.int32)
+        message_months = np.empty(len(conversation), dtype=np.int32)
+
+        for i, msg in enumerate(conversation):
+            message_authors[i] = authors.setdefault(msg.author, len(authors))
+            message_months[i] = months.setdefault(msg.date.strftime("%Y-%m"), len(months))
+            for word in message_words(msg):
+                rows.append(i)
+                cols.append(vocabulary.setdefault(word, len(vocabulary)))
+
+        messages = CSRMatrix.from_coo(
+            np.array(rows, dtype=np.int64),
+            np.array(cols, dtype=np.int64),
+            np.ones(len(rows), dtype=np.int64),
+            (len(conversation), len(vocabulary)),
+        )
+        return cls(
+            list(vocabulary), messages, list(authors), message_authors, list(months), message_months
+        )
+
+    def view(self, by: str) -> Tuple[List[str], CSRMatrix]:
+        """Slice names and slice x term matrix, by "author" or "month" """
+        if by == "author":
+            names, groups = self.authors, self.message_authors
+        elif by == "month":
+            names, groups = self.months, self.message_months
+        else:
+            raise ValueError(f"Unknown term matrix view: {by}")
+
+        if by not in self._views:
+            self._views[by] = self.messages.group_rows(groups, len(names))
+        return names, self._views[by]
+
+    def top_terms(self, matrix: CSRMatrix, row: int, top_n: int = 20) -> Dict[str, int]:
+        indices, data = matrix.row(row)
+        order = np.lexsort((self._alphabetical_rank[indices], -data))[:top_n]
+        return {self.vocabulary[indices[k]]: int(data[k]) for k in order}
+
+    def distinctive_terms(self, matrix: CSRMatrix, row: int, top_n: int = 10) -> Dict[str, float]:
+        """
+        Terms with the highest TF-IDF of this slice, the other slices being the corpus.
+        Terms used in every slice have a zero IDF and are never distinctive.
+        """
+        indices, data = matrix.row(row)
+        idf = np.log(matrix.shape[0] / matrix.document_frequency()[indices])
+        scores = data / max(data.sum(), 1) * idf
+
+        order = np.lexsort((self._alphabetical_rank[indices], -scores))[:top_n]
+        order = order[scores[order] > 0]
+        return {self.vocabulary[indices[k]]: round(float(scores[k]), 4) for k in order}
+
+    def slice_words(self, by: str, top_n: int = 20, distinctive_n: int = 10):
+        names, matrix = self.view(by)
+        return {
+            name: SliceWords(
+                top_words=self.top_terms(matrix, row, top_n),
+                distinctive_words=self.distinctive_terms(matrix, row, distinctive_n),
+                vocabulary_size=int(matrix.indptr[row + 1] - matrix.indptr[row]),
+                word_count=int(matrix.row(row)[1].sum()),
+            )
+            for row, name in enumerate(names)
+        }
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            vocabulary=np.array(self.vocabulary, dtype=str),
+            indptr=self.messages.indptr,
+            indices=self.messages.indices,
+            data=self.messages.data,
+            authors=np.array(self.authors, dtype=str),
+            message_authors=self.message_authors,
+            months=np.array(self.months, dtype=str),
+            message_months=self.message_months,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "TermMatrix":
+        arrays = np.load(io.BytesIO(payload))
+        vocabulary = arrays["vocabulary"].tolist()
+        messages = CSRMatrix(
+            arrays["indptr"],
+            arrays["indices"],
+            arrays["data"],
+            (len(arrays["message_authors"]), len(vocabulary)),
+        )
+        return cls(
+            vocabulary,
+            messages,
+            arrays["authors"].tolist(),
+            arrays["message_authors"],
+            arrays["months"].tolist(),
+            arrays["message_months"],
+        )
+
+
+def get_or_build_term_matrix(
+    db: Session, content_hash: str, conversation: List[Message]
+) -> TermMatrix:
+    """Load the persisted term matrix of a conversation, building and storing it if missing"""
+    payload = load_artifact(db, content_hash, TERM_MATRIX_KIND)
+    if payload is not None:
+        return TermMatrix.from_bytes(payload)
+
+    logger.info(f"Building term matrix for {content_hash}")
+    term_matrix = TermMatrix.build(conversation)
+    save_artifact(db, content_hash, TERM_MATRIX_KIND, term_matrix.to_bytes())
+    return term_matrix
+
+
+def calculate_word_frequencies(term_matrix: TermMatrix) -> WordFrequencies:
+    """Per author and per month top words, distinctive words and vocabulary sizes"""
+    return WordFrequencies(
+        by_author=term_matrix.slice_words("author"),
+        by_month=term_matrix.slice_words("month"),
+    )
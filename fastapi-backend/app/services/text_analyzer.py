@@ -1,8 +1,8 @@
-from collections import Counter, defaultdict
-from typing import List, Dict
+from collections import Counter
+from typing import List, Dict, Tuple
+import heapq
 import nltk
 from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
 import numpy as np
 import re
 from app.models.data_formats import (
@@ -13,6 +13,8 @@ from app.models.data_formats import (
     PeriodStats,
     Message,
 )
+from app.services.sketches import SpaceSaving
+from app.services.message_classifier import TEXT_KINDS
 from datetime import datetime
 
 # Download required NLTK data
@@ -26,6 +28,13 @@ stop_words = set(stopwords.words("portuguese"))
 # Add custom stop words
 custom_stop_words = {"pra", "tá", "q", "tb", "né", "tô", "ta", "to", "mídia", "oculta"}
 stop_words.update(custom_stop_words)
+# Above this many messages the vocabulary is counted with a bounded-memory sketch
+EXACT_WORD_COUNT_MAX_MESSAGES = 200_000
+# Sketch counters, counts are off by at most 1/10000 of all counted words
+TOP_WORDS_SKETCH_CAPACITY = 10_000
+# Above this many counted words vocabulary richness is estimated with HyperLogLog sketches
+EXACT_VOCABULARY_MAX_TOKENS = 2_000_000
+
 curse_words = {
     "porra",
     "caralho",
@@ -53,10 +62,11 @@ def create_messages_heatmap(dates) -> HeatmapData:
         matrix[weekday][week] += 1
         dates_matrix[weekday][week] = date.strftime("%d/%m/%Y")
 
-    # Initialize vmin and vmax
-    vmin = 0
-    vmax = 0
+    return heatmap_from_matrix(matrix, dates_matrix)
+
 
+def heatmap_from_matrix(matrix, dates_matrix) -> HeatmapData:
+    """Build the heatmap response from 7x53 message counts and their date labels"""
     # Normalize values
     all_values = [v for row in matrix for v in row if v > 0]
     vmin = float(np.percentile(all_values, 5))
@@ -82,6 +92,34 @@ def calculate_conversation_stats(conversation, author_and_messages):
         conversation_lenghts,
     ) = calculate_conversation_parts(conversation)
 
+    return conversation_stats_from_counts(
+        total_messages=len(conversation),
+        participant_count=len(author_and_messages.keys()),
+        weekday_counts=weekday_counts,
+        week_counts=week_counts,
+        month_counts=month_counts,
+        conversation_lenghts=conversation_lenghts,
+        longest_conversation=(
+            len(max_conversation),
+            max_conversation[0].date,
+            max_conversation[-1].date,
+        ),
+    )
+
+
+def conversation_stats_from_counts(
+    total_messages: int,
+    participant_count: int,
+    weekday_counts: Dict[int, int],
+    week_counts: Dict[int, int],
+    month_counts: Dict[int, int],
+    conversation_lenghts: List[int],
+    longest_conversation: Tuple[int, datetime, datetime],
+) -> ConversationStats:
+    """
+    Build the conversation stats from period counts and conversation (session) lengths.
+    longest_conversation is (length, start date, end date).
+    """
     # Calculate average
     avg_length = sum(conversation_lenghts) / len(conversation_lenghts)
 
@@ -95,13 +133,15 @@ def calculate_conversation_stats(conversation, author_and_messages):
     month_most = max(month_counts.items(), key=lambda x: x[1])
     month_least = min(month_counts.items(), key=lambda x: x[1])
 
+    longest_length, longest_start, longest_end = longest_conversation
+
     return ConversationStats(
-        total_messages=len(conversation),
-        participant_count=len(author_and_messages.keys()),
+        total_messages=total_messages,
+        participant_count=participant_count,
         average_length=round(avg_length, 2),
-        longest_conversation_length=len(max_conversation),
-        longest_conversation_start=max_conversation[0].date,
-        longest_conversation_end=max_conversation[-1].date,
+        longest_conversation_length=longest_length,
+        longest_conversation_start=longest_start,
+        longest_conversation_end=longest_end,
         most_active_weekday=PeriodStats(period=weekday_most[0], count=weekday_most[1]),
         least_active_weekday=PeriodStats(period=weekday_least[0], count=weekday_least[1]),
         most_active_week=PeriodStats(period=week_most[0], count=week_most[1]),
@@ -136,7 +176,11 @@ def calculate_conversation_parts(conversation: List[Message], time_threshold=30
             current_conversation = []
 
     # Handle last message
-    current_conversation.append(conversation[-1])
+    last_message = conversation[-1]
+    current_conversation.append(last_message)
+    weekday_counts[last_message.date.weekday()] += 1
+    week_counts[last_message.date.isocalendar()[1] - 1] += 1
+    month_counts[last_message.date.month] += 1
     conversation_lenghts.append(len(current_conversation))
     if len(current_conversation) > len(max_conversation):
         max_conversation = current_conversation.copy()
@@ -150,34 +194,69 @@ def calculate_conversation_parts(conversation: List[Message], time_threshold=30
     )
 
 
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def tokenize_text(text: str) -> List[str]:
+    """
+    Words of a text as every word analysis counts them (common words, term matrix,
+    search, phrases): punctuation removed ("foda-se" is "fodase"), split on whitespace
+    """
+    return _NON_WORD.sub("", text).split()
+
+
 # Function to clean and tokenize text
 def process_text(text):
-    # Convert to lowercase and remove special characters
-    text = re.sub(r"[^\w\s]", "", text)
+    # Remove special characters, then stop words
+    return [word for word in tokenize_text(text) if word not in stop_words]
 
-    # Tokenize
-    words = word_tokenize(text)
 
-    # Remove stop words and short words
-    words = [word for word in words if word not in stop_words]
+def message_words(msg: Message) -> List[str]:
+    """Processed words of a message, none for media, sticker and deleted placeholders"""
+    if msg.kind not in TEXT_KINDS:
+        return []
+    return process_text(msg.content)
 
-    return words
 
+def get_most_common_words(
+    author_and_messages,
+    top_n=20,
+    max_exact_messages=EXACT_WORD_COUNT_MAX_MESSAGES,
+    sketch_capacity=TOP_WORDS_SKETCH_CAPACITY,
+):
+    """
+    Most common words of the conversation.
+    Chats with up to max_exact_messages messages are counted exactly, larger ones with a
+    bounded-memory SpaceSaving sketch of sketch_capacity counters.
+    """
+    message_count = sum(
+        len(messages) for author, messages in author_and_messages.items() if author is not None
+    )
+    word_counts = new_word_counter(message_count, max_exact_messages, sketch_capacity)
 
-def get_most_common_words(author_and_messages, top_n=20):
-    # Process all messages
-    all_words = []
+    # Count word frequencies, streaming so no list of all words is built
     for author, messages in author_and_messages.items():
         if author is not None:  # Skip None author
             for msg in messages:
-                words = process_text(msg.content)
-                all_words.extend(words)
+                word_counts.update(message_words(msg))
+
+    return top_words(word_counts, top_n)
 
-    # Count word frequencies
-    word_counts = Counter(all_words)
 
-    # Get the most common words
-    most_common = word_counts.most_common(top_n)
+def new_word_counter(
+    message_count,
+    max_exact_messages=EXACT_WORD_COUNT_MAX_MESSAGES,
+    sketch_capacity=TOP_WORDS_SKETCH_CAPACITY,
+):
+    """Exact Counter for small chats, SpaceSaving sketch above the crossover size"""
+    if message_count <= max_exact_messages:
+        return Counter()
+    return SpaceSaving(capacity=sketch_capacity)
+
+
+def top_words(word_counts, top_n=20) -> Dict[str, int]:
+    """Most common words, ties broken alphabetically so the result doesn't depend on order"""
+    most_common = heapq.nsmallest(top_n, word_counts.items(), key=lambda x: (-x[1], x[0]))
     return {word: count for word, count in most_common}
 
 
@@ -189,27 +268,74 @@ def get_word_metrics(author_and_messages):
 
     messages_per_author = {}
     message_lengths = {}
-    curse_words_count = {}
-    curse_words_by_author = defaultdict(Counter)
-    curse_words_frequency = Counter()
+    curse_words_by_author = {}
+    author_words = {}
+    month_words = {}
 
     # Calculate all metrics in a single loop
     for author, messages in author_and_messages.items():
         if author is not None:
             # Message count and length calculations
             messages_per_author[author] = len(messages)
-            total_length = sum(len(msg.content) for msg in messages)
-            message_lengths[author] = total_length / len(messages)
+            message_lengths[author] = sum(len(msg.content) for msg in messages)
 
             # curse_words calculations
-            curse_words_count[author] = 0
+            curse_words_by_author[author] = count_curse_words(messages)
+
+            # vocabulary calculations
+            author_words[author] = Counter()
             for msg in messages:
-                for word in curse_words:
-                    count = msg.content.count(word)
-                    if count > 0:
-                        curse_words_count[author] += count
-                        curse_words_by_author[author][word] += count
-                        curse_words_frequency[word] += count
+                words = message_words(msg)
+                author_words[author].update(words)
+                month_words.setdefault(msg.date.strftime("%Y-%m"), set()).update(words)
+
+    vocabulary = vocabulary_richness_from_counts(
+        vocabulary_size={author: len(words) for author, words in author_words.items()},
+        hapax_legomena={
+            author: sum(1 for count in words.values() if count == 1)
+            for author, words in author_words.items()
+        },
+        tokens_per_author={author: sum(words.values()) for author, words in author_words.items()},
+        distinct_words_per_month={month: len(words) for month, words in month_words.items()},
+    )
+
+    return word_metrics_from_counts(
+        messages_per_author, message_lengths, curse_words_by_author, vocabulary
+    )
+
+
+def count_curse_words(messages: List[Message]) -> Counter:
+    """Count curse word occurrences in a list of messages"""
+    counts = Counter()
+    for msg in messages:
+        for word in curse_words:
+            count = msg.content.count(word)
+            if count > 0:
+                counts[word] += count
+    return counts
+
+
+def word_metrics_from_counts(
+    messages_per_author: Dict[str, int],
+    total_length_per_author: Dict[str, int],
+    curse_words_by_author: Dict[str, Counter],
+    vocabulary: Dict[str, Dict] = None,
+) -> WordMetrics:
+    """
+    Build the word metrics from per author message counts, text lengths and curse words.
+    vocabulary holds the fields built by vocabulary_richness_from_counts.
+    """
+    message_lengths = {
+        author: total_length_per_author[author] / count
+        for author, count in messages_per_author.items()
+    }
+    curse_words_count = {
+        author: sum(curse_words_by_author.get(author, Counter()).values())
+        for author in messages_per_author
+    }
+    curse_words_frequency = Counter()
+    for counts in curse_words_by_author.values():
+        curse_words_frequency.update(counts)
 
     # Sort results
     message_lengths = dict(sorted(message_lengths.items(), key=lambda x: x[1], reverse=True))
@@ -220,11 +346,41 @@ def get_word_metrics(author_and_messages):
         messages_per_author=sorted_messages,
         average_message_length=message_lengths,
         curse_words_per_author=sorted_curse_words,
-        curse_words_by_author=dict(curse_words_by_author),
+        curse_words_by_author={
+            author: dict(counts) for author, counts in curse_words_by_author.items() if counts
+        },
         curse_words_frequency=dict(curse_words_frequency.most_common()),
+        **(vocabulary or {}),
     )
 
 
+def vocabulary_richness_from_counts(
+    vocabulary_size: Dict[str, int],
+    hapax_legomena: Dict[str, int],
+    tokens_per_author: Dict[str, int],
+    distinct_words_per_month: Dict[str, int],
+) -> Dict[str, Dict]:
+    """
+    Vocabulary fields of the word metrics: distinct words, type-token ratio and words used
+    only once per author, distinct words per "YYYY-MM" month
+    """
+
+    def by_value(values):
+        return dict(sorted(values.items(), key=lambda x: x[1], reverse=True))
+
+    type_token_ratio = {
+        author: round(size / tokens_per_author[author], 4) if tokens_per_author[author] else 0.0
+        for author, size in vocabulary_size.items()
+    }
+
+    return {
+        "vocabulary_size": by_value(vocabulary_size),
+        "type_token_ratio": by_value(type_token_ratio),
+        "hapax_legomena": by_value(hapax_legomena),
+        "distinct_words_per_month": dict(sorted(distinct_words_per_month.items())),
+    }
+
+
 def calculate_all_metrics(
     dates: List[datetime],
     author_and_messages: Dict,
@@ -0,0 +1,275 @@
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
+import numpy as np
+from app.core.config import get_settings
+from app.models.data_formats import Message
+from app.services.chatgpt_utils import (
+    PROMPT_TOKEN_BUFFER,
+    context_limit,
+    count_message_tokens,
+    count_tokens,
+    detect_language,
+    format_conversation_within_token_limit,
+    parse_themes_response,
+    truncate_to_tokens,
+)
+from app.services.openai_client import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+# Bump when the map or reduce prompts change, so cached answers are not reused
+MAP_REDUCE_PROMPT_VERSION = 1
+
+# Chunk size in tokens, smaller than most contexts so chunks run in parallel
+MAP_CHUNK_TOKENS = 8000
+# Chunks beyond this are skipped, evenly over the chat, to bound the cost
+MAX_MAP_CHUNKS = 24
+MAP_OUTPUT_TOKENS = 600
+REDUCE_OUTPUT_TOKENS = 1000
+
+_JSON_FORMAT = '{"themes": [{"theme": "...", "examples": ["author: message"]}]}'
+
+MAP_PROMPTS = {
+    "pt": (
+        "Analise o seguinte trecho de uma conversa do WhatsApp e liste os 3 a 5 principais temas.\n"
+        "Para cada tema, cite uma ou duas mensagens do trecho como exemplo.\n"
+        f"Retorne a resposta em JSON no formato {_JSON_FORMAT}."
+    ),
+    "en": (
+        "Analyze the following excerpt of a WhatsApp conversation and list its 3 to 5 main "
+        "themes.\n"
+        "For each theme, quote one or two messages of the excerpt as examples.\n"
+        f"Return the response as JSON in the format {_JSON_FORMAT}."
+    ),
+}
+
+REDUCE_PROMPTS = {
+    "pt": (
+        "Os temas abaixo foram extraídos de trechos diferentes da mesma conversa do WhatsApp.\n"
+        "Junte os temas repetidos ou parecidos e liste os 5 à 9 principais temas da conversa "
+        "inteira, mantendo os exemplos mais representativos.\n"
+        f"Retorne a resposta em JSON no formato {_JSON_FORMAT}."
+    ),
+    "en": (
+        "The themes below were extracted from different excerpts of the same WhatsApp "
+        "conversation.\n"
+        "Merge the repeated or similar themes and list the 5 to 9 main themes of the whole "
+        "conversation, keeping the most representative examples.\n"
+        f"Return the response as JSON in the format {_JSON_FORMAT}."
+    ),
+}
+
+
+class TokenBudget:
+    """
+    Token bucket for a tokens-per-minute limit: calls wait until the tokens they will
+    spend have been refilled. Check and spend happen without awaiting in between, so
+    concurrent callers never overspend.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60
+        self.available = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until tokens can be spent, a call above the whole budget waits for a full one"""
+        tokens = min(float(tokens), self.capacity)
+        self._refill()
+        while self.available < tokens:
+            await self._sleep((tokens - self.available) / self.rate)
+            self._refill()
+        self.available -= tokens
+
+
+_budget: Optional[TokenBudget] = None
+
+
+def get_token_budget() -> TokenBudget:
+    """The process-wide budget of LLM_TOKENS_PER_MINUTE, shared by all requests"""
+    global _budget
+    if _budget is None:
+        _budget = TokenBudget(get_settings().LLM_TOKENS_PER_MINUTE)
+    return _budget
+
+
+def chunk_boundaries(
+    token_counts: np.ndarray, session_starts: np.ndarray, max_tokens: int
+) -> List[Tuple[int, int]]:
+    """
+    Split messages into consecutive chunks of at most max_tokens (one more per message for
+    its newline). Whole sessions are kept together when they fit, longer sessions are cut
+    where the budget runs out, and a single message above the budget is a chunk alone
+    (truncated to the budget when sent).
+
+    Returns:
+        list: (first message, last message excluded) of every chunk
+    """
+    n = len(token_counts)
+    totals = np.concatenate(([0], np.cumsum(np.asarray(token_counts, dtype=np.int64) + 1)))
+    session_ends = np.append(np.asarray(session_starts, dtype=np.int64)[1:], n)
+
+    chunks = []
+    start = 0
+    for session_start, session_end in zip(session_starts.tolist(), session_ends.tolist()):
+        if totals[session_end] - totals[start] <= max_tokens:
+            continue
+        if session_start > start:
+            chunks.append((start, session_start))
+            start = session_start
+        while totals[session_end] - totals[start] > max_tokens:
+            end = int(np.searchsorted(totals, totals[start] + max_tokens, side="right")) - 1
+            end = max(end, start + 1)
+            chunks.append((start, end))
+            start = end
+    if start < n:
+        chunks.append((start, n))
+    return chunks
+
+
+def _listed_themes(partial: Dict[int, Dict[str, str]], system_prompt: str, model: str) -> str:
+    """
+    The partial themes as the reduce call input, within the context of the model. Listed
+    round robin over the chunks (the first theme of every chunk, then the second...) so
+    when they do not all fit the last themes of each chunk are left out, not whole chunks.
+    """
+    per_chunk = [list(partial[i].items()) for i in sorted(partial)]
+    lines = []
+    for rank in range(max(map(len, per_chunk), default=0)):
+        for themes in per_chunk:
+            if rank < len(themes):
+                theme, examples = themes[rank]
+                lines.append(f"- {theme}: {examples}")
+    return format_conversation_within_token_limit(lines, system_prompt, REDUCE_OUTPUT_TOKENS, model)
+
+
+def _spread(chunks: List[Tuple[int, int]], max_chunks: int) -> List[Tuple[int, int]]:
+    if len(chunks) <= max_chunks:
+        return chunks
+    kept = np.unique(np.linspace(0, len(chunks) - 1, max_chunks).round().astype(np.int64))
+    return [chunks[i] for i in kept]
+
+
+async def _complete_themes(
+    model: str, system_prompt: str, user_message: str, max_tokens: int, budget: TokenBudget
+) -> Dict[str, str]:
+    await budget.acquire(count_tokens(system_prompt + user_message, model) + max_tokens)
+    response = await get_openai_client().chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message},
+        ],
+        temperature=0.7,
+        max_tokens=max_tokens,
+        response_format={"type": "json_object"},
+    )
+    return parse_themes_response(json.loads(response.choices[0].message.content or "{}"))
+
+
+async def map_reduce_themes(
+    conversation: List[Message],
+    session_starts: np.ndarray,
+    model: str = "gpt-3.5-turbo",
+    max_chunk_tokens: Optional[int] = None,
+    max_chunks: int = MAX_MAP_CHUNKS,
+    concurrency: Optional[int] = None,
+    budget: Optional[TokenBudget] = None,
+) -> AsyncIterator[dict]:
+    """
+    Themes of the whole conversation: token-bounded chunks (cut between sessions) are
+    sent to the LLM concurrently, at most `concurrency` at a time and within the token
+    budget, then the partial themes are merged by a final reduce call.
+
+    Yields, as they are ready:
+        {"event": "chunks", "total": n}
+        {"event": "partial", "chunk": i, "start": date, "end": date, "themes": {...}}
+            once per chunk, in completion order
+        {"event": "themes", "themes": {...}} the merged themes, last
+
+    Raises:
+        ValueError: If no themes could be extracted
+    """
+    settings = get_settings()
+    concurrency = concurrency or settings.LLM_MAP_CONCURRENCY
+    budget = budget or get_token_budget()
+
+    language = await asyncio.to_thread(detect_language, conversation[:2000])
+    map_prompt = MAP_PROMPTS.get(language, MAP_PROMPTS["en"])
+    if max_chunk_tokens is None:
+        max_chunk_tokens = min(
+            MAP_CHUNK_TOKENS,
+            context_limit(model)
+            - count_tokens(map_prompt, model)
+            - MAP_OUTPUT_TOKENS
+            - PROMPT_TOKEN_BUFFER,
+        )
+
+    lines = [f"{msg.author}: {msg.content}" for msg in conversation]
+    token_counts = await asyncio.to_thread(count_message_tokens, lines, model)
+    chunks = _spread(chunk_boundaries(token_counts, session_starts, max_chunk_tokens), max_chunks)
+    logger.info(f"Extracting themes from {len(chunks)} chunks of {len(conversation)} messages")
+    yield {"event": "chunks", "total": len(chunks)}
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_map(i: int, start: int, end: int) -> Tuple[int, Dict[str, str]]:
+        excerpt = "\n".join(lines[start:end])
+        if token_counts[start:end].sum() + end - start > max_chunk_tokens:
+            # A single message longer than a whole chunk
+            excerpt = truncate_to_tokens(excerpt, max_chunk_tokens, model)
+        async with semaphore:
+            try:
+                themes = await _complete_themes(
+                    model, map_prompt, excerpt, MAP_OUTPUT_TOKENS, budget
+                )
+            except Exception as e:
+                logger.error(f"Error extracting themes of chunk {i}: {str(e)}")
+                themes = {}
+            return i, themes
+
+    tasks = [asyncio.create_task(run_map(i, *chunk)) for i, chunk in enumerate(chunks)]
+    partial: Dict[int, Dict[str, str]] = {}
+    try:
+        for done in asyncio.as_completed(tasks):
+            i, themes = await done
+            start, end = chunks[i]
+            partial[i] = themes
+            yield {
+                "event": "partial",
+                "chunk": i,
+                "start": conversation[start].date.isoformat(),
+                "end": conversation[end - 1].date.isoformat(),
+                "themes": themes,
+            }
+    finally:
+        # The client went away, stop the calls still waiting
+        for task in tasks:
+            task.cancel()
+
+    if not any(partial.values()):
+        raise ValueError("No themes extracted from LLM")
+
+    reduce_prompt = REDUCE_PROMPTS.get(language, REDUCE_PROMPTS["en"])
+    # A theme found in several chunks is listed once per chunk
+    listed = _listed_themes(partial, reduce_prompt, model)
+    themes = await _complete_themes(model, reduce_prompt, listed, REDUCE_OUTPUT_TOKENS, budget)
+    if not themes:
+        raise ValueError("Unable to parse merged themes")
+    yield {"event": "themes", "themes": themes}
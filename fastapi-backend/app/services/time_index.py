@@ -0,0 +1,223 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import io
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.data_formats import RangeStats
+from app.services.artifact_store import load_artifact, save_artifact
+from app.services.message_index import to_datetime64
+from app.services.metric_state import SESSION_GAP_SECONDS
+from app.services.parsing_utils import load_stored_messages
+from app.services.text_analyzer import conversation_stats_from_counts, heatmap_from_matrix
+
+logger = logging.getLogger(__name__)
+
+TIME_INDEX_KIND = "time_index:v1"
+
+ONE_DAY = np.timedelta64(1, "D")
+
+
+class TimeIndex:
+    """
+    Message times of a conversation, sorted, overall and per author, plus session bounds.
+
+    The sorted times are the cumulative message count function in inverted form: the number
+    of messages before t is the binary search position of t. Counts over any [start, end)
+    range are then two binary searches, overall and per author, with no message scan, at
+    second resolution and in one integer per message.
+    """
+
+    def __init__(
+        self,
+        times: np.ndarray,
+        authors: List[str],
+        author_offsets: np.ndarray,
+        author_times: np.ndarray,
+        session_starts: np.ndarray,
+        session_ends: np.ndarray,
+    ):
+        self.times = times
+        self.authors = authors
+        # Times of author a are author_times[author_offsets[a]:author_offsets[a + 1]]
+        self.author_offsets = author_offsets
+        self.author_times = author_times
+        # Session k covers the sorted messages session_starts[k] to session_ends[k] excluded
+        self.session_starts = session_starts
+        self.session_ends = session_ends
+
+    @classmethod
+    def build(cls, messages: List[Dict], gap_seconds: int = SESSION_GAP_SECONDS) -> "TimeIndex":
+        """Build from stored message dicts (date as ISO string, author, content)"""
+        authors: Dict[str, int] = {}
+        codes = np.array(
+            [authors.setdefault(msg["author"], len(authors)) for msg in messages], dtype=np.int32
+        )
+        times = np.array([msg["date"] for msg in messages], dtype="datetime64[s]")
+
+        order = np.argsort(times, kind="stable")
+        times, codes = times[order], codes[order]
+
+        by_author = np.argsort(codes, kind="stable")
+        author_offsets = np.zeros(len(authors) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(authors)), out=author_offsets[1:])
+
+        # A gap longer than gap_seconds between consecutive messages starts a new session
+        breaks = np.flatnonzero(np.diff(times).astype(np.int64) > gap_seconds) + 1
+        session_starts = np.concatenate(([0], breaks)).astype(np.int64)
+        session_ends = np.concatenate((breaks, [len(times)])).astype(np.int64)
+        if len(times) == 0:
+            session_starts = session_ends = np.empty(0, dtype=np.int64)
+
+        return cls(
+            times, list(authors), author_offsets, times[by_author], session_starts, session_ends
+        )
+
+    def _bounds(self, start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, int]:
+        """Sorted positions of the first message at or after start and first at or after end"""
+        first = 0 if start is None else int(np.searchsorted(self.times, to_datetime64(start)))
+        last = (
+            len(self.times) if end is None else int(np.searchsorted(self.times, to_datetime64(end)))
+        )
+        return first, max(first, last)
+
+    def count(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        first, last = self._bounds(start, end)
+        return last - first
+
+    def author_counts(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Dict[str, int]:
+        """Messages per author in [start, end), authors without messages left out"""
+        counts = {}
+        for code, author in enumerate(self.authors):
+            times = self.author_times[self.author_offsets[code] : self.author_offsets[code + 1]]
+            low = 0 if start is None else np.searchsorted(times, to_datetime64(start))
+            high = len(times) if end is None else np.searchsorted(times, to_datetime64(end))
+            if high > low:
+                counts[author] = int(high - low)
+        return dict(sorted(counts.items(), key=lambda x: x[1], reverse=True))
+
+    def daily_counts(self, first: int, last: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Days spanned by the sorted messages first to last excluded, and their counts"""
+        days = np.arange(
+            self.times[first].astype("datetime64[D]"),
+            self.times[last - 1].astype("datetime64[D]") + ONE_DAY,
+        )
+        edges = np.searchsorted(self.times[first:last], np.append(days, days[-1] + ONE_DAY))
+        return days, np.diff(edges)
+
+    def sessions(self, first: int, last: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Start and end (excluded) positions of the sessions cut to the messages first..last"""
+        low = np.searchsorted(self.session_ends, first, side="right")
+        high = np.searchsorted(self.session_starts, last, side="left")
+        starts = np.maximum(self.session_starts[low:high], first)
+        ends = np.minimum(self.session_ends[low:high], last)
+        return starts, ends
+
+    def range_stats(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        busiest_days: int = 5,
+    ) -> RangeStats:
+        """Conversation stats, heatmap and busiest days of the messages in [start, end)"""
+        first, last = self._bounds(start, end)
+        messages_per_author = self.author_counts(start, end)
+        if last == first:
+            return RangeStats(
+                start=start, end=end, total_messages=0, messages_per_author=messages_per_author
+            )
+
+        days, counts = self.daily_counts(first, last)
+        calendar = [day.item() for day in days]
+        weekday_counts = {i: 0 for i in range(7)}
+        week_counts = {i: 0 for i in range(53)}
+        month_counts = {i: 0 for i in range(1, 13)}
+        matrix = [[0] * 53 for _ in range(7)]
+        dates_matrix = [[""] * 53 for _ in range(7)]
+        for day, count in zip(calendar, counts.tolist()):
+            if not count:
+                continue
+            weekday, week = day.weekday(), day.isocalendar()[1] - 1
+            weekday_counts[weekday] += count
+            week_counts[week] += count
+            month_counts[day.month] += count
+            matrix[weekday][week] += count
+            dates_matrix[weekday][week] = day.strftime("%d/%m/%Y")
+
+        starts, ends = self.sessions(first, last)
+        lengths = ends - starts
+        longest = int(np.argmax(lengths))
+
+        top_days = np.argsort(-counts, kind="stable")[:busiest_days]
+        return RangeStats(
+            start=start,
+            end=end,
+            total_messages=last - first,
+            messages_per_author=messages_per_author,
+            conversation_stats=conversation_stats_from_counts(
+                total_messages=last - first,
+                participant_count=len(messages_per_author),
+                weekday_counts=weekday_counts,
+                week_counts=week_counts,
+                month_counts=month_counts,
+                conversation_lenghts=lengths.tolist(),
+                longest_conversation=(
+                    int(lengths[longest]),
+                    self.times[starts[longest]].item(),
+                    self.times[ends[longest] - 1].item(),
+                ),
+            ),
+            heatmap_data=heatmap_from_matrix(matrix, dates_matrix),
+            busiest_days={
+                calendar[k].isoformat(): int(counts[k]) for k in top_days if counts[k] > 0
+            },
+        )
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            times=self.times.astype(np.int64),
+            authors=np.array(self.authors, dtype=str),
+            author_offsets=self.author_offsets,
+            author_times=self.author_times.astype(np.int64),
+            session_starts=self.session_starts,
+            session_ends=self.session_ends,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "TimeIndex":
+        arrays = np.load(io.BytesIO(payload))
+        return cls(
+            arrays["times"].astype("datetime64[s]"),
+            arrays["authors"].tolist(),
+            arrays["author_offsets"],
+            arrays["author_times"].astype("datetime64[s]"),
+            arrays["session_starts"],
+            arrays["session_ends"],
+        )
+
+
+def get_or_build_time_index(db: Session, content_hash: str) -> Optional[TimeIndex]:
+    """
+    Load the persisted time index of a conversation, building and storing it from the
+    stored conversation if missing.
+
+    Returns:
+        TimeIndex or None: None if the conversation does not exist
+    """
+    payload = load_artifact(db, content_hash, TIME_INDEX_KIND)
+    if payload is not None:
+        return TimeIndex.from_bytes(payload)
+
+    messages = load_stored_messages(db, content_hash)
+    if messages is None:
+        return None
+
+    logger.info(f"Building time index for {content_hash}")
+    index = TimeIndex.build(messages)
+    save_artifact(db, content_hash, TIME_INDEX_KIND, index.to_bytes())
+    return index
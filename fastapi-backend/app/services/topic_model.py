@@ -0,0 +1,237 @@
+from typing import Dict, List, Optional, Tuple
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.data_formats import Message
+from app.services.artifact_store import load_json_artifact, save_json_artifact
+from app.services.parsing_utils import load_stored_messages
+from app.services.session_index import get_or_build_session_index
+from app.services.term_matrix import CSRMatrix, TermMatrix, get_or_build_term_matrix
+
+logger = logging.getLogger(__name__)
+
+# Value of the `model` field of /conversation-themes that selects the in-process engine
+LOCAL_TOPIC_MODEL = "local-nmf"
+
+TOPIC_MODEL_VERSION = 1
+LOCAL_THEMES_KIND = f"themes:{LOCAL_TOPIC_MODEL}:v{TOPIC_MODEL_VERSION}"
+
+N_TOPICS = 7
+MAX_FEATURES = 5000
+NMF_ITERATIONS = 200
+NMF_TOLERANCE = 1e-4
+EXAMPLES_PER_TOPIC = 2
+
+_EPSILON = 1e-10
+
+
+def _segment_sums(values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """Sums of values[indptr[i]:indptr[i + 1]] along the first axis, zero for empty segments"""
+    sums = np.zeros((len(indptr) - 1,) + values.shape[1:])
+    present = np.diff(indptr) > 0
+    if present.any():
+        sums[present] = np.add.reduceat(values, indptr[:-1][present], axis=0)
+    return sums
+
+
+def _sparse_dot(matrix: CSRMatrix, weights: np.ndarray, dense: np.ndarray) -> np.ndarray:
+    """(rows x cols sparse matrix with `weights` as values) @ (cols x k dense)"""
+    return _segment_sums(weights[:, None] * dense[matrix.indices], matrix.indptr)
+
+
+class _SparseOperand:
+    """
+    Weighted sparse matrix with its values also ordered by column, so that both X @ D
+    and X.T @ D are one gather and one segmented sum
+    """
+
+    def __init__(self, matrix: CSRMatrix, weights: np.ndarray):
+        self.matrix = matrix
+        self.weights = weights
+        self.rows = matrix.row_ids()
+        self.column_order = np.argsort(matrix.indices, kind="stable")
+        self.column_indptr = np.zeros(matrix.shape[1] + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(matrix.indices, minlength=matrix.shape[1]), out=self.column_indptr[1:]
+        )
+        self.squared_norm = float(weights @ weights)
+
+    def dot(self, dense: np.ndarray) -> np.ndarray:
+        return _sparse_dot(self.matrix, self.weights, dense)
+
+    def t_dot(self, dense: np.ndarray) -> np.ndarray:
+        order = self.column_order
+        values = self.weights[order, None] * dense[self.rows[order]]
+        return _segment_sums(values, self.column_indptr)
+
+
+def tfidf_weights(documents: CSRMatrix, max_features: int = MAX_FEATURES) -> np.ndarray:
+    """
+    L2 normalized sublinear TF-IDF of every stored value of a document x term matrix.
+    Terms in a single document or in more than half of them, and terms beyond the
+    max_features most frequent, get a zero weight.
+    """
+    n_documents = documents.shape[0]
+    df = documents.document_frequency()
+    useful = (df >= 2) & (df <= max(2, n_documents // 2))
+    if np.count_nonzero(useful) > max_features:
+        threshold = np.sort(df[useful])[-max_features]
+        useful &= df >= threshold
+
+    idf = np.where(useful, np.log(n_documents / np.maximum(df, 1)) + 1, 0.0)
+    weights = (1 + np.log(documents.data)) * idf[documents.indices]
+    norms = np.sqrt(np.bincount(documents.row_ids(), weights=weights**2, minlength=n_documents))
+    return weights / np.maximum(norms, _EPSILON)[documents.row_ids()]
+
+
+def _initialize(x: _SparseOperand, n_topics: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Start H from n_topics mutually dissimilar documents, picked farthest point first (each
+    the least similar to the ones already picked), and W from the similarities to them.
+    Random starts tend to merge two topics and split a third.
+    """
+    rng = np.random.default_rng(seed)
+    n_documents, n_terms = x.matrix.shape
+    h = np.zeros((n_topics, n_terms))
+    similarity = np.zeros(n_documents)
+    candidates = np.bincount(x.rows, weights=x.weights, minlength=n_documents) > 0
+    document = int(np.argmax(candidates))
+    for topic in range(n_topics):
+        columns, _ = x.matrix.row(document)
+        start = x.matrix.indptr[document]
+        h[topic, columns] = x.weights[start : start + len(columns)]
+        similarity = np.maximum(similarity, x.dot(h[topic][:, None])[:, 0])
+        candidates[document] = False
+        if candidates.any():
+            document = int(np.flatnonzero(candidates)[np.argmin(similarity[candidates])])
+
+    scale = max(float(x.weights.mean()), _EPSILON) if len(x.weights) else 1.0
+    h += rng.random(h.shape) * scale * 1e-2
+    w = x.dot(h.T) + rng.random((n_documents, n_topics)) * scale * 1e-2
+    return w, h
+
+
+def factorize(
+    documents: CSRMatrix,
+    weights: np.ndarray,
+    n_topics: int,
+    iterations: int = NMF_ITERATIONS,
+    tolerance: float = NMF_TOLERANCE,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Non-negative matrix factorization X ~ W @ H of a sparse matrix with Lee and Seung's
+    multiplicative updates, X never being densified. Stops early once an iteration
+    improves the relative reconstruction error by less than tolerance.
+
+    Returns:
+        tuple: W (documents x topics) and H (topics x terms)
+    """
+    x = _SparseOperand(documents, weights)
+    w, h = _initialize(x, n_topics, seed)
+
+    previous_error = np.inf
+    for _ in range(iterations):
+        h *= x.t_dot(w).T / (w.T @ w @ h + _EPSILON)
+        xht = x.dot(h.T)
+        hht = h @ h.T
+        w *= xht / (w @ hht + _EPSILON)
+
+        # ||X - WH||^2 = ||X||^2 - 2 tr(W.T X H.T) + tr(W.T W H H.T), from the products above
+        error = x.squared_norm - 2 * np.sum(w * xht) + np.sum((w.T @ w) * hht)
+        error = np.sqrt(max(error, 0.0) / max(x.squared_norm, _EPSILON))
+        if previous_error - error < tolerance:
+            break
+        previous_error = error
+    return w, h
+
+
+def extract_local_themes(
+    term_matrix: TermMatrix,
+    document_ids: np.ndarray,
+    n_documents: int,
+    conversation: List[Message],
+    n_topics: int = N_TOPICS,
+) -> Dict[str, str]:
+    """
+    Themes of a conversation without an LLM: TF-IDF over documents (groups of messages,
+    e.g. sessions), factorized with NMF into topics named by their top terms.
+
+    Args:
+        term_matrix (TermMatrix): Message x term counts of the conversation
+        document_ids (np.ndarray): Document of every message
+        n_documents (int): Number of documents
+        conversation (list): Messages, in term matrix order, to quote examples from
+
+    Returns:
+        dict: Theme name -> representative messages joined by " | ", like
+        parse_themes_response
+    """
+    documents = term_matrix.messages.group_rows(document_ids, n_documents)
+    weights = tfidf_weights(documents)
+    n_topics = min(n_topics, n_documents, int(np.count_nonzero(weights)))
+    if n_topics == 0:
+        return {}
+
+    _, topics = factorize(documents, weights, n_topics)
+
+    # Score messages against each topic, with the same term weights as the documents
+    messages = term_matrix.messages
+    useful = np.zeros(messages.shape[1])
+    useful[documents.indices[weights > 0]] = 1.0
+    message_scores = _sparse_dot(messages, useful[messages.indices], topics.T)
+
+    themes = {}
+    for topic in np.argsort(-topics.sum(axis=1), kind="stable"):
+        top_terms = np.argsort(-topics[topic], kind="stable")[:3]
+        name = " / ".join(term_matrix.vocabulary[t] for t in top_terms if topics[topic, t] > 0)
+        if not name or name in themes:
+            continue
+        examples: List[str] = []
+        for k in np.argsort(-message_scores[:, topic], kind="stable"):
+            if message_scores[k, topic] <= 0 or len(examples) == EXAMPLES_PER_TOPIC:
+                break
+            example = f"{conversation[k].author}: {conversation[k].content}"
+            if example not in examples:
+                examples.append(example)
+        themes[name] = " | ".join(examples)
+    return themes
+
+
+def load_local_themes(db: Session, content_hash: str) -> Optional[Dict[str, str]]:
+    """Stored local themes of a conversation, None if they were never extracted"""
+    return load_json_artifact(db, content_hash, LOCAL_THEMES_KIND)
+
+
+def get_or_extract_local_themes(
+    db: Session, content_hash: str, conversation: Optional[List[Message]] = None
+) -> Optional[Dict[str, str]]:
+    """
+    Local themes of a conversation, extracted once from the conversation (loaded if not
+    given) then loaded from storage.
+
+    Returns:
+        dict or None: Themes, None if the conversation does not exist
+    """
+    themes = load_local_themes(db, content_hash)
+    if themes is not None:
+        return themes
+
+    if conversation is None:
+        messages = load_stored_messages(db, content_hash)
+        if messages is None:
+            return None
+        conversation = [Message.model_validate(msg) for msg in messages]
+
+    term_matrix = get_or_build_term_matrix(db, content_hash, conversation)
+    sessions = get_or_build_session_index(db, content_hash)
+    document_ids = np.repeat(np.arange(len(sessions)), sessions.lengths())
+    n_documents = len(sessions)
+    # Too few sessions to separate topics, every message is a document instead
+    if n_documents < 2 * N_TOPICS:
+        document_ids, n_documents = np.arange(len(conversation)), len(conversation)
+
+    logger.info(f"Extracting local themes for {content_hash} from {n_documents} documents")
+    themes = extract_local_themes(term_matrix, document_ids, n_documents, conversation)
+    save_json_artifact(db, content_hash, LOCAL_THEMES_KIND, themes)
+    return themes
@@ -0,0 +1,73 @@
+"""
+Time the sentiment section against the word_metrics section on the same synthetic chat:
+messages of a few words drawn from a filler vocabulary plus lexicon entries, negations
+and laughter.
+
+Usage: python -m scripts.benchmark_sentiment [--messages 1000000]
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import random
+import time
+import numpy as np
+from app.models.data_formats import Message, MessageKind
+from app.services.metric_state import SECTION_AGGREGATES, ConversationAggregate
+from app.services.sentiment import VALENCE_LEXICON, calculate_sentiment, score_messages
+
+FILLER = (
+    "vamos hoje amanhã casa trabalho jogo comer onde quando agora depois cedo tarde gente "
+    "cara mano ver fazer ir vou vai tá sim então aqui lá isso esse essa ainda já"
+).split()
+
+
+def synthetic_chat(n_messages, seed=0):
+    rng = random.Random(seed)
+    lexicon = list(VALENCE_LEXICON) + ["não gostei", "kkkkk", "hahaha"]
+    authors = ["Ana", "Bia", "Caio", "Duda"]
+    start = datetime(2020, 1, 1)
+    return [
+        Message.model_construct(
+            date=start + timedelta(minutes=3 * i),
+            author=rng.choice(authors),
+            content=" ".join(rng.choices(FILLER, k=rng.randint(2, 10)) + rng.choices(lexicon)),
+            kind=MessageKind.TEXT,
+        )
+        for i in range(n_messages)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    messages = synthetic_chat(args.messages)
+    dates = [msg.date for msg in messages]
+    authors = ["Ana", "Bia", "Caio", "Duda"]
+    message_authors = np.array([authors.index(msg.author) for msg in messages], dtype=np.int32)
+    # The section reads author and date arrays from the message index, built on upload
+    date_array = np.array(dates, dtype="datetime64[s]")
+
+    start = time.perf_counter()
+    ConversationAggregate.from_conversation(
+        dates, messages, SECTION_AGGREGATES["word_metrics"]
+    ).word_metrics()
+    word_metrics_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = score_messages(messages)
+    scoring_time = time.perf_counter() - start
+    calculate_sentiment(authors, message_authors, date_array, scores)
+    sentiment_time = time.perf_counter() - start
+
+    print(f"Messages: {args.messages:,}  scored: {np.count_nonzero(~np.isnan(scores)):,}")
+    print(f"word_metrics: {word_metrics_time:.2f}s")
+    print(
+        f"sentiment:    {sentiment_time:.2f}s (matching {scoring_time:.2f}s, "
+        f"grouping {sentiment_time - scoring_time:.2f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Latency of the local (TF-IDF + NMF) theme extraction on synthetic chats with planted
+topics: sessions of messages drawing most of their words from one topic vocabulary.
+
+The term matrix is generated directly, as tokenizing is done once on upload and the
+matrix is persisted; the timings are those of a /conversation-themes call with the
+"local-nmf" model on a conversation whose themes are not stored yet.
+
+Usage: python -m scripts.benchmark_topic_model [--messages 100000 1000000]
+"""
+
+import argparse
+import time
+import numpy as np
+from app.models.data_formats import Message
+from app.services.term_matrix import CSRMatrix, TermMatrix
+from app.services.topic_model import N_TOPICS, extract_local_themes
+
+
+def synthetic_chat(n_messages, n_topics, vocabulary_size, session_length, seed=0):
+    rng = np.random.default_rng(seed)
+    words_per_message = 8
+    document_ids = np.arange(n_messages) // session_length
+    n_documents = int(document_ids[-1]) + 1
+
+    # Each topic owns a slice of the vocabulary, 20% of the words are background noise
+    topic_size = vocabulary_size // (n_topics + 1)
+    session_topics = rng.integers(0, n_topics, size=n_documents)
+    rows = np.repeat(np.arange(n_messages), words_per_message)
+    own = session_topics[document_ids[rows]] * topic_size + rng.zipf(1.5, len(rows)) % topic_size
+    noise = rng.integers(n_topics * topic_size, vocabulary_size, len(rows))
+    cols = np.where(rng.random(len(rows)) < 0.8, own, noise)
+
+    vocabulary = [f"t{col // topic_size}w{col % topic_size}" for col in range(vocabulary_size)]
+    messages = CSRMatrix.from_coo(rows, cols, np.ones(len(rows)), (n_messages, vocabulary_size))
+    single = np.zeros(n_messages, dtype=np.int32)
+    term_matrix = TermMatrix(vocabulary, messages, ["A"], single, ["2024-01"], single)
+    return term_matrix, document_ids, n_documents, session_topics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--session-length", type=int, default=25)
+    args = parser.parse_args()
+
+    print(f"{'messages':>10} {'sessions':>9} {'nnz':>10} {'time s':>7} {'planted found':>14}")
+    for n_messages in args.messages:
+        term_matrix, document_ids, n_documents, _ = synthetic_chat(
+            n_messages, N_TOPICS, args.vocabulary, args.session_length
+        )
+        start = time.perf_counter()
+        themes = extract_local_themes(
+            term_matrix, document_ids, n_documents, conversation=_Lazy(n_messages)
+        )
+        elapsed = time.perf_counter() - start
+
+        # A planted topic is found when a theme is named after its words only
+        found = {
+            name.split("w")[0]
+            for name in themes
+            if len({term.split("w")[0] for term in name.split(" / ")}) == 1
+        }
+        nnz = len(term_matrix.messages.data)
+        print(
+            f"{n_messages:>10,} {n_documents:>9,} {nnz:>10,} {elapsed:>7.2f} "
+            f"{len(found):>7}/{N_TOPICS}"
+        )
+
+
+class _Lazy:
+    """Stand-in conversation creating only the quoted messages, without validation"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        return Message.model_construct(author="A", content=f"message {i}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare exact vocabulary richness with the HyperLogLog / distinct sample estimates on a
+synthetic Zipf distributed chat: error, memory and time for each HyperLogLog precision.
+
+Usage: python -m scripts.benchmark_vocabulary_sketches [--tokens 2000000] [--vocabulary 200000]
+"""
+
+from collections import Counter
+import argparse
+import random
+import sys
+import time
+from app.services.sketches import DistinctSample, HyperLogLog, stable_hash
+import numpy as np
+
+
+def zipf_tokens(size, vocabulary, seed=0):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, vocabulary + 1)]
+    return rng.choices([f"w{i}" for i in range(vocabulary)], weights=weights, k=size)
+
+
+def exact_counts(tokens):
+    start = time.perf_counter()
+    counts = Counter(tokens)
+    elapsed = time.perf_counter() - start
+    # Rough size of a Counter of short strings: dict entry plus the key object
+    memory = sys.getsizeof(counts) + sum(sys.getsizeof(word) for word in counts)
+    return counts, elapsed, memory
+
+
+def sketch_counts(counts, precision, sample_size):
+    start = time.perf_counter()
+    hashes = {word: stable_hash(word) for word in counts}
+    sketch = HyperLogLog(precision=precision)
+    sketch.add_hashes(np.fromiter(hashes.values(), dtype=np.uint64))
+    sample = DistinctSample(size=sample_size)
+    for word, count in counts.items():
+        sample.add(word, count, hashes[word])
+    elapsed = time.perf_counter() - start
+
+    distinct = sketch.count()
+    hapax = round(distinct * sample.fraction(lambda c: c == 1))
+    memory = sketch.memory_bytes() + sample_size * 2 * 64
+    return distinct, hapax, elapsed, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=2_000_000)
+    parser.add_argument("--vocabulary", type=int, default=200_000)
+    parser.add_argument("--sample-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    tokens = zipf_tokens(args.tokens, args.vocabulary)
+    counts, exact_time, exact_memory = exact_counts(tokens)
+    distinct = len(counts)
+    hapax = sum(1 for count in counts.values() if count == 1)
+
+    print(f"Tokens: {args.tokens:,}  distinct: {distinct:,}  hapax: {hapax:,}")
+    print(f"Exact: {exact_time:.2f}s, ~{exact_memory / 1024:,.0f} KB\n")
+    print(
+        f"{'precision':>9} {'memory KB':>10} {'distinct err':>13} {'hapax err':>10} "
+        f"{'time s':>7}"
+    )
+    for precision in range(11, 17):
+        estimate, hapax_estimate, elapsed, memory = sketch_counts(
+            counts, precision, args.sample_size
+        )
+        print(
+            f"{precision:>9} {memory / 1024:>10.1f} "
+            f"{(estimate - distinct) / distinct:>13.2%} "
+            f"{(hapax_estimate - hapax) / max(hapax, 1):>10.2%} {elapsed:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
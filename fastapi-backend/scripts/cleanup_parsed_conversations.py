@@ -8,7 +8,11 @@ sys.path.insert(0, project_root)
 from sqlalchemy import create_engine  # noqa: E402
 from sqlalchemy.orm import sessionmaker  # noqa: E402
 from app.database import SQLALCHEMY_DATABASE_URL, get_database_url  # noqa: E402
-from app.models.database_models import ParsedConversation  # noqa: E402
+from app.models.database_models import (  # noqa: E402
+    ParsedConversation,
+    ConversationArtifact,
+    LLMResponse,
+)
 from datetime import datetime, timedelta  # noqa: E402
 import logging  # noqa: E402
 import argparse  # noqa: E402
@@ -57,6 +61,12 @@ def cleanup_conversations(days: int = 2, dry_run: bool = False, delete_all: bool
                 logger.info(f"... and {count - 10} more conversations")
         else:
             for conv in old_conversations:
+                db.query(ConversationArtifact).filter(
+                    ConversationArtifact.content_hash == conv.content_hash
+                ).delete(synchronize_session=False)
+                db.query(LLMResponse).filter(LLMResponse.content_hash == conv.content_hash).delete(
+                    synchronize_session=False
+                )
                 db.delete(conv)
 
             db.commit()
@@ -1,6 +1,15 @@
+from contextlib import contextmanager
+import asyncio
+import json
 import os
+import re
+import threading
+import time
 import pytest
+import uvicorn
 from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 
 # Load test-specific environment variables
 load_dotenv(dotenv_path=".env.test", override=True)
@@ -41,3 +50,125 @@ def setup_test_database():
     yield
     # Drop all tables after tests
     Base.metadata.drop_all(bind=engine)
+
+
+class FakeEncoding:
+    """Words, punctuation and newlines as tokens, so a joined text counts exactly"""
+
+    def __init__(self):
+        self.batches = 0
+
+    def encode(self, text, disallowed_special=()):
+        return re.findall(r"\w+|\n|[^\w\s]", text)
+
+    def encode_batch(self, texts, disallowed_special=()):
+        self.batches += 1
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def fake_encoding(monkeypatch):
+    """Stand-in for the tiktoken encodings, which are downloaded on first use"""
+    from app.services import chatgpt_utils
+
+    encoding = FakeEncoding()
+    monkeypatch.setattr(chatgpt_utils, "get_encoding", lambda model="gpt-3.5-turbo": encoding)
+    return encoding
+
+
+async def _completion_chunks(state, body):
+    """The reply as streamed completion chunks, a word at a time"""
+    try:
+        for i, word in enumerate(re.findall(r"\s*\S+", state["reply"](body))):
+            await asyncio.sleep(state["first_token_latency"] if i == 0 else state["token_latency"])
+            chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        state["in_flight"] -= 1
+
+
+def fake_openai_app(state):
+    """
+    Chat completions endpoint answering state["reply"](request body) after
+    state["latency"] seconds, recording the requests and how many were in flight.
+    Streamed requests get the first word after state["first_token_latency"] seconds,
+    then one every state["token_latency"] seconds.
+    """
+    fake = FastAPI()
+
+    @fake.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        state["requests"].append(body)
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        if body.get("stream"):
+            return StreamingResponse(
+                _completion_chunks(state, body), media_type="text/event-stream"
+            )
+        await asyncio.sleep(state["latency"])
+        state["in_flight"] -= 1
+        return {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": state["reply"](body)},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    return fake
+
+
+@contextmanager
+def serve(app):
+    """Runs app with uvicorn in a thread, yields its port"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield server.servers[0].sockets[0].getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+@pytest.fixture
+def fake_openai_server(monkeypatch):
+    """Local fake OpenAI server, the shared client is pointed at it"""
+    from app.core.config import clear_settings_cache
+    from app.services import openai_client
+
+    state = {
+        "requests": [],
+        "in_flight": 0,
+        "max_in_flight": 0,
+        "latency": 0.3,
+        "first_token_latency": 0.3,
+        "token_latency": 0.05,
+        "reply": lambda body: "  tudo certo por aqui  ",
+    }
+    with serve(fake_openai_app(state)) as port:
+        monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+        monkeypatch.setenv("OPENAI_MAX_RETRIES", "0")
+        clear_settings_cache()
+        # A client left from another event loop cannot be reused
+        monkeypatch.setattr(openai_client, "_client", None)
+        yield state
+    clear_settings_cache()
@@ -0,0 +1,52 @@
+import pytest
+from datetime import datetime, timedelta
+import numpy as np
+from app.services.activity_rhythm import calculate_activity_rhythm
+
+AUTHORS = ["Ana", "Bia", "Caio"]
+
+
+@pytest.fixture
+def messages():
+    rng = np.random.default_rng(7)
+    start = datetime(2024, 1, 1)  # a Monday
+    return [
+        (start + timedelta(minutes=int(minutes)), int(author))
+        for minutes, author in zip(
+            rng.integers(0, 60 * 24 * 60, 2000), rng.integers(0, len(AUTHORS), 2000)
+        )
+    ]
+
+
+def rhythm(messages, **kwargs):
+    return calculate_activity_rhythm(
+        AUTHORS,
+        np.array([author for _, author in messages]),
+        np.array([date for date, _ in messages], dtype="datetime64[s]"),
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("offset,resolution", [(0, 60), (-180, 60), (330, 15), (60, 30)])
+def test_grid_matches_python_binning(messages, offset, resolution):
+    result = rhythm(messages, tz_offset_minutes=offset, resolution_minutes=resolution)
+    slots = 24 * 60 // resolution
+
+    expected = np.zeros((len(AUTHORS), 7, slots), dtype=int)
+    for date, author in messages:
+        local = date + timedelta(minutes=offset)
+        expected[author, local.weekday(), (local.hour * 60 + local.minute) // resolution] += 1
+
+    assert result.z == expected.sum(axis=0).tolist()
+    assert len(result.x) == slots and result.y[0] == "Mon"
+    for code, author in enumerate(AUTHORS):
+        profile = result.by_author[author]
+        assert profile.z == expected[code].tolist()
+        hours = [(date + timedelta(minutes=offset)).hour for date, a in messages if a == code]
+        assert profile.peak_hour == int(np.argmax(np.bincount(hours, minlength=24)))
+        assert profile.night_share == round(sum(h < 6 for h in hours) / len(hours), 4)
+
+
+def test_unknown_resolution(messages):
+    with pytest.raises(ValueError):
+        rhythm(messages, resolution_minutes=45)
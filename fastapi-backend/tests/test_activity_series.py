@@ -0,0 +1,90 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from app.services.activity_series import MinuteCounts, lttb
+
+
+def build_messages(n=3000, seed=5):
+    rng = np.random.default_rng(seed)
+    start = datetime(2023, 5, 1, 8, 30)
+    offsets = np.sort(rng.integers(0, 90 * 24 * 60, n))
+    authors = ["Ana", "Bia", "Caio"]
+    return [
+        {
+            "date": (start + timedelta(minutes=int(minute))).isoformat(),
+            "author": authors[int(rng.choice(3, p=[0.5, 0.3, 0.2]))],
+            "content": "oi",
+        }
+        for minute in offsets
+    ]
+
+
+def naive_bins(messages, resolution, author=None):
+    counts = Counter()
+    for msg in messages:
+        if author is None or msg["author"] == author:
+            minute = int(np.datetime64(msg["date"], "m").astype(np.int64))
+            counts[minute // resolution * resolution] += 1
+    return counts
+
+
+@pytest.mark.parametrize("resolution", [15, 60, 24 * 60, 7 * 24 * 60])
+def test_series_bins_match_naive_counts(resolution):
+    messages = build_messages()
+    counts = MinuteCounts.from_bytes(MinuteCounts.build(messages).to_bytes())
+
+    # At 15 minutes the 90 days are downsampled, the kept bins must still be exact
+    series = counts.series(resolution, max_points=5000)
+    if series.total_bins <= 5000:
+        assert len(series.total) == series.total_bins
+        assert sum(series.total) == len(messages)
+
+    expected = naive_bins(messages, resolution)
+    for timestamp, total in zip(series.timestamps, series.total):
+        minute = int(np.datetime64(timestamp, "m").astype(np.int64))
+        assert total == expected.get(minute, 0)
+    for author, values in series.by_author.items():
+        expected = naive_bins(messages, resolution, author)
+        for timestamp, value in zip(series.timestamps, values):
+            assert value == expected.get(int(np.datetime64(timestamp, "m").astype(np.int64)), 0)
+    assert list(series.by_author) == ["Ana", "Bia", "Caio"]
+
+
+def test_series_downsampled_to_max_points_within_range():
+    messages = build_messages()
+    counts = MinuteCounts.build(messages)
+
+    series = counts.series(60, max_points=200)
+    assert series.total_bins > 200
+    assert len(series.total) == len(series.timestamps) == 200
+    assert all(len(values) == 200 for values in series.by_author.values())
+    assert series.timestamps == sorted(series.timestamps)
+
+    start, end = datetime(2023, 6, 1), datetime(2023, 6, 8)
+    week = counts.series(24 * 60, start=start, end=end)
+    assert week.total_bins == 7
+    assert week.timestamps[0] == start and week.timestamps[-1] == end - timedelta(days=1)
+    assert sum(week.total) == sum(
+        1 for msg in messages if start <= datetime.fromisoformat(msg["date"]) < end
+    )
+
+
+def test_series_rejects_too_many_bins():
+    counts = MinuteCounts.build(build_messages(n=50))
+    with pytest.raises(ValueError):
+        counts.series(1, start=datetime(2000, 1, 1), end=datetime(2010, 1, 1))
+    with pytest.raises(ValueError):
+        counts.series(7)
+
+
+def test_lttb_keeps_ends_and_spikes():
+    values = np.zeros(1000)
+    values[[137, 512, 800]] = [50, 80, 30]
+    kept = lttb(values, 50)
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
+    assert {137, 512, 800} <= set(kept.tolist())
+
+    assert lttb(values[:10], 50).tolist() == list(range(10))
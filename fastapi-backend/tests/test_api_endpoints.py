@@ -1,5 +1,8 @@
 from fastapi.testclient import TestClient
 from app.main import app
+import asyncio
+import httpx
+import json
 import pytest
 from unittest.mock import patch, ANY, MagicMock
 from typing import List
@@ -8,6 +11,12 @@ from app.models.data_formats import Message
 import psycopg2
 import io
 import zipfile
+from datetime import datetime, timedelta
+from app import database
+from app.services import openai_client, parsing_utils
+from app.services.llm_admission import AdmissionController
+from app.services.llm_cache import delete_llm_responses
+from app.services.text_analyzer import calculate_conversation_stats
 
 client = TestClient(app)
 
@@ -20,6 +29,18 @@ def sample_chat_content():
 18/01/2025 20:32 - Bob: Hi Alice, how are you?"""
 
 
+@pytest.fixture
+def recent_chat_content():
+    # Dates relative to today, so messages are always inside the analyzed 365 days window
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(days=10)
+    lines = ["First line should be ignored, it's an automatic WhatsApp line"]
+    for i in range(40):
+        date = start + timedelta(minutes=7 * i + (600 if i >= 20 else 0))
+        author = ["Alice", "Bob", "Carol"][i % 3]
+        lines.append(f"{date.strftime('%d/%m/%Y %H:%M')} - {author}: mensagem {i} sobre futebol")
+    return "\n".join(lines)
+
+
 def test_analyze_endpoint_success(sample_chat_content):
     # Create a text file-like object
     file_content = sample_chat_content.encode()
@@ -49,7 +70,9 @@ def test_analyze_endpoint_malformed_chat():
     assert "Error analyzing conversation" in response.json()["detail"]
 
 
-def test_conversation_themes_endpoint():
+@patch("app.api.routes.save_llm_response")
+@patch("app.api.routes.load_llm_response", return_value=None)
+def test_conversation_themes_endpoint(mock_load_cached, mock_save_cached):
     # Test database connection error
     with patch("app.database.SessionLocal") as mock_session:
         mock_db = MagicMock()
@@ -209,6 +232,7 @@ def test_simulate_message_endpoint_success(sample_simulation_data):
             sample_simulation_data["prompt"],
             sample_simulation_data["language"],
             model=sample_simulation_data["model"],
+            style=None,
         )
 
 
@@ -233,7 +257,42 @@ def test_simulate_message_model_selection(sample_simulation_data):
         sample_simulation_data["model"] = "gpt-4o-mini"
         client.post("/simulate-message", json=sample_simulation_data)
 
-        mock_simulate.assert_called_once_with(ANY, ANY, ANY, ANY, model="gpt-4o-mini")
+        mock_simulate.assert_called_once_with(ANY, ANY, ANY, ANY, model="gpt-4o-mini", style=None)
+
+
+def test_simulate_message_by_conversation_id(recent_chat_content, sample_simulation_data):
+    response = client.post(
+        "/analyze", files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")}
+    )
+    conversation_id = response.json()["conversation_id"]
+    request = {**sample_simulation_data, "conversation_id": conversation_id, "author": "Bob"}
+    del request["conversation"]
+
+    with patch("app.api.routes.simulate_author_message") as mock_simulate:
+        mock_simulate.return_value = "Simulated string response message."
+        response = client.post("/simulate-message", json=request)
+
+        assert response.status_code == 200
+        # The precomputed style profile of the author is used, the chat is not sent
+        assert mock_simulate.call_args.args[0] == []
+        style = mock_simulate.call_args.kwargs["style"]
+        assert style.messages == 13 and len(style.examples) == 5
+        assert all(example.endswith("sobre futebol") for example in style.examples)
+        assert "sobre futebol" in style.common_phrases
+
+    response = client.post("/simulate-message", json={**request, "conversation_id": "missing"})
+    assert response.status_code == 404
+    response = client.post(
+        "/simulate-message/stream", json={**request, "conversation_id": "missing"}
+    )
+    assert response.status_code == 404
+    with patch("app.api.routes.get_or_build_style_profiles", side_effect=RuntimeError("boom")):
+        response = client.post("/simulate-message/stream", json=request)
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Internal server error"
+    del request["conversation_id"]
+    response = client.post("/simulate-message", json=request)
+    assert response.status_code == 422
 
 
 def test_create_suggestion_success():
@@ -309,3 +368,604 @@ def test_analyze_endpoint_unsupported_file_type():
 
     assert response.status_code == 400
     assert "Unsupported file type" in response.json()["detail"]
+
+
+def test_analyze_endpoint_metric_selection(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "heatmap_data,conversation_stats"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data) == {"heatmap_data", "conversation_stats", "conversation_id"}
+    assert data["conversation_stats"]["total_messages"] == 40
+
+
+def test_analyze_endpoint_unknown_metric(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "heatmap_data,unknown"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    assert response.status_code == 400
+    assert "unknown" in response.json()["detail"]
+
+
+def test_conversation_analysis_retrieval(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "heatmap_data"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+
+    # Skipped sections are computed in the background and can be fetched later
+    response = client.get(
+        f"/conversations/{conversation_id}/analysis", params={"metrics": "common_words"}
+    )
+    assert response.status_code == 200
+    assert set(response.json()) == {"common_words", "conversation_id"}
+    assert response.json()["common_words"]["futebol"] == 40
+
+    response = client.get("/conversations/missing_hash/analysis")
+    assert response.status_code == 404
+
+
+def test_analyze_appended_export_parses_only_new_lines():
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(days=20)
+    lines = ["Automatic WhatsApp line"]
+    for i in range(300):
+        date = start + timedelta(minutes=5 * i + (500 if i % 50 == 0 else 0))
+        author = ["Ana", "Bia"][i % 2]
+        lines.append(f"{date.strftime('%d/%m/%Y %H:%M')} - {author}: appended test line {i}")
+    old_export = "\n".join(lines[:200])
+    new_export = "\n".join(lines)
+
+    response = client.post(
+        "/analyze", files={"file": ("chat.txt", old_export.encode(), "text/plain")}
+    )
+    assert response.status_code == 200
+
+    with patch(
+        "app.services.parsing_utils.parse_whatsapp_chat",
+        wraps=parsing_utils.parse_whatsapp_chat,
+    ) as mock_parse:
+        response = client.post(
+            "/analyze",
+            params={"metrics": "conversation_stats,word_metrics"},
+            files={"file": ("chat.txt", new_export.encode(), "text/plain")},
+        )
+        mock_parse.assert_not_called()
+
+    assert response.status_code == 200
+    dates, author_and_messages, conversation = parsing_utils.parse_whatsapp_chat(new_export)
+    stats = response.json()["conversation_stats"]
+    assert stats["total_messages"] == 300
+    assert stats == calculate_conversation_stats(conversation, author_and_messages).model_dump(
+        mode="json"
+    )
+
+
+def test_analyze_endpoint_word_frequencies(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "word_frequencies"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    by_author = response.json()["word_frequencies"]["by_author"]
+    assert set(by_author) == {"Alice", "Bob", "Carol"}
+    assert by_author["Alice"]["top_words"]["futebol"] == 14
+
+
+def test_slim_analysis_and_message_pagination(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"slim": "true"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    assert "author_messages" not in response.json()
+    assert "conversation_stats" in response.json()
+    conversation_id = response.json()["conversation_id"]
+
+    # Follow the cursors through every page of Bob's messages
+    contents, cursor = [], 0
+    while cursor is not None:
+        response = client.get(
+            f"/conversations/{conversation_id}/messages",
+            params={"author": "Bob", "limit": 5, "cursor": cursor},
+        )
+        assert response.status_code == 200
+        page = response.json()
+        assert page["total"] == 13
+        assert all(msg["author"] == "Bob" for msg in page["messages"])
+        contents.extend(msg["content"] for msg in page["messages"])
+        cursor = page["next_cursor"]
+    assert contents == [f"mensagem {i} sobre futebol" for i in range(1, 40, 3)]
+
+    # Messages 20 to 39 were sent after the 10 hours gap
+    messages = client.get(f"/conversations/{conversation_id}/messages").json()["messages"]
+    response = client.get(
+        f"/conversations/{conversation_id}/messages",
+        params={"start": messages[20]["date"], "limit": 100},
+    )
+    assert response.json()["total"] == 20
+    assert response.json()["next_cursor"] is None
+
+    # The end of a range is excluded, as in the other date range endpoints
+    response = client.get(
+        f"/conversations/{conversation_id}/messages",
+        params={"start": messages[0]["date"], "end": messages[20]["date"]},
+    )
+    assert response.json()["total"] == 20
+    response = client.get(
+        f"/conversations/{conversation_id}/messages",
+        params={"start": messages[20]["date"] + "+03:00"},
+    )
+    assert response.status_code == 400
+
+    response = client.get("/conversations/missing_hash/messages")
+    assert response.status_code == 404
+
+
+def test_repeat_analysis_served_from_compressed_cache(recent_chat_content):
+    files = {"file": ("chat.txt", recent_chat_content.encode(), "text/plain")}
+    first = client.post("/analyze", files=files, headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200
+    assert first.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in first.headers["vary"]
+
+    with patch("app.api.routes.calculate_selected_metrics") as mock_calculate:
+        second = client.post("/analyze", files=files, headers={"Accept-Encoding": "gzip"})
+        mock_calculate.assert_not_called()
+    assert second.content == first.content
+
+    # Same body for clients that don't accept compression
+    plain = client.post("/analyze", files=files, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == first.json()
+    assert set(plain.json()["author_messages"]) == {"Alice", "Bob", "Carol"}
+
+
+def test_conversation_range_stats(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "conversation_stats"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+    messages = client.get(
+        f"/conversations/{conversation_id}/messages", params={"limit": 40}
+    ).json()["messages"]
+
+    response = client.get(f"/conversations/{conversation_id}/stats")
+    assert response.status_code == 200
+    assert (
+        response.json()["conversation_stats"]
+        == client.get(
+            f"/conversations/{conversation_id}/analysis", params={"metrics": "conversation_stats"}
+        ).json()["conversation_stats"]
+    )
+
+    # Only the burst after the 10 hours gap
+    response = client.get(
+        f"/conversations/{conversation_id}/stats", params={"start": messages[20]["date"]}
+    )
+    assert response.json()["total_messages"] == 20
+    assert response.json()["conversation_stats"]["longest_conversation_length"] == 20
+
+    response = client.get(
+        f"/conversations/{conversation_id}/stats",
+        params={"start": messages[20]["date"], "end": messages[0]["date"]},
+    )
+    assert response.status_code == 400
+    assert client.get("/conversations/missing_hash/stats").status_code == 404
+
+
+def test_conversation_sessions_drilldown(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "conversation_stats"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+
+    response = client.get(f"/conversations/{conversation_id}/sessions")
+    assert response.status_code == 200
+    sessions = response.json()["sessions"]
+    assert [s["message_count"] for s in sessions] == [20, 20]
+    assert sessions[1]["started_by"] == "Carol"  # message 20
+
+    # With a gap longer than the 10 hours silence there is a single session
+    response = client.get(
+        f"/conversations/{conversation_id}/sessions", params={"gap_minutes": 12 * 60}
+    )
+    assert response.json()["total"] == 1
+
+    response = client.get(f"/conversations/{conversation_id}/sessions/initiators")
+    assert response.json()["started"] == {"Alice": 1, "Carol": 1}
+
+    response = client.get(
+        f"/conversations/{conversation_id}/sessions/1/messages", params={"limit": 15}
+    )
+    page = response.json()
+    assert page["total"] == 20
+    assert page["messages"][0]["content"] == "mensagem 20 sobre futebol"
+    response = client.get(
+        f"/conversations/{conversation_id}/sessions/1/messages",
+        params={"cursor": page["next_cursor"]},
+    )
+    assert [msg["content"] for msg in response.json()["messages"]][-1] == (
+        "mensagem 39 sobre futebol"
+    )
+    assert response.json()["next_cursor"] is None
+
+    assert client.get(f"/conversations/{conversation_id}/sessions/5/messages").status_code == 404
+    response = client.get(f"/conversations/{conversation_id}/sessions", params={"sort": "x"})
+    assert response.status_code == 400
+
+
+def test_analyze_endpoint_reply_graph(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "reply_graph"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    pairs = {
+        (pair["from_author"], pair["to_author"]): pair
+        for pair in response.json()["reply_graph"]["pairs"]
+    }
+    # Authors take turns every 7 minutes, the 10 hours gap is not a reply
+    assert set(pairs) == {("Alice", "Bob"), ("Bob", "Carol"), ("Carol", "Alice")}
+    assert pairs[("Alice", "Bob")]["count"] == 13
+    assert pairs[("Bob", "Carol")]["median_latency_seconds"] == 420
+
+
+def test_activity_rhythm_section_and_endpoint(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "activity_rhythm"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    rhythm = response.json()["activity_rhythm"]
+    assert sum(map(sum, rhythm["z"])) == 40
+    assert len(rhythm["x"]) == 24
+    conversation_id = response.json()["conversation_id"]
+
+    response = client.get(
+        f"/conversations/{conversation_id}/rhythm",
+        params={"tz_offset_minutes": -180, "resolution_minutes": 15},
+    )
+    assert response.status_code == 200
+    assert len(response.json()["x"]) == 96
+    assert sum(map(sum, response.json()["by_author"]["Alice"]["z"])) == 14
+
+    response = client.get(
+        f"/conversations/{conversation_id}/rhythm", params={"resolution_minutes": 7}
+    )
+    assert response.status_code == 400
+
+
+def test_analyze_endpoint_content_stats():
+    now = datetime.now().replace(second=0, microsecond=0) - timedelta(days=1)
+    lines = ["Automatic WhatsApp line"]
+    contents = ["<Mídia oculta>", "kkk 😂", "https://example.com", "Mensagem apagada"]
+    for i, content in enumerate(contents * 3):
+        date = (now + timedelta(minutes=i)).strftime("%d/%m/%Y %H:%M")
+        lines.append(f"{date} - {['Ana', 'Bia'][i % 2]}: {content}")
+
+    response = client.post(
+        "/analyze",
+        params={"metrics": "content_stats,common_words"},
+        files={"file": ("chat.txt", "\n".join(lines).encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    stats = response.json()["content_stats"]
+    assert stats["media_per_author"] == {"Ana": 3}
+    assert stats["emojis_per_author"] == {"Bia": 3}
+    assert stats["links_per_author"] == {"Ana": 3}
+    assert stats["kinds_per_author"]["Bia"] == {"text": 3, "deleted": 3}
+    assert "oculta" not in response.json()["common_words"]
+
+
+def test_conversation_themes_local_model():
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(days=10)
+    contents = [
+        "jogo de futebol hoje",
+        "praia nas férias",
+        "gol no jogo de futebol",
+        "hotel na praia",
+    ]
+    lines = ["First line should be ignored, it's an automatic WhatsApp line"]
+    for i in range(40):
+        date = start + timedelta(minutes=7 * i)
+        lines.append(f"{date.strftime('%d/%m/%Y %H:%M')} - Alice: {contents[i % 4]}")
+    response = client.post(
+        "/analyze",
+        params={"metrics": "conversation_stats"},
+        files={"file": ("chat.txt", "\n".join(lines).encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+
+    with patch("app.api.routes.extract_themes") as mock_extract:
+        response = client.post(
+            "/conversation-themes",
+            json={"conversation_id": conversation_id, "model": "local-nmf"},
+        )
+        mock_extract.assert_not_called()
+
+    assert response.status_code == 200
+    themes = response.json()["themes"]
+    assert any("futebol" in name for name in themes)
+    assert any("praia" in name for name in themes)
+    assert all(examples.startswith("Alice: ") for examples in themes.values())
+
+    # Served from the stored result the second time, without loading the chat
+    with patch("app.services.topic_model.extract_local_themes") as mock_local, patch(
+        "app.services.topic_model.load_stored_messages"
+    ) as mock_load:
+        response = client.post(
+            "/conversation-themes",
+            json={"conversation_id": conversation_id, "model": "local-nmf"},
+        )
+        mock_local.assert_not_called()
+        mock_load.assert_not_called()
+    assert response.json()["themes"] == themes
+
+    response = client.post(
+        "/conversation-themes", json={"conversation_id": "missing", "model": "local-nmf"}
+    )
+    assert response.status_code == 404
+
+
+def test_analyze_endpoint_sentiment():
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(days=20)
+    lines = ["First line should be ignored, it's an automatic WhatsApp line"]
+    for i in range(20):
+        date = start + timedelta(days=i)
+        author, content = ("Alice", "amei, que ótimo") if i % 2 == 0 else ("Bob", "que chato")
+        lines.append(f"{date.strftime('%d/%m/%Y %H:%M')} - {author}: {content}")
+    response = client.post(
+        "/analyze",
+        params={"metrics": "sentiment"},
+        files={"file": ("chat.txt", "\n".join(lines).encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    sentiment = response.json()["sentiment"]
+    assert sentiment["by_author"]["Alice"]["mean"] == 5
+    assert sentiment["by_author"]["Bob"]["negative_share"] == 1
+    assert len(sentiment["weekly"]) == len(sentiment["weeks"]) >= 3
+
+
+def test_conversation_activity_series(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "conversation_stats"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+
+    response = client.get(
+        f"/conversations/{conversation_id}/activity-series", params={"resolution_minutes": 60}
+    )
+    assert response.status_code == 200
+    series = response.json()
+    assert sum(series["total"]) == 40
+    assert series["total_bins"] == len(series["total"])
+    assert sum(series["by_author"]["Alice"]) == 14
+
+    response = client.get(
+        f"/conversations/{conversation_id}/activity-series",
+        params={"resolution_minutes": 15, "max_points": 10},
+    )
+    assert len(response.json()["total"]) == 10
+
+    response = client.get(
+        f"/conversations/{conversation_id}/activity-series", params={"resolution_minutes": 7}
+    )
+    assert response.status_code == 400
+    assert client.get("/conversations/missing/activity-series").status_code == 404
+
+
+def test_conversation_search(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "conversation_stats"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+
+    response = client.get(
+        f"/conversations/{conversation_id}/search",
+        params={"q": "futebol", "author": "Bob", "limit": 5},
+    )
+    assert response.status_code == 200
+    page = response.json()
+    assert page["total"] == 13
+    assert [hit["offset"] for hit in page["hits"]] == [1, 4, 7, 10, 13]
+    assert page["hits"][0]["snippet"] == "mensagem 1 sobre futebol"
+
+    response = client.get(
+        f"/conversations/{conversation_id}/search", params={"q": '"mensagem 3 sobre"'}
+    )
+    assert [hit["offset"] for hit in response.json()["hits"]] == [3]
+
+    response = client.get(f"/conversations/{conversation_id}/search", params={"q": "de o"})
+    assert response.status_code == 400
+    assert client.get("/conversations/missing/search", params={"q": "x"}).status_code == 404
+
+
+def test_analyze_endpoint_phrases(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        params={"metrics": "phrases"},
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    assert response.status_code == 200
+    phrases = response.json()["phrases"]
+    assert phrases["top_phrases"] == {"sobre futebol": 40}
+    assert phrases["top_phrases_by_author"]["Alice"] == {"sobre futebol": 14}
+
+
+def test_conversation_themes_llm_cache(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+    db = database.SessionLocal()
+    delete_llm_responses(db, conversation_id)
+    db.close()
+    request = {"conversation_id": conversation_id, "model": "gpt-4o"}
+    themes = {"themes": [{"theme": "Futebol", "example": "Alice: mensagem 0 sobre futebol"}]}
+
+    with patch("app.api.routes.extract_themes", return_value=themes) as mock_extract:
+        first = client.post("/conversation-themes", json=request)
+        repeat = client.post("/conversation-themes", json=request)
+        assert first.status_code == repeat.status_code == 200
+        assert repeat.json() == first.json()
+        assert first.json() == {"themes": {"Futebol": "Alice: mensagem 0 sobre futebol"}}
+        assert mock_extract.call_count == 1
+
+        # Another model is another answer, force_refresh asks again
+        client.post("/conversation-themes", json={**request, "model": "gpt-4o-mini"})
+        client.post("/conversation-themes", json={**request, "force_refresh": True})
+        assert mock_extract.call_count == 3
+        # The same sample is sent every time
+        seeds = {call.kwargs["seed"] for call in mock_extract.call_args_list}
+        assert len(seeds) == 1
+
+
+def test_identical_theme_requests_share_one_call(recent_chat_content):
+    response = client.post(
+        "/analyze",
+        files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+    )
+    conversation_id = response.json()["conversation_id"]
+    db = database.SessionLocal()
+    delete_llm_responses(db, conversation_id)
+    db.close()
+    themes = {"themes": [{"theme": "Futebol", "example": "Alice: mensagem 0 sobre futebol"}]}
+
+    async def slow_extract(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        return themes
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            request = {"conversation_id": conversation_id, "model": "gpt-4o"}
+            return await asyncio.gather(
+                *(client.post("/conversation-themes", json=request) for _ in range(3))
+            )
+
+    sessions = []
+
+    def tracked_session():
+        session = database_session()
+        sessions.append(MagicMock(wraps=session))
+        return sessions[-1]
+
+    database_session = database.SessionLocal
+    with patch("app.api.routes.extract_themes", side_effect=slow_extract) as mock_extract, patch(
+        "app.api.routes.database.SessionLocal", side_effect=tracked_session
+    ):
+        responses = asyncio.run(run())
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert mock_extract.call_count == 1
+    # The shared call used a session of its own, every session was closed
+    assert sessions and all(session.close.called for session in sessions)
+
+
+def fake_theme_reply(body):
+    """Every map call finds the futebol theme, the reduce call keeps the theme names"""
+    system, user = body["messages"][0]["content"], body["messages"][1]["content"]
+    if "Merge" in system or "Junte" in system:
+        names = sorted({line[2:].split(":")[0] for line in user.splitlines()})
+        themes = [{"theme": name, "example": "merged"} for name in names]
+    else:
+        themes = [{"theme": "Futebol", "examples": [user.splitlines()[0]]}]
+    return json.dumps({"themes": themes})
+
+
+def test_map_reduce_endpoint_streams_and_caches(
+    fake_encoding, fake_openai_server, recent_chat_content
+):
+    fake_openai_server["reply"] = fake_theme_reply
+    fake_openai_server["latency"] = 0.05
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/analyze",
+                    files={"file": ("chat.txt", recent_chat_content.encode(), "text/plain")},
+                )
+                conversation_id = response.json()["conversation_id"]
+                db = database.SessionLocal()
+                delete_llm_responses(db, conversation_id)
+                db.close()
+
+                request = {"conversation_id": conversation_id, "model": "gpt-4o"}
+                first = await client.post("/conversation-themes/map-reduce", json=request)
+                repeat = await client.post("/conversation-themes/map-reduce", json=request)
+                missing = await client.post(
+                    "/conversation-themes/map-reduce",
+                    json={"conversation_id": "missing", "model": "gpt-4o"},
+                )
+                streamed = await client.post(
+                    "/conversation-themes/stream", json={**request, "force_refresh": True}
+                )
+                return first, repeat, missing, streamed
+        finally:
+            await openai_client.close_openai_client()
+
+    first, repeat, missing, streamed = asyncio.run(run())
+
+    assert first.headers["content-type"] == "application/x-ndjson"
+    # Not gzip buffered, every event is sent as soon as it is ready
+    assert "content-encoding" not in first.headers
+    events = [json.loads(line) for line in first.text.splitlines()]
+    assert events[0]["event"] == "chunks"
+    assert events[-1] == {"event": "themes", "themes": {"Futebol": "merged"}}
+    # Served from the cache, without calling the LLM again
+    assert [json.loads(line) for line in repeat.text.splitlines()] == [events[-1]]
+    assert missing.status_code == 404
+
+    # The same events as server-sent events
+    assert streamed.headers["content-type"].startswith("text/event-stream")
+    blocks = streamed.text.strip().split("\n\n")
+    assert blocks[0].startswith("event: chunks\ndata: ")
+    assert [json.loads(block.split("data: ", 1)[1]) for block in blocks] == events
+    assert len(fake_openai_server["requests"]) == 2 * (events[0]["total"] + 1)
+
+
+def test_llm_endpoints_shed_load_with_retry_after(sample_simulation_data):
+    busy = AdmissionController(0, 0, 4, queue_timeout=1, initial_call_seconds=3)
+    with patch("app.api.routes.get_admission_controller", return_value=busy), patch(
+        "app.api.routes.simulate_author_message"
+    ) as mock_simulate:
+        response = client.post("/simulate-message", json=sample_simulation_data)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+        response = client.post("/simulate-message/stream", json=sample_simulation_data)
+        assert response.status_code == 503
+        mock_simulate.assert_not_called()
+
+        response = client.post(
+            "/conversation-themes/map-reduce",
+            json={"conversation_id": "test_hash", "model": "gpt-4o", "force_refresh": True},
+        )
+        assert response.status_code == 503
+
+    limited = AdmissionController(4, 4, 0, queue_timeout=1)
+    with patch("app.api.routes.get_admission_controller", return_value=limited):
+        response = client.post("/simulate-message", json=sample_simulation_data)
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
@@ -1,4 +1,12 @@
-from app.services.chatgpt_utils import parse_themes_response
+from unittest.mock import patch
+from app.services.chatgpt_utils import (
+    context_limit,
+    format_conversation_within_token_limit,
+    get_encoding,
+    parse_themes_response,
+    sample_conversation,
+    sample_seed,
+)
 
 
 def test_parse_themes_response():
@@ -93,3 +101,53 @@ def test_parse_themes_response_portuguese_exemplo():
     assert "Trabalho e Carreira" in result
     assert "josé edson" in result["Eventos e Shows"]
     assert "guilherme" in result["Trabalho e Carreira"]
+
+
+def test_packer_keeps_the_largest_prefix_that_fits(fake_encoding):
+    messages = [f"User {i}: " + "palavra " * (i % 7) for i in range(5000)]
+    system_prompt = "Analise a conversa"
+    budget = 16385 - len(fake_encoding.encode(system_prompt)) - 1000 - 100
+
+    text = format_conversation_within_token_limit(messages, system_prompt, 1000)
+    kept = text.split("\n")
+    assert kept == messages[: len(kept)]
+    assert len(fake_encoding.encode(text)) <= budget
+    # One more message would not fit
+    assert len(fake_encoding.encode("\n".join(messages[: len(kept) + 1]))) > budget
+    assert fake_encoding.batches == 1
+
+    # Larger context for gpt-4o, everything fits
+    text = format_conversation_within_token_limit(messages[:1000], system_prompt, 1000, "gpt-4o")
+    assert text == "\n".join(messages[:1000])
+    assert format_conversation_within_token_limit([], system_prompt, 1000) == ""
+
+
+def test_context_limit_per_model():
+    assert context_limit("gpt-3.5-turbo") == 16385
+    assert context_limit("gpt-4o-2024-08-06") == 128000
+    assert context_limit("gpt-4o-mini") == 128000
+    assert context_limit("gpt-4-0613") == 8192
+    assert context_limit("gpt-4-turbo-preview") == 128000
+    assert context_limit("unknown-model") == 16385
+
+
+def test_encoding_loaded_once_per_model():
+    get_encoding.cache_clear()
+    try:
+        with patch("tiktoken.encoding_for_model") as encoding_for_model:
+            get_encoding("gpt-4o")
+            get_encoding("gpt-4o")
+            get_encoding("gpt-3.5-turbo")
+        assert encoding_for_model.call_count == 2
+    finally:
+        get_encoding.cache_clear()
+
+
+def test_seeded_sampling_is_deterministic():
+    conversation = list(range(5000))
+    seed = sample_seed("abc123")
+    assert seed == sample_seed("abc123")
+    first = sample_conversation(conversation, seed=seed)
+    assert len(first) == 1000
+    assert sample_conversation(conversation, seed=seed) == first
+    assert sample_conversation(conversation, seed=sample_seed("other")) != first
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from app.services.llm_admission import AdmissionController, Overloaded, SingleFlight
+
+
+def test_waiters_served_by_priority_then_arrival():
+    async def run():
+        admission = AdmissionController(1, 10, 10, queue_timeout=5)
+        order = []
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.slot("a"):
+                await release.wait()
+
+        async def wait_turn(name, priority):
+            async with admission.slot(name, priority):
+                order.append(name)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(wait_turn(name, priority))
+            for name, priority in [("map", 2), ("simulate", 0), ("themes", 1), ("other", 1)]
+        ]
+        await asyncio.sleep(0)
+        assert admission.running == 1 and admission.queued() == 4
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        assert admission.running == 0
+        return order
+
+    assert asyncio.run(run()) == ["simulate", "themes", "other", "map"]
+
+
+def test_load_shed_with_retry_after():
+    async def run():
+        admission = AdmissionController(1, 1, 2, queue_timeout=0.05, initial_call_seconds=4)
+        release = asyncio.Event()
+
+        async def hold(client):
+            async with admission.slot(client):
+                await release.wait()
+
+        holder = asyncio.create_task(hold("a"))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold("b"))
+        await asyncio.sleep(0)
+
+        # Queue full
+        with pytest.raises(Overloaded) as busy:
+            async with admission.slot("c"):
+                pass
+        assert busy.value.status_code == 503 and busy.value.retry_after == 8
+
+        # Waited too long in the queue
+        with pytest.raises(Overloaded) as timeout:
+            await queued
+        assert timeout.value.status_code == 503
+
+        # Too many requests of one client
+        second = asyncio.create_task(hold("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as too_many:
+            admission.check("a")
+        assert too_many.value.status_code == 429
+
+        release.set()
+        await holder
+        await second
+        assert admission.running == 0 and admission.queued() == 0
+
+    asyncio.run(run())
+
+
+def test_single_flight_shares_result_and_errors():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def call(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            if value == "boom":
+                raise ValueError(value)
+            return value
+
+        results = await asyncio.gather(*(flight.do("k", lambda: call("x")) for _ in range(3)))
+        assert results == ["x", "x", "x"] and calls == ["x"]
+        assert not flight.in_flight("k")
+
+        errors = await asyncio.gather(
+            *(flight.do("e", lambda: call("boom")) for _ in range(2)), return_exceptions=True
+        )
+        assert all(isinstance(error, ValueError) for error in errors)
+
+        # A waiter leaving does not cancel the shared call
+        first = asyncio.create_task(flight.do("c", lambda: call("kept")))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("c", lambda: call("unused")))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "kept"
+        assert calls == ["x", "boom", "kept"]
+
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+import pytest
+from app import database
+from app.models.database_models import LLMResponse
+from app.services.llm_cache import (
+    delete_llm_responses,
+    evict_llm_responses,
+    llm_cache_key,
+    load_llm_response,
+    save_llm_response,
+)
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    session.query(LLMResponse).delete()
+    session.commit()
+    yield session
+    session.query(LLMResponse).delete()
+    session.commit()
+    session.close()
+
+
+def test_key_separates_model_prompt_and_seed():
+    key = llm_cache_key("themes", "abc", "gpt-4o", 1, 7)
+    assert key == llm_cache_key("themes", "abc", "gpt-4o", 1, 7)
+    assert key != llm_cache_key("themes", "abc", "gpt-4o-mini", 1, 7)
+    assert key != llm_cache_key("themes", "abc", "gpt-4o", 2, 7)
+    assert key != llm_cache_key("themes", "abc", "gpt-4o", 1, 8)
+
+
+def test_saved_response_expires_after_ttl(db):
+    save_llm_response(db, "k1", "abc", "gpt-4o", {"Futebol": "Ana: gol"})
+    assert load_llm_response(db, "k1") == {"Futebol": "Ana: gol"}
+    assert load_llm_response(db, "missing") is None
+
+    entry = db.query(LLMResponse).filter(LLMResponse.cache_key == "k1").one()
+    entry.created_at = datetime.now() - timedelta(days=30)
+    db.commit()
+    assert load_llm_response(db, "k1") is None
+    assert db.query(LLMResponse).count() == 0
+
+
+def test_least_recently_used_evicted_past_size_limit(db):
+    for i in range(4):
+        save_llm_response(db, f"k{i}", f"hash{i}", "gpt-4o", {"tema": "x" * 90})
+    size = db.query(LLMResponse).first().size
+    for i, entry in enumerate(db.query(LLMResponse).order_by(LLMResponse.cache_key)):
+        entry.last_used_at = datetime(2025, 1, 1) + timedelta(hours=i)
+    db.commit()
+    # Reading k0 makes it the most recently used
+    load_llm_response(db, "k0")
+
+    assert evict_llm_responses(db, max_bytes=2 * size) == 2
+    assert {entry.cache_key for entry in db.query(LLMResponse)} == {"k0", "k3"}
+    assert delete_llm_responses(db, "hash3") == 1
@@ -0,0 +1,50 @@
+from datetime import datetime
+from app.models.data_formats import Message, MessageKind
+from app.services.message_classifier import classify_message, scan_message
+from app.services.parsing_utils import parse_whatsapp_chat
+from app.services.text_analyzer import get_most_common_words
+
+
+def test_classify_message():
+    assert classify_message("Ana", "<Mídia oculta>") == MessageKind.MEDIA
+    assert classify_message("Ana", "‎image omitted") == MessageKind.MEDIA
+    assert classify_message("Ana", "figurinha omitida") == MessageKind.STICKER
+    assert classify_message("Ana", "Esta mensagem foi apagada") == MessageKind.DELETED
+    assert classify_message("Ana", "olha https://example.com/x?y=1") == MessageKind.LINK
+    assert classify_message("Ana", "a mídia oculta do filme") == MessageKind.TEXT
+    assert classify_message("None", "Ana added Bia") == MessageKind.SYSTEM
+
+
+def test_scan_message():
+    emojis, urls = scan_message("kkk 😂😂 vê www.site.com.br e https://a.b 👍🏽 ❤️ 👨‍👩‍👧")
+    assert emojis == ["😂", "😂", "👍🏽", "❤️", "👨‍👩‍👧"]
+    assert urls == 2
+    assert scan_message("sem nada") == ([], 0)
+
+
+def test_parser_tags_messages_and_word_counts_skip_placeholders():
+    now = datetime.now().strftime("%d/%m/%Y %H:%M")
+    chat = "\n".join(
+        [
+            f"{now} - Ana: <Mídia oculta>",
+            f"{now} - Bia: Mensagem apagada",
+            f"{now} - Ana: futebol hoje https://jogo.com",
+            f"{now} - Bia: futebol 😂",
+        ]
+    )
+    _, author_and_messages, conversation = parse_whatsapp_chat(chat)
+
+    assert [msg.kind for msg in conversation] == [
+        MessageKind.MEDIA,
+        MessageKind.DELETED,
+        MessageKind.LINK,
+        MessageKind.TEXT,
+    ]
+    words = get_most_common_words(author_and_messages)
+    assert words["futebol"] == 2
+    assert "apagada" not in words
+
+
+def test_message_kind_defaults_to_text():
+    msg = Message.model_validate({"date": "2024-01-01T10:00:00", "author": "A", "content": "x"})
+    assert msg.kind == MessageKind.TEXT
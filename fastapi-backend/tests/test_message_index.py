@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from app.services.message_index import MessageIndex
+
+
+def build_messages(n=60, shuffled=False):
+    start = datetime(2024, 6, 1, 8, 0)
+    minutes = np.arange(n) * 7
+    if shuffled:
+        minutes = np.random.default_rng(3).permutation(minutes)
+    return [
+        {
+            "date": (start + timedelta(minutes=int(m))).isoformat(),
+            "author": ["Ana", "Bia", "Caio"][i % 3],
+            "content": f"mensagem {i}",
+        }
+        for i, m in enumerate(minutes)
+    ]
+
+
+def brute_force(messages, author, start, end, first, last):
+    return [
+        i
+        for i, msg in enumerate(messages[first:last], first)
+        if (author is None or msg["author"] == author)
+        and (start is None or datetime.fromisoformat(msg["date"]) >= start)
+        and (end is None or datetime.fromisoformat(msg["date"]) < end)
+    ]
+
+
+@pytest.mark.parametrize("shuffled", [False, True])
+def test_filters_match_a_scan(shuffled):
+    messages = build_messages(shuffled=shuffled)
+    index = MessageIndex.from_bytes(MessageIndex.build(messages).to_bytes())
+    assert index.in_date_order is not shuffled
+
+    base = datetime(2024, 6, 1, 8, 0)
+    for author in [None, "Bia", "Nobody"]:
+        for start, end in [
+            (None, None),
+            (base + timedelta(minutes=70), None),
+            (None, base + timedelta(minutes=70)),
+            (base + timedelta(minutes=35), base + timedelta(minutes=300)),
+        ]:
+            for first, last in [(0, None), (10, 40)]:
+                expected = brute_force(messages, author, start, end, first, last)
+                assert index.matching(author, start, end, first, last).tolist() == expected
+
+                # Following the cursors reads every match once
+                seen, cursor = [], 0
+                while cursor is not None:
+                    page = index.page(cursor, 4, author, start, end, first, last)
+                    assert page.total == len(expected)
+                    seen.extend(int(msg.content.split()[1]) for msg in page.messages)
+                    cursor = page.next_cursor
+                assert seen == expected
+
+
+def test_dates_with_utc_offset_are_rejected():
+    index = MessageIndex.build(build_messages())
+    with pytest.raises(ValueError):
+        index.matching(start=datetime(2024, 6, 1, 9, 0, tzinfo=timezone.utc))
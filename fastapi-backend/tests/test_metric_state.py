@@ -0,0 +1,155 @@
+import pytest
+from datetime import datetime, timedelta
+from app.models.data_formats import Message
+from app.services import metric_state
+from app.services.metric_state import (
+    ConversationAggregate,
+    VocabularyState,
+    aggregate_in_chunks,
+    tokenize,
+)
+from app.services.text_analyzer import (
+    calculate_conversation_stats,
+    create_messages_heatmap,
+    get_most_common_words,
+    get_word_metrics,
+)
+
+
+@pytest.fixture
+def parsed_conversation():
+    start = datetime(2024, 3, 1, 8, 0)
+    authors = ["Alice", "Bob", "Carol"]
+    words = ["futebol", "praia", "porra", "cerveja", "trabalho"]
+    conversation = []
+    minutes = 0
+    for i in range(300):
+        # Bursts of messages separated by long gaps, so there are several sessions
+        minutes += 240 if i % 37 == 0 else 3
+        conversation.append(
+            Message(
+                date=start + timedelta(minutes=minutes),
+                author=authors[(i * 7) % 3],
+                content=f"{words[i % 5]} {words[(i * 3) % 5]} mensagem {i % 11}",
+            )
+        )
+    author_and_messages = {}
+    for msg in conversation:
+        author_and_messages.setdefault(msg.author, []).append(msg)
+    dates = [msg.date for msg in conversation]
+    return dates, author_and_messages, conversation
+
+
+def test_aggregate_matches_analyzers(parsed_conversation):
+    dates, author_and_messages, conversation = parsed_conversation
+    aggregate = ConversationAggregate.from_conversation(dates, conversation)
+
+    assert aggregate.conversation_stats() == calculate_conversation_stats(
+        conversation, author_and_messages
+    )
+    assert aggregate.word_metrics() == get_word_metrics(author_and_messages)
+    assert aggregate.heatmap_data() == create_messages_heatmap(dates)
+    assert aggregate.common_words() == get_most_common_words(author_and_messages)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 37, 100, 1000])
+def test_chunked_aggregate_is_identical(parsed_conversation, chunk_size):
+    dates, _, conversation = parsed_conversation
+    expected = ConversationAggregate.from_conversation(dates, conversation)
+    chunked = aggregate_in_chunks(dates, conversation, chunk_size)
+
+    assert chunked.to_dict() == expected.to_dict()
+    assert chunked.conversation_stats() == expected.conversation_stats()
+
+
+def test_aggregate_serialization_and_incremental_update(parsed_conversation):
+    dates, _, conversation = parsed_conversation
+    expected = ConversationAggregate.from_conversation(dates, conversation)
+
+    # Persist the state of the first messages, then fold in the rest later
+    stored = ConversationAggregate.from_conversation(dates[:250], conversation[:250]).to_dict()
+    restored = ConversationAggregate.from_dict(stored)
+    restored.update(dates[250:], conversation[250:])
+
+    assert restored.to_dict() == expected.to_dict()
+    assert restored.word_metrics() == expected.word_metrics()
+
+
+def test_sketched_common_words_match_exact_on_skewed_chat(parsed_conversation):
+    dates, author_and_messages, conversation = parsed_conversation
+    exact = get_most_common_words(author_and_messages, top_n=5)
+    sketched = get_most_common_words(
+        author_and_messages, top_n=5, max_exact_messages=0, sketch_capacity=50
+    )
+    chunked = aggregate_in_chunks(dates, conversation, 60, parts=["word_sketch"])
+
+    assert sketched == exact
+    assert chunked.common_words(top_n=5) == exact
+
+
+def test_sketch_update_tokenizes_one_chunk_at_a_time(parsed_conversation, monkeypatch):
+    dates, author_and_messages, conversation = parsed_conversation
+    tokenized = []
+
+    def tracked_tokenize(messages):
+        tokenized.append(len(messages))
+        return tokenize(messages)
+
+    monkeypatch.setattr(metric_state, "UPDATE_CHUNK_SIZE", 40)
+    monkeypatch.setattr(metric_state, "tokenize", tracked_tokenize)
+    aggregate = ConversationAggregate.from_conversation(
+        dates, conversation, parts=["word_sketch", "heatmap"]
+    )
+
+    assert max(tokenized) == 40 and sum(tokenized) == len(conversation)
+    assert aggregate.common_words(top_n=5) == get_most_common_words(author_and_messages, top_n=5)
+    assert aggregate.heatmap_data() == create_messages_heatmap(dates)
+
+
+def test_vocabulary_richness_matches_exact_counts(parsed_conversation):
+    dates, author_and_messages, conversation = parsed_conversation
+    richness = VocabularyState().update(dates, conversation).richness()
+    metrics = get_word_metrics(author_and_messages)
+
+    assert richness["vocabulary_size"] == metrics.vocabulary_size
+    assert richness["hapax_legomena"] == metrics.hapax_legomena
+    assert set(metrics.vocabulary_size) == {"Alice", "Bob", "Carol"}
+    assert metrics.distinct_words_per_month == {"2024-03": 17}
+
+
+def test_sketched_vocabulary_is_close_to_exact(parsed_conversation):
+    dates, _, conversation = parsed_conversation
+    exact = VocabularyState().update(dates, conversation).richness()
+
+    # Switch to sketches after the first chunk, then merge chunks from both modes
+    sketched = VocabularyState(max_exact_tokens=100).update(dates[:150], conversation[:150])
+    assert not sketched.exact
+    rest = VocabularyState().update(dates[150:], conversation[150:])
+    sketched = VocabularyState.from_dict(sketched.to_dict()).merge(rest)
+    estimate = sketched.richness()
+
+    assert sum(sketched.tokens_per_author.values()) == sum(
+        len(words) for words in tokenize(conversation)
+    )
+    for author, size in exact["vocabulary_size"].items():
+        assert abs(estimate["vocabulary_size"][author] - size) <= 1
+        assert abs(estimate["hapax_legomena"][author] - exact["hapax_legomena"][author]) <= 1
+    assert estimate["distinct_words_per_month"] == exact["distinct_words_per_month"]
+
+
+def test_content_counts_are_mergeable(parsed_conversation):
+    dates, _, conversation = parsed_conversation
+    conversation = conversation + [
+        Message(date=conversation[-1].date, author="Alice", content="<Mídia oculta>", kind=1),
+        Message(date=conversation[-1].date, author="Bob", content="boa 😂 https://a.com", kind=4),
+    ]
+    dates = dates + [msg.date for msg in conversation[-2:]]
+    expected = ConversationAggregate.from_conversation(dates, conversation, ["content"])
+    chunked = aggregate_in_chunks(dates, conversation, 50, parts=["content"])
+
+    assert chunked.to_dict() == expected.to_dict()
+    stats = expected.content_stats()
+    assert stats.media_per_author == {"Alice": 1}
+    assert stats.links_per_author == {"Bob": 1}
+    assert stats.top_emojis == {"😂": 1}
+    assert stats.kinds_per_author["Bob"]["link"] == 1
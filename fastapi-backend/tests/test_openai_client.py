@@ -0,0 +1,97 @@
+import asyncio
+import json
+import time
+import httpx
+from app.main import app
+from app.services import openai_client
+from tests.conftest import serve
+
+N_REQUESTS = 10
+
+PAYLOAD = {
+    "conversation": [
+        {"date": "2025-01-18T20:31:00", "author": "Alice", "content": "Oi gente!"},
+        {"date": "2025-01-18T20:32:00", "author": "Bob", "content": "E aí Alice"},
+    ],
+    "author": "Alice",
+    "prompt": "Tudo bem?",
+    "language": "pt",
+    "model": "gpt-4o-mini",
+}
+
+
+async def post_as(host, payload, path="/simulate-message"):
+    """A request from its own client address, like a different user"""
+    transport = httpx.ASGITransport(app=app, client=(host, 5000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, json=payload)
+
+
+def test_concurrent_simulations_do_not_serialise(fake_openai_server):
+    payload = PAYLOAD
+
+    async def run():
+        try:
+            started = time.perf_counter()
+            responses = await asyncio.gather(
+                *(
+                    post_as(f"10.0.0.{i}", {**payload, "prompt": f"Tudo bem? {i}"})
+                    for i in range(N_REQUESTS)
+                )
+            )
+            elapsed = time.perf_counter() - started
+            shared = openai_client.get_openai_client()
+            return responses, elapsed, shared
+        finally:
+            await openai_client.close_openai_client()
+
+    responses, elapsed, shared = asyncio.run(run())
+
+    assert all(response.status_code == 200 for response in responses)
+    messages = {response.json()["simulated_message"] for response in responses}
+    assert messages == {"tudo certo por aqui"}
+    # Sequential calls would take N_REQUESTS times the latency
+    assert fake_openai_server["max_in_flight"] > 1
+    assert elapsed < N_REQUESTS * fake_openai_server["latency"] / 2
+    assert str(shared.base_url).startswith("http://127.0.0.1")
+
+
+def test_identical_simulations_share_one_call(fake_openai_server):
+    async def run():
+        try:
+            return await asyncio.gather(*(post_as("10.0.1.1", PAYLOAD) for _ in range(3)))
+        finally:
+            await openai_client.close_openai_client()
+
+    responses = asyncio.run(run())
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert len(fake_openai_server["requests"]) == 1
+
+
+def test_streamed_simulation_first_byte_at_first_token_latency(fake_openai_server):
+    words = ["Oi", "gente,", "tudo", "certo", "por", "aqui", "e", "com", "vocês?"]
+    fake_openai_server["reply"] = lambda body: " ".join(words)
+    fake_openai_server["first_token_latency"] = 0.2
+    fake_openai_server["token_latency"] = 0.2
+
+    # Through a real server, the ASGI test transport hands the body over only once complete
+    with serve(app) as port:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            started = time.perf_counter()
+            with client.stream("POST", "/simulate-message/stream", json=PAYLOAD) as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                events = []
+                for line in response.iter_lines():
+                    if line.startswith("data: "):
+                        events.append((time.perf_counter() - started, json.loads(line[6:])))
+
+    first_byte, first = events[0]
+    total, done = events[-1]
+    assert first["event"] == "delta" and first["text"] == "Oi"
+    assert done == {"event": "done", "simulated_message": " ".join(words)}
+    assert "".join(event["text"] for _, event in events[:-1]) == " ".join(words)
+    # The first words arrive at the model's first token, long before the whole message
+    assert first_byte < 0.2 + 0.3
+    assert total >= 0.2 + 0.2 * (len(words) - 1)
+    assert fake_openai_server["requests"][0]["stream"] is True
@@ -0,0 +1,106 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import numpy as np
+from app.models.data_formats import Message, MessageKind
+from app.services.phrase_mining import _TokenStream, calculate_phrase_stats, mine_phrases
+from app.services.text_analyzer import get_most_common_words, tokenize_text
+
+CATCHPHRASES = ["tá de boa", "vamo que vamo", "bom dia grupo", "que calor"]
+FILLER = "hoje amanhã casa jogo trabalho comida cinema praia festa mano".split()
+
+
+def build_conversation(n=600, seed=11):
+    rng = np.random.default_rng(seed)
+    conversation = []
+    for i in range(n):
+        words = list(rng.choice(FILLER, size=int(rng.integers(1, 6))))
+        if rng.random() < 0.3:
+            words.insert(int(rng.integers(0, len(words) + 1)), str(rng.choice(CATCHPHRASES)))
+        conversation.append(
+            Message(
+                date=datetime(2024, 1, 1) + timedelta(minutes=i),
+                author=["Ana", "Bia"][i % 2],
+                content=" ".join(words),
+            )
+        )
+    return conversation
+
+
+def naive_ngrams(conversation, length):
+    counts = Counter()
+    for msg in conversation:
+        words = tokenize_text(msg.content)
+        counts.update(" ".join(words[i : i + length]) for i in range(len(words) - length + 1))
+    return counts
+
+
+def test_frequent_ngrams_match_naive_counts():
+    conversation = build_conversation()
+    levels = mine_phrases(_TokenStream(conversation), min_count=5, max_length=3)
+
+    for length in (2, 3):
+        expected = {
+            phrase: count
+            for phrase, count in naive_ngrams(conversation, length).items()
+            if count >= 5
+        }
+        level = levels[length - 1]
+        assert dict(zip(level.texts, level.counts.tolist())) == expected
+
+
+def test_phrase_stats_report_catchphrases():
+    conversation = build_conversation()
+    conversation.append(
+        Message(
+            date=datetime(2024, 2, 1),
+            author="Ana",
+            content="<Mídia oculta>",
+            kind=MessageKind.MEDIA,
+        )
+    )
+    stats = calculate_phrase_stats(conversation)
+
+    for phrase in ("tá de boa", "vamo que vamo", "bom dia grupo", "que calor"):
+        assert phrase in stats.top_phrases
+    # Always part of "tá de boa", so not reported alone
+    assert "de boa" not in stats.top_phrases
+    counts = list(stats.top_phrases.values())
+    assert counts == sorted(counts, reverse=True)
+    for phrase, count in stats.top_phrases.items():
+        assert (
+            sum(stats.top_phrases_by_author[author].get(phrase, 0) for author in ["Ana", "Bia"])
+            <= count
+        )
+
+
+def test_candidate_cap_keeps_the_most_frequent():
+    conversation = build_conversation()
+    stream = _TokenStream(conversation)
+    full = mine_phrases(stream, min_count=2, max_length=3)
+    capped = mine_phrases(stream, min_count=2, max_length=3, max_candidates=10)
+
+    for full_level, capped_level in zip(full[1:], capped[1:]):
+        assert len(capped_level.counts) <= 10
+        exact = dict(zip(full_level.texts, full_level.counts.tolist()))
+        for text, count in zip(capped_level.texts, capped_level.counts.tolist()):
+            assert exact[text] == count
+    top_bigrams = sorted(full[1].counts.tolist(), reverse=True)[:10]
+    assert sorted(capped[1].counts.tolist(), reverse=True) == top_bigrams
+
+
+def test_phrase_stats_empty_conversation():
+    stats = calculate_phrase_stats([])
+    assert stats.top_phrases == {}
+    assert stats.top_phrases_by_author == {}
+
+
+def test_phrases_split_words_like_the_common_words():
+    conversation = [
+        Message(date=datetime(2024, 1, 1, 9, i), author="Ana", content=content)
+        for i, content in enumerate(["Foda-se, partiu praia!", "foda-se partiu praia"] * 3)
+    ]
+    phrases = calculate_phrase_stats(conversation, min_count=3).top_phrases
+    common = get_most_common_words({"Ana": conversation})
+
+    assert phrases == {"partiu praia": 6, "fodase partiu praia": 3, "Fodase partiu praia": 3}
+    assert {word for phrase in phrases for word in phrase.split()} <= set(common)
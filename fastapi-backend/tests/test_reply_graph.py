@@ -0,0 +1,56 @@
+import statistics
+from collections import defaultdict
+from datetime import datetime, timedelta
+import numpy as np
+from app.services.reply_graph import REPLY_LATENCY_BINS, calculate_reply_graph
+
+
+def naive_reply_graph(messages, max_latency):
+    latencies = defaultdict(list)
+    for previous, current in zip(messages, messages[1:]):
+        latency = (current[0] - previous[0]).total_seconds()
+        if previous[1] != current[1] and 0 <= latency <= max_latency:
+            latencies[(previous[1], current[1])].append(latency)
+    return latencies
+
+
+def test_reply_graph_matches_naive_count():
+    start = datetime(2024, 6, 1, 10, 0)
+    authors = ["Ana", "Bia", "Caio", "Duda"]
+    rng = np.random.default_rng(3)
+    messages, date = [], start
+    for i in range(500):
+        date += timedelta(seconds=int(rng.choice([5, 40, 90, 400, 1500, 4000])))
+        messages.append((date, authors[int(rng.integers(0, 4))]))
+
+    graph = calculate_reply_graph(
+        authors,
+        np.array([authors.index(author) for _, author in messages]),
+        np.array([date for date, _ in messages], dtype="datetime64[s]"),
+        max_latency_seconds=1800,
+    )
+    expected = naive_reply_graph(messages, 1800)
+
+    assert {(p.from_author, p.to_author): p.count for p in graph.pairs} == {
+        pair: len(values) for pair, values in expected.items()
+    }
+    counts = [p.count for p in graph.pairs]
+    assert counts == sorted(counts, reverse=True)
+    for pair in graph.pairs:
+        values = expected[(pair.from_author, pair.to_author)]
+        assert pair.median_latency_seconds == statistics.median(values)
+        assert sum(pair.latency_histogram) == pair.count
+        assert len(pair.latency_histogram) == len(REPLY_LATENCY_BINS) + 1
+
+    for author, median in graph.median_reply_latency.items():
+        replies = [v for (_, to), values in expected.items() if to == author for v in values]
+        assert median == statistics.median(replies)
+        assert graph.replies_per_author[author] == len(replies)
+
+
+def test_reply_graph_single_author():
+    graph = calculate_reply_graph(
+        ["Ana"], np.zeros(3, dtype=np.int32), np.arange(3).astype("datetime64[s]")
+    )
+    assert graph.pairs == []
+    assert graph.replies_per_author == {}
@@ -0,0 +1,33 @@
+import gzip
+import json
+from datetime import datetime
+from unittest.mock import patch
+from app.models.data_formats import AnalysisResponse, Message
+from app.services import response_cache
+from app.services.response_cache import encode_json, negotiate_encoding
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(None) == "identity"
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, deflate") == "identity"
+    assert negotiate_encoding("*") in ("br", "gzip")
+    with patch.object(response_cache, "brotli", object()):
+        assert negotiate_encoding("gzip, br") == "br"
+        assert negotiate_encoding("gzip, br;q=0") == "gzip"
+    with patch.object(response_cache, "brotli", None):
+        assert negotiate_encoding("br") == "identity"
+
+
+def test_encode_json_matches_pydantic_serialization():
+    response = AnalysisResponse(
+        common_words={"futebol": 3, "praia": 1},
+        author_messages={
+            "Alice": [Message(date=datetime(2025, 1, 18, 20, 31), author="Alice", content="Oi")]
+        },
+        conversation_id="abc",
+    )
+    body = encode_json(response)
+
+    assert json.loads(body) == json.loads(response.model_dump_json(exclude_none=True))
+    assert gzip.decompress(response_cache._compress(body, "gzip")) == body
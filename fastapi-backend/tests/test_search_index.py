@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+import re
+import numpy as np
+import pytest
+from app.models.data_formats import Message
+from app.services.message_index import MessageIndex
+from app.services.parsing_utils import message_to_dict
+from app.services.search_index import SearchIndex, parse_query, snippet
+from app.services.term_matrix import TermMatrix
+
+CONTENTS = [
+    "Vamos ao jogo de futebol amanhã?",
+    "o futebol de hoje foi bom",
+    "Jogo cancelado, chuva forte",
+    "bora jogar futebol no sábado",
+    "amanhã tem reunião do projeto",
+    "FUTEBOL amanhã cedo",
+]
+
+
+def build_indexes(n=120):
+    start = datetime(2024, 4, 1, 9, 0)
+    conversation = [
+        Message(
+            date=start + timedelta(hours=i),
+            author=["Ana", "Bia", "Caio"][i % 3],
+            content=CONTENTS[i % len(CONTENTS)],
+        )
+        for i in range(n)
+    ]
+    index = SearchIndex.from_bytes(SearchIndex.build(TermMatrix.build(conversation)).to_bytes())
+    messages = MessageIndex.build([message_to_dict(msg) for msg in conversation])
+    return conversation, index, messages
+
+
+def test_postings_match_a_scan():
+    conversation, index, _ = build_indexes()
+    expected = [i for i, msg in enumerate(conversation) if "futebol" in msg.content.lower()]
+    assert index.postings("futebol").tolist() == expected
+    assert index.postings("inexistente").tolist() == []
+    # Gaps between 120 positions fit in a byte
+    assert index.gaps.dtype == np.uint8
+
+
+def test_search_words_phrases_and_filters():
+    conversation, index, messages = build_indexes()
+
+    page = index.search(messages, "futebol amanhã", limit=100)
+    expected = [
+        i
+        for i, msg in enumerate(conversation)
+        if "futebol" in msg.content.lower() and "amanhã" in msg.content.lower()
+    ]
+    assert [hit.offset for hit in page.hits] == expected
+    assert page.total == len(expected)
+
+    page = index.search(messages, '"jogo de futebol"', limit=100)
+    assert {hit.message.content for hit in page.hits} == {"Vamos ao jogo de futebol amanhã?"}
+
+    page = index.search(messages, "futebol", author="Bia", limit=100)
+    assert page.hits and all(hit.message.author == "Bia" for hit in page.hits)
+    # The end of the range is excluded, the 12:00 message is left out
+    page = index.search(messages, "futebol", end=datetime(2024, 4, 1, 12, 0), limit=100)
+    assert [hit.offset for hit in page.hits] == [0, 1]
+    page = index.search(messages, "futebol", end=datetime(2024, 4, 1, 12, 1), limit=100)
+    assert [hit.offset for hit in page.hits] == [0, 1, 3]
+
+    with pytest.raises(ValueError):
+        index.search(messages, "de o")
+
+
+def test_search_paging():
+    _, index, messages = build_indexes()
+    everything = index.search(messages, "futebol", limit=1000)
+    offsets, cursor = [], 0
+    while cursor is not None:
+        page = index.search(messages, "futebol", cursor=cursor, limit=7)
+        offsets += [hit.offset for hit in page.hits]
+        cursor = page.next_cursor
+    assert offsets == [hit.offset for hit in everything.hits]
+
+
+def test_parse_query_and_snippet():
+    assert parse_query('Futebol "de boa" o') == (["boa", "futebol"], ["de boa"])
+
+    content = "x" * 200 + " futebol " + "y" * 200
+    text = snippet(content, re.compile("futebol"), size=40)
+    assert "futebol" in text
+    assert text.startswith("…") and text.endswith("…")
+    assert snippet("curta", re.compile("futebol")) == "curta"
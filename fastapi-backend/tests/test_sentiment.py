@@ -0,0 +1,76 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import math
+import numpy as np
+from app.models.data_formats import Message, MessageKind
+from app.services.sentiment import calculate_sentiment, score_message, score_messages
+
+
+def test_score_message_lexicon_matches():
+    assert score_message("Amei o filme, ótimo!") == 3 + 2
+    assert score_message("otimo demais") == 2 + 1  # accentless spelling
+    assert score_message("não gostei") == -2
+    assert score_message("not bad at all") == 2
+    assert score_message("FELIZ ANIVERSÁRIO") == 3
+    assert score_message("kkkkkk que chato") == 1 - 2
+    assert math.isnan(score_message("amores"))  # "amor" only as a whole word
+    assert math.isnan(score_message("vamos amanhã às 10"))
+
+
+def test_score_messages_skips_non_text():
+    messages = [
+        Message(date=datetime(2024, 1, 1), author="Ana", content="que bom"),
+        Message(
+            date=datetime(2024, 1, 1),
+            author="Ana",
+            content="<Mídia oculta>",
+            kind=MessageKind.MEDIA,
+        ),
+    ]
+    scores = score_messages(messages)
+    assert scores[0] == 1
+    assert np.isnan(scores[1])
+
+
+def test_weekly_sentiment_matches_naive_grouping():
+    rng = np.random.default_rng(7)
+    authors = ["Ana", "Bia", "Caio"]
+    start = datetime(2024, 2, 7, 12, 0)  # a Wednesday
+    dates = [start + timedelta(hours=int(h)) for h in np.sort(rng.integers(0, 24 * 60, 400))]
+    message_authors = rng.integers(0, 3, len(dates))
+    scores = np.where(rng.random(len(dates)) < 0.3, np.nan, rng.integers(-3, 4, len(dates)))
+
+    series = calculate_sentiment(
+        authors, message_authors, np.array(dates, dtype="datetime64[s]"), scores
+    )
+
+    expected = defaultdict(list)
+    for date, code, score in zip(dates, message_authors, scores):
+        if not np.isnan(score):
+            monday = (date - timedelta(days=date.weekday())).date().isoformat()
+            expected[(authors[code], monday)].append(score)
+
+    assert series.weeks[0] == "2024-02-05"
+    for author, sentiment in series.by_author.items():
+        assert len(sentiment.weekly) == len(series.weeks)
+        for week, mean in zip(series.weeks, sentiment.weekly):
+            values = expected.get((author, week))
+            if values:
+                assert mean == round(float(np.mean(values)), 4)
+            else:
+                assert mean is None
+        all_values = [v for (a, _), values in expected.items() if a == author for v in values]
+        assert sentiment.positive_share == round(
+            sum(v > 0 for v in all_values) / len(all_values), 4
+        )
+
+
+def test_sentiment_without_scored_messages():
+    series = calculate_sentiment(
+        ["Ana"],
+        np.zeros(2, dtype=np.int32),
+        np.arange(2).astype("datetime64[s]"),
+        np.full(2, np.nan),
+    )
+    assert series.weeks == []
+    assert series.by_author == {}
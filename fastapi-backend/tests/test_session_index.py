@@ -0,0 +1,93 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from app import database
+from app.models.data_formats import Message
+from app.services import session_index
+from app.services.artifact_store import artifact_exists, delete_artifacts
+from app.services.parsing_utils import message_to_dict
+from app.services.session_index import (
+    SESSION_INDEX_KIND,
+    SessionIndex,
+    get_or_build_session_index,
+)
+from app.services.text_analyzer import calculate_conversation_parts
+
+
+@pytest.fixture
+def conversation():
+    start = datetime(2024, 5, 1, 9, 0)
+    authors = ["Alice", "Bob", "Carol"]
+    messages = []
+    minutes = 0
+    for i in range(200):
+        # Gaps of 45 minutes split sessions at a 30 minutes gap, not at a 60 minutes one
+        minutes += 240 if i % 31 == 0 else 45 if i % 9 == 0 else 2
+        messages.append(
+            Message(
+                date=start + timedelta(minutes=minutes),
+                author=authors[(i * i) % 3],
+                content=f"mensagem {i}",
+            )
+        )
+    return messages
+
+
+def test_sessions_match_conversation_parts(conversation):
+    index = SessionIndex.build([message_to_dict(msg) for msg in conversation])
+    lengths = calculate_conversation_parts(conversation)[4]
+
+    assert index.lengths().tolist() == lengths
+    for k in range(len(index)):
+        first, last = index.starts[k], index.ends[k]
+        session = conversation[first:last]
+        summary = index.summary(k)
+        assert summary.start == session[0].date and summary.end == session[-1].date
+        assert summary.started_by == session[0].author
+        assert summary.ended_by == session[-1].author
+        assert set(summary.participants) == {msg.author for msg in session}
+
+
+def test_gap_threshold_and_serialization(conversation):
+    messages = [message_to_dict(msg) for msg in conversation]
+    short_gap = SessionIndex.build(messages, gap_seconds=30 * 60)
+    long_gap = SessionIndex.from_bytes(SessionIndex.build(messages, gap_seconds=60 * 60).to_bytes())
+
+    assert len(long_gap) < len(short_gap)
+    assert long_gap.lengths().tolist() == calculate_conversation_parts(conversation, 60 * 60)[4]
+    assert long_gap.gap_seconds == 3600
+
+
+def test_sorted_pages_and_initiators(conversation):
+    index = SessionIndex.build([message_to_dict(msg) for msg in conversation])
+    longest = index.page(sort="length", descending=True, limit=3).sessions
+
+    assert [s.message_count for s in longest] == sorted(index.lengths().tolist())[::-1][:3]
+    assert index.page(offset=2, limit=1).sessions[0].session_id == 2
+    initiators = index.initiators()
+    assert sum(initiators.started.values()) == sum(initiators.ended.values()) == len(index)
+
+    with pytest.raises(ValueError):
+        index.page(sort="unknown")
+
+
+def test_only_the_default_gap_is_persisted(conversation, monkeypatch):
+    load = MagicMock(return_value=[message_to_dict(msg) for msg in conversation])
+    monkeypatch.setattr(session_index, "load_stored_messages", load)
+    db = database.SessionLocal()
+    try:
+        delete_artifacts(db, "session-test")
+        session_index._other_gaps_cache.clear()
+        other_gap = get_or_build_session_index(db, "session-test", 60 * 60)
+        # Kept in the process, never stored
+        assert get_or_build_session_index(db, "session-test", 60 * 60) is other_gap
+        assert load.call_count == 1
+        assert not artifact_exists(db, "session-test", SESSION_INDEX_KIND)
+
+        get_or_build_session_index(db, "session-test")
+        assert artifact_exists(db, "session-test", SESSION_INDEX_KIND)
+        stored = get_or_build_session_index(db, "session-test")
+        assert load.call_count == 2 and len(stored) > len(other_gap)
+    finally:
+        delete_artifacts(db, "session-test")
+        db.close()
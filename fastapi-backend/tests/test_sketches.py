@@ -0,0 +1,89 @@
+import random
+import pytest
+from collections import Counter
+from app.services.sketches import DistinctSample, HyperLogLog, SpaceSaving
+
+
+def zipf_stream(size, vocabulary, seed=0):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, vocabulary + 1)]
+    return rng.choices([f"w{i}" for i in range(vocabulary)], weights=weights, k=size)
+
+
+def test_space_saving_finds_heavy_hitters_within_error_bound():
+    stream = zipf_stream(50_000, 5_000)
+    exact = Counter(stream)
+    sketch = SpaceSaving(capacity=200)
+    sketch.update(stream)
+
+    assert len(sketch.counts) == 200
+    bound = sketch.total / sketch.capacity
+    for word, count in sketch.items():
+        assert exact[word] <= count <= exact[word] + bound
+        assert sketch.guaranteed_count(word) <= exact[word]
+    # Every item above the error bound is kept, so the head of the distribution is exact
+    assert [w for w, _ in sketch.most_common(10)] == [w for w, _ in exact.most_common(10)]
+
+
+def test_space_saving_merge_and_serialization():
+    first, second = zipf_stream(20_000, 3_000, seed=1), zipf_stream(20_000, 3_000, seed=2)
+    exact = Counter(first + second)
+
+    left, right = SpaceSaving(capacity=300), SpaceSaving(capacity=300)
+    left.update(first)
+    right.update(second)
+    merged = SpaceSaving.from_dict(left.to_dict()).merge(right)
+
+    assert merged.total == len(first) + len(second)
+    bound = merged.total / merged.capacity
+    for word, count in merged.most_common(20):
+        assert exact[word] <= count <= exact[word] + bound
+    assert [w for w, _ in merged.most_common(5)] == [w for w, _ in exact.most_common(5)]
+
+
+def test_space_saving_is_exact_below_capacity():
+    sketch = SpaceSaving.for_error(0.01)
+    sketch.update(["a", "b", "a", "c", "a", "b"])
+    assert sketch.capacity == 100
+    assert sketch.most_common(2) == [("a", 3), ("b", 2)]
+
+
+def test_hyperloglog_estimates_distinct_count_within_error():
+    sketch = HyperLogLog(precision=12)
+    sketch.update(f"w{i}" for i in range(100_000))
+    # Relative standard error is ~1.6%, allow for 3 standard errors
+    assert abs(sketch.count() - 100_000) <= 0.05 * 100_000
+    assert sketch.memory_bytes() == 4096
+
+
+def test_hyperloglog_is_near_exact_for_small_sets_and_mergeable():
+    left, right = HyperLogLog(), HyperLogLog()
+    left.update(f"w{i}" for i in range(300))
+    right.update(f"w{i}" for i in range(200, 500))
+    # Duplicates don't change the registers
+    left.update(f"w{i}" for i in range(300))
+
+    assert abs(left.count() - 300) <= 3
+    merged = HyperLogLog.from_dict(left.to_dict()).merge(right)
+    assert abs(merged.count() - 500) <= 5
+
+    with pytest.raises(ValueError):
+        left.merge(HyperLogLog(precision=14))
+
+
+def test_distinct_sample_merge_keeps_exact_counts():
+    first, second = zipf_stream(20_000, 3_000, seed=1), zipf_stream(20_000, 3_000, seed=2)
+    exact = Counter(first + second)
+
+    left, right = DistinctSample(size=256), DistinctSample(size=256)
+    left.update(first)
+    right.update(second)
+    merged = DistinctSample.from_dict(left.to_dict()).merge(right)
+
+    assert len(merged.counts) == 256
+    for word, count in merged.counts.items():
+        assert count == exact[word]
+    # The sample is the same whichever way the stream was split
+    whole = DistinctSample(size=256)
+    whole.update(first + second)
+    assert merged.counts == whole.counts
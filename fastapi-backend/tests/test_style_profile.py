@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from app import database
+from app.models.data_formats import Message, MessageKind
+from app.services import style_profile
+from app.services.artifact_store import delete_artifacts, load_json_artifact
+from app.services.chatgpt_utils import simulation_messages
+from app.services.style_profile import (
+    STYLE_PROFILE_KIND,
+    build_style_profiles,
+    build_style_profiles_in_background,
+    choose_examples,
+    get_or_build_style_profiles,
+)
+
+
+def build_conversation():
+    start = datetime(2024, 5, 1, 8, 0)
+    contents = [
+        ("Ana", "bom dia gente 😀", MessageKind.TEXT),
+        ("Bia", "bom dia! tudo certo por aí?", MessageKind.TEXT),
+        ("Ana", "<Mídia oculta>", MessageKind.MEDIA),
+        ("Ana", "tudo ótimo, vamos no cinema hoje? 🎬😀", MessageKind.TEXT),
+        ("Bia", "bom dia", MessageKind.TEXT),
+        ("Ana", "bom dia gente 😀", MessageKind.TEXT),
+        ("Bia", "bora, que horas?", MessageKind.TEXT),
+        ("Ana", "bom dia gente", MessageKind.TEXT),
+    ]
+    return [
+        Message(date=start + timedelta(minutes=i), author=author, content=content, kind=kind)
+        for i, (author, content, kind) in enumerate(contents)
+    ]
+
+
+def test_examples_are_typical_varied_and_recent(monkeypatch):
+    texts = ["primeira mensagem bem antiga do grupo"]
+    texts += [f"vamos jogar futebol amanhã cedo {i}" for i in range(6)]
+    texts += ["ok", "mensagem muito longa " * 20, "quem leva a comida da festa"]
+    texts += ["alguém viu o filme novo ontem", "vamos jogar futebol amanhã cedo 0"]
+    monkeypatch.setattr(style_profile, "RECENT_CANDIDATES", len(texts) - 1)
+
+    examples = choose_examples(texts, n=3)
+
+    assert len(examples) == 3
+    # Outside the latest messages, or of an unusual length
+    assert not {texts[0], "ok", texts[8]} & set(examples)
+    # One of the near duplicates at most, the others differ from it
+    assert sum(example.startswith("vamos jogar") for example in examples) == 1
+    assert "quem leva a comida da festa" in examples
+    assert examples == sorted(examples, key=texts.index)
+    assert choose_examples(["a", "b", "a"]) == ["a", "b"]
+
+
+def test_profiles_summarise_text_messages():
+    profiles = build_style_profiles(build_conversation())
+
+    ana = profiles["Ana"]
+    assert ana.messages == 4
+    assert ana.emoji_rate == 1.0
+    assert ana.top_emojis == ["😀", "🎬"]
+    assert "bom dia gente" in ana.common_phrases
+    assert profiles["Bia"].messages == 3 and profiles["Bia"].top_emojis == []
+
+    messages = simulation_messages([], "Ana", "E aí?", "pt", style=ana)
+    system = messages[0]["content"]
+    assert all(example in system for example in ana.examples)
+    assert "1.0 emojis por mensagem" in system and "bom dia gente" in system
+    assert simulation_messages([], "Ana", "E aí?", "pt") is None
+
+
+def test_profiles_are_persisted_and_cached(monkeypatch):
+    conversation = build_conversation()
+    db = database.SessionLocal()
+    try:
+        delete_artifacts(db, "style-test")
+        style_profile._profiles_cache.clear()
+        built = get_or_build_style_profiles(db, "style-test", conversation)
+        assert load_json_artifact(db, "style-test", STYLE_PROFILE_KIND)["Ana"]["messages"] == 4
+
+        # Loaded again from the artifact, then from the process cache
+        style_profile._profiles_cache.clear()
+        assert get_or_build_style_profiles(db, "style-test") == built
+        assert get_or_build_style_profiles(db, "missing-style-test") is None
+        monkeypatch.setattr(style_profile, "load_json_artifact", None)
+        assert get_or_build_style_profiles(db, "style-test") == built
+    finally:
+        delete_artifacts(db, "style-test")
+        db.close()
+
+
+def test_background_build_skips_built_profiles(monkeypatch):
+    conversation = build_conversation()
+    db = database.SessionLocal()
+    try:
+        delete_artifacts(db, "style-test")
+        style_profile._profiles_cache.clear()
+        build_style_profiles_in_background("style-test", conversation)
+        assert load_json_artifact(db, "style-test", STYLE_PROFILE_KIND) is not None
+
+        # Neither a cached nor a persisted profile is loaded or built again
+        get_or_build = MagicMock()
+        monkeypatch.setattr(style_profile, "get_or_build_style_profiles", get_or_build)
+        build_style_profiles_in_background("style-test", conversation)
+        style_profile._profiles_cache.clear()
+        build_style_profiles_in_background("style-test", conversation)
+        get_or_build.assert_not_called()
+    finally:
+        delete_artifacts(db, "style-test")
+        db.close()
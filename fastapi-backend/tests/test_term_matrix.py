@@ -0,0 +1,65 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from app.models.data_formats import Message
+from app.services.term_matrix import TermMatrix
+from app.services.text_analyzer import get_most_common_words, process_text
+
+
+def build_conversation():
+    start = datetime(2024, 1, 20, 9, 0)
+    contents = {
+        "Alice": ["futebol hoje", "futebol amanhã cedo", "praia depois"],
+        "Bob": ["trabalho chato", "trabalho hoje", "futebol talvez"],
+    }
+    conversation = []
+    for i in range(60):
+        author = "Alice" if i % 2 == 0 else "Bob"
+        conversation.append(
+            Message(
+                date=start + timedelta(days=i),
+                author=author,
+                content=contents[author][i % 3],
+            )
+        )
+    return conversation
+
+
+def test_author_and_month_views_match_exact_counts():
+    conversation = build_conversation()
+    term_matrix = TermMatrix.build(conversation)
+
+    names, by_author = term_matrix.view("author")
+    for row, author in enumerate(names):
+        expected = Counter(
+            word
+            for msg in conversation
+            if msg.author == author
+            for word in process_text(msg.content)
+        )
+        assert term_matrix.top_terms(by_author, row, top_n=100) == dict(
+            sorted(expected.items(), key=lambda x: (-x[1], x[0]))
+        )
+        assert by_author.indptr[row + 1] - by_author.indptr[row] == len(expected)
+
+    months, by_month = term_matrix.view("month")
+    assert months == ["2024-01", "2024-02", "2024-03"]
+    assert int(by_month.row_sums().sum()) == int(term_matrix.messages.data.sum())
+
+    # Summing every slice gives back the global top words
+    authors = {}
+    for msg in conversation:
+        authors.setdefault(msg.author, []).append(msg)
+    totals = by_author.column_sums()
+    global_top = {term_matrix.vocabulary[i]: int(totals[i]) for i in range(len(totals))}
+    assert get_most_common_words(authors, top_n=3).items() <= global_top.items()
+
+
+def test_distinctive_words_and_serialization():
+    term_matrix = TermMatrix.from_bytes(TermMatrix.build(build_conversation()).to_bytes())
+    words = term_matrix.slice_words("author")
+
+    # Words used by a single author are more distinctive than shared ones
+    assert list(words["Alice"].distinctive_words)[0] in {"praia", "amanhã", "cedo"}
+    assert "trabalho" in words["Bob"].distinctive_words
+    assert "futebol" not in words["Alice"].distinctive_words
+    assert words["Bob"].word_count == sum(words["Bob"].top_words.values())
@@ -1,5 +1,6 @@
+import asyncio
 import pytest
-from unittest.mock import patch, MagicMock, PropertyMock
+from unittest.mock import patch, AsyncMock, MagicMock, PropertyMock
 from datetime import datetime
 from app.services.text_analyzer import Message
 from app.services.chatgpt_utils import extract_themes, create_prompt, count_tokens
@@ -85,16 +86,16 @@ def mock_openai_response_en():
 
 
 def test_extract_themes_portuguese(sample_conversation, mock_openai_response_pt):
-    with patch("openai.OpenAI") as mock_openai, patch(
+    with patch("app.services.chatgpt_utils.get_openai_client") as mock_get_client, patch(
         "app.services.chatgpt_utils.detect_language", return_value="pt"
     ):
         # Setup mock
         mock_client = MagicMock()
-        mock_client.chat.completions.create.return_value = mock_openai_response_pt
-        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_openai_response_pt)
+        mock_get_client.return_value = mock_client
 
         # Run function
-        result = extract_themes(sample_conversation)
+        result = asyncio.run(extract_themes(sample_conversation))
         print("Test Result:", result)
 
         # Verify results
@@ -108,16 +109,16 @@ def test_extract_themes_portuguese(sample_conversation, mock_openai_response_pt)
 
 
 def test_extract_themes_english(sample_conversation, mock_openai_response_en):
-    with patch("openai.OpenAI") as mock_openai, patch(
+    with patch("app.services.chatgpt_utils.get_openai_client") as mock_get_client, patch(
         "app.services.chatgpt_utils.detect_language", return_value="en"
     ):
         # Setup mock
         mock_client = MagicMock()
-        mock_client.chat.completions.create.return_value = mock_openai_response_en
-        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_openai_response_en)
+        mock_get_client.return_value = mock_client
 
         # Run function
-        result = extract_themes(sample_conversation)
+        result = asyncio.run(extract_themes(sample_conversation))
         print("Test Result:", result)
 
         # Verify results
@@ -129,14 +130,14 @@ def test_extract_themes_english(sample_conversation, mock_openai_response_en):
 
 
 def test_extract_themes_error_handling(sample_conversation):
-    with patch("openai.OpenAI") as mock_openai:
+    with patch("app.services.chatgpt_utils.get_openai_client") as mock_get_client:
         # Setup mock to raise an exception
         mock_client = MagicMock()
-        mock_client.chat.completions.create.side_effect = Exception("API Error")
-        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(side_effect=Exception("API Error"))
+        mock_get_client.return_value = mock_client
 
         # Run function
-        result = extract_themes(sample_conversation)
+        result = asyncio.run(extract_themes(sample_conversation))
 
         # Verify error handling
         assert isinstance(result, dict)
@@ -144,16 +145,16 @@ def test_extract_themes_error_handling(sample_conversation):
 
 
 def test_extract_themes_empty_response(sample_conversation):
-    with patch("openai.OpenAI") as mock_openai:
+    with patch("app.services.chatgpt_utils.get_openai_client") as mock_get_client:
         # Setup mock with empty response
         mock_response = MagicMock()
         mock_response.choices[0].message.content = ""
         mock_client = MagicMock()
-        mock_client.chat.completions.create.return_value = mock_response
-        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+        mock_get_client.return_value = mock_client
 
         # Run function
-        result = extract_themes(sample_conversation)
+        result = asyncio.run(extract_themes(sample_conversation))
 
         # Verify handling of empty response
         assert isinstance(result, dict)
@@ -161,7 +162,7 @@ def test_extract_themes_empty_response(sample_conversation):
 
 
 def test_extract_themes_malformed_response(sample_conversation):
-    with patch("openai.OpenAI") as mock_openai:
+    with patch("app.services.chatgpt_utils.get_openai_client") as mock_get_client:
         # Setup mock with malformed response (no examples)
         mock_response = MagicMock()
         mock_response.choices[
@@ -170,11 +171,11 @@ def test_extract_themes_malformed_response(sample_conversation):
 1. Theme without example
 2. Another theme without example"""
         mock_client = MagicMock()
-        mock_client.chat.completions.create.return_value = mock_response
-        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+        mock_get_client.return_value = mock_client
 
         # Run function
-        result = extract_themes(sample_conversation)
+        result = asyncio.run(extract_themes(sample_conversation))
 
         # Verify handling of malformed response
         assert isinstance(result, dict)
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+import asyncio
+import json
+import re
+import numpy as np
+from app.models.data_formats import Message
+from app.services import chatgpt_utils, openai_client
+from app.services.chatgpt_utils import count_tokens
+from app.services.theme_map_reduce import (
+    REDUCE_OUTPUT_TOKENS,
+    REDUCE_PROMPTS,
+    TokenBudget,
+    _listed_themes,
+    chunk_boundaries,
+    map_reduce_themes,
+)
+
+TOPICS = ["futebol", "cinema", "trabalho", "viagem", "comida", "música"]
+
+
+def build_conversation(n_sessions=12, per_session=30):
+    conversation = []
+    start = datetime(2024, 3, 1, 9, 0)
+    for session in range(n_sessions):
+        for i in range(per_session):
+            conversation.append(
+                Message(
+                    date=start + timedelta(days=session, minutes=2 * i),
+                    author=["Ana", "Bia"][i % 2],
+                    content=f"vamos falar de {TOPICS[session % len(TOPICS)]} hoje {i}",
+                )
+            )
+    starts = np.arange(0, n_sessions * per_session, per_session)
+    return conversation, starts
+
+
+def fake_reply(body):
+    """Map calls answer the topics of their excerpt, the reduce call lists what it got"""
+    system, user = body["messages"][0]["content"], body["messages"][1]["content"]
+    if "Merge" in system or "Junte" in system:
+        names = sorted({line[2:].split(":")[0] for line in user.splitlines()})
+        themes = [{"theme": name, "example": "merged"} for name in names]
+    else:
+        topics = sorted(set(re.findall(r"falar de (\w+)", user)))
+        themes = [
+            {"theme": topic.capitalize(), "examples": [user.splitlines()[0]]} for topic in topics
+        ]
+    return json.dumps({"themes": themes})
+
+
+def test_chunks_keep_sessions_and_respect_budget():
+    counts = np.full(100, 9)  # 10 tokens per message with its newline
+    sessions = np.array([0, 30, 45, 90])
+    chunks = chunk_boundaries(counts, sessions, max_tokens=500)
+    assert chunks == [(0, 45), (45, 90), (90, 100)]
+
+    # A session longer than the budget is cut where it runs out
+    chunks = chunk_boundaries(counts, np.array([0]), max_tokens=250)
+    assert chunks == [(0, 25), (25, 50), (50, 75), (75, 100)]
+
+    # A single message above the budget is a chunk alone
+    counts[10] = 1000
+    chunks = chunk_boundaries(counts, np.array([0]), max_tokens=250)
+    assert (10, 11) in chunks
+    assert chunks[0][0] == 0 and chunks[-1][1] == 100
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+
+
+def test_token_budget_waits_for_refill():
+    now = [0.0]
+
+    async def sleep(seconds):
+        now[0] += seconds
+
+    async def run():
+        budget = TokenBudget(600, clock=lambda: now[0], sleep=sleep)  # 10 tokens a second
+        await budget.acquire(600)
+        assert now[0] == 0
+        await budget.acquire(100)
+        assert now[0] == 10
+        # Above the whole budget, waits for a full bucket only
+        await budget.acquire(5000)
+        assert now[0] == 70
+
+    asyncio.run(run())
+
+
+def test_map_reduce_streams_partial_then_merged_themes(fake_encoding, fake_openai_server):
+    fake_openai_server["reply"] = fake_reply
+    fake_openai_server["latency"] = 0.1
+    conversation, starts = build_conversation()
+
+    async def run():
+        try:
+            return [
+                event
+                async for event in map_reduce_themes(
+                    conversation,
+                    starts,
+                    model="gpt-4o-mini",
+                    max_chunk_tokens=600,
+                    concurrency=3,
+                    budget=TokenBudget(1_000_000),
+                )
+            ]
+        finally:
+            await openai_client.close_openai_client()
+
+    events = asyncio.run(run())
+
+    assert events[0] == {"event": "chunks", "total": 6}
+    partial = [event for event in events if event["event"] == "partial"]
+    assert sorted(event["chunk"] for event in partial) == list(range(6))
+    assert partial[0]["themes"] and partial[0]["start"] < partial[0]["end"]
+    assert events[-1] == {
+        "event": "themes",
+        "themes": {topic.capitalize(): "merged" for topic in TOPICS},
+    }
+    # 6 map calls, 3 at a time, then one reduce call
+    assert len(fake_openai_server["requests"]) == 7
+    assert 1 < fake_openai_server["max_in_flight"] <= 3
+
+
+def test_reduce_input_fits_the_context(fake_encoding, monkeypatch):
+    prompt = REDUCE_PROMPTS["en"]
+    # Room for 8 lines of 4 tokens and their newline
+    limit = count_tokens(prompt, "tiny") + REDUCE_OUTPUT_TOKENS + 100 + 40
+    monkeypatch.setitem(chatgpt_utils.MODEL_CONTEXT_LIMITS, "tiny", limit)
+    partial = {i: {f"T{i}{rank}": "ex" for rank in range(3)} for i in range(6)}
+
+    listed = _listed_themes(partial, prompt, "tiny").splitlines()
+
+    # The first theme of every chunk, then the second ones while they fit
+    assert listed == [f"- T{i}0: ex" for i in range(6)] + ["- T01: ex", "- T11: ex"]
+
+
+def test_oversized_message_is_truncated(fake_encoding, fake_openai_server):
+    fake_openai_server["reply"] = fake_reply
+    fake_openai_server["latency"] = 0.01
+    conversation, starts = build_conversation(n_sessions=2)
+    conversation[40] = conversation[40].model_copy(
+        update={"content": "vamos falar de cinema " + "muito " * 2000}
+    )
+
+    async def run():
+        try:
+            return [
+                event
+                async for event in map_reduce_themes(
+                    conversation, starts, model="gpt-4o-mini", max_chunk_tokens=600
+                )
+            ]
+        finally:
+            await openai_client.close_openai_client()
+
+    events = asyncio.run(run())
+
+    assert events[-1]["event"] == "themes"
+    map_calls = fake_openai_server["requests"][:-1]
+    assert all(count_tokens(call["messages"][1]["content"]) <= 600 for call in map_calls)
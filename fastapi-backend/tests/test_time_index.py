@@ -0,0 +1,80 @@
+import pytest
+from datetime import datetime, timedelta
+from app.models.data_formats import Message
+from app.services.parsing_utils import message_to_dict
+from app.services.text_analyzer import calculate_conversation_stats, create_messages_heatmap
+from app.services.time_index import TimeIndex
+
+
+@pytest.fixture
+def conversation():
+    start = datetime(2024, 2, 20, 8, 0)
+    authors = ["Alice", "Bob", "Carol"]
+    messages = []
+    minutes = 0
+    for i in range(400):
+        # Bursts separated by gaps of more than a day, spread over a few weeks
+        minutes += 2000 if i % 23 == 0 else 4
+        messages.append(
+            Message(
+                date=start + timedelta(minutes=minutes),
+                author=authors[(i * 5) % 7 % 3],
+                content=f"mensagem {i}",
+            )
+        )
+    return messages
+
+
+def by_author(messages):
+    author_and_messages = {}
+    for msg in messages:
+        author_and_messages.setdefault(msg.author, []).append(msg)
+    return author_and_messages
+
+
+def test_whole_range_matches_conversation_stats(conversation):
+    index = TimeIndex.build([message_to_dict(msg) for msg in conversation])
+    stats = index.range_stats()
+
+    assert stats.total_messages == 400
+    assert stats.conversation_stats == calculate_conversation_stats(
+        conversation, by_author(conversation)
+    )
+    assert stats.heatmap_data == create_messages_heatmap([msg.date for msg in conversation])
+
+
+@pytest.mark.parametrize(
+    "start,end",
+    [
+        (datetime(2024, 3, 1), datetime(2024, 3, 8)),
+        (datetime(2024, 2, 25, 13, 17), datetime(2024, 3, 2, 2, 3)),
+        (None, datetime(2024, 2, 28)),
+        (datetime(2024, 3, 3), None),
+    ],
+)
+def test_range_stats_match_recomputing_on_the_range(conversation, start, end):
+    index = TimeIndex.from_bytes(
+        TimeIndex.build([message_to_dict(msg) for msg in conversation]).to_bytes()
+    )
+    selected = [
+        msg
+        for msg in conversation
+        if (start is None or msg.date >= start) and (end is None or msg.date < end)
+    ]
+    stats = index.range_stats(start, end)
+
+    assert stats.total_messages == len(selected)
+    assert stats.messages_per_author == {
+        author: len(messages) for author, messages in by_author(selected).items()
+    }
+    assert stats.conversation_stats == calculate_conversation_stats(selected, by_author(selected))
+    assert sum(stats.busiest_days.values()) <= len(selected)
+
+
+def test_empty_range(conversation):
+    index = TimeIndex.build([message_to_dict(msg) for msg in conversation])
+    stats = index.range_stats(datetime(2030, 1, 1), datetime(2030, 2, 1))
+
+    assert stats.total_messages == 0
+    assert stats.messages_per_author == {}
+    assert stats.conversation_stats is None
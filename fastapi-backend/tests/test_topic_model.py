@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+import numpy as np
+from app.models.data_formats import Message
+from app.services.term_matrix import CSRMatrix, TermMatrix
+from app.services.topic_model import extract_local_themes, factorize, tfidf_weights
+
+TOPICS = {
+    "futebol": ["futebol jogo gol", "jogo do time ontem", "gol do time no futebol"],
+    "viagem": ["viagem praia hotel", "hotel perto da praia", "passagem da viagem"],
+    "trabalho": ["reunião projeto prazo", "prazo do projeto", "reunião com o chefe amanhã"],
+}
+
+
+def build_conversation(sessions_per_topic=6):
+    start = datetime(2024, 3, 1, 9, 0)
+    conversation, document_ids = [], []
+    for session in range(sessions_per_topic * len(TOPICS)):
+        contents = list(TOPICS.values())[session % len(TOPICS)]
+        for i, content in enumerate(contents):
+            conversation.append(
+                Message(
+                    date=start + timedelta(days=session, minutes=i),
+                    author="Ana" if i % 2 == 0 else "Bia",
+                    content=content,
+                )
+            )
+            document_ids.append(session)
+    return conversation, np.array(document_ids)
+
+
+def test_sparse_factorization_matches_dense_reconstruction():
+    rng = np.random.default_rng(1)
+    dense = rng.integers(0, 3, size=(30, 12)) * (rng.random((30, 12)) < 0.4)
+    rows, cols = np.nonzero(dense)
+    matrix = CSRMatrix.from_coo(rows, cols, dense[rows, cols], dense.shape)
+
+    w, h = factorize(matrix, matrix.data.astype(float), n_topics=4)
+    error = np.linalg.norm(dense - w @ h) / np.linalg.norm(dense)
+    initial_w, initial_h = factorize(matrix, matrix.data.astype(float), n_topics=4, iterations=0)
+    assert error < np.linalg.norm(dense - initial_w @ initial_h) / np.linalg.norm(dense)
+    assert (w >= 0).all() and (h >= 0).all()
+
+
+def test_tfidf_rows_are_normalized():
+    conversation, document_ids = build_conversation()
+    term_matrix = TermMatrix.build(conversation)
+    documents = term_matrix.messages.group_rows(document_ids, document_ids.max() + 1)
+    weights = tfidf_weights(documents)
+
+    norms = np.bincount(documents.row_ids(), weights=weights**2, minlength=documents.shape[0])
+    assert np.allclose(norms[norms > 0], 1.0)
+
+
+def test_local_themes_separate_session_topics():
+    conversation, document_ids = build_conversation()
+    term_matrix = TermMatrix.build(conversation)
+
+    themes = extract_local_themes(term_matrix, document_ids, document_ids.max() + 1, conversation)
+
+    found = set()
+    for name, examples in themes.items():
+        top_term = name.split(" / ")[0]
+        topic = next(t for t, contents in TOPICS.items() if top_term in " ".join(contents))
+        found.add(topic)
+        assert all(example.split(": ", 1)[1] in TOPICS[topic] for example in examples.split(" | "))
+    assert found == set(TOPICS)
+
+
+def test_local_themes_are_deterministic():
+    conversation, document_ids = build_conversation()
+    term_matrix = TermMatrix.build(conversation)
+    n_documents = document_ids.max() + 1
+    assert extract_local_themes(
+        term_matrix, document_ids, n_documents, conversation
+    ) == extract_local_themes(term_matrix, document_ids, n_documents, conversation)